@@ -1,6 +1,7 @@
 import datetime
 import json
-import requests
+
+import http_client
 from bs4 import BeautifulSoup
 
 # prompt_template = ChatPromptTemplate.from_messages(
@@ -58,7 +59,7 @@ def get_rweb_data(query: dict, endpoint: str) -> list:
 
     # print(f"Getting {url} \n\n {query} ...")
 
-    response = requests.post(url, json=query)
+    response = http_client.post(url, json=query)
     if response.status_code == 200:
         answer = response.json()
     else:
@@ -69,7 +70,7 @@ def get_rweb_data(query: dict, endpoint: str) -> list:
     results = []
     for article in answer["data"]:
         article_url = article["fields"]["url"]
-        article_response = requests.get(article_url)
+        article_response = http_client.get(article_url)
         soup = BeautifulSoup(article_response.text, "html.parser")
         web_content = [p.text for p in soup.find_all("p")]
         article["fields"]["endpoint"] = endpoint
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+BOILERPLATE_PATH = os.environ.get("BOILERPLATE_PATH", "cache/boilerplate.json")
+
+# A paragraph is boilerplate once it has been seen on at least MIN_PAGES pages of
+# a domain and on at least MIN_SHARE of the pages learned from that domain.
+MIN_PAGES = 5
+MIN_SHARE = 0.2
+# Fingerprints kept per domain; beyond this, those seen on a single page are dropped.
+MAX_FINGERPRINTS = 20000
+# Page URLs remembered per domain, so a page fetched again isn't counted twice;
+# beyond this, the oldest are forgotten.
+MAX_URLS = 20000
+# The learned state is written to disk every this many pages.
+SAVE_EVERY = 20
+# Rough size of a token, for reporting what stripping saves.
+CHARS_PER_TOKEN = 4
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(paragraph: str) -> str:
+    """
+    Returns a fingerprint of a paragraph that ignores case and spacing.
+
+    Numbers are kept: templated sentences that differ only in their figures
+    ("Floods killed 12 people") are content, not boilerplate.
+    """
+    text = _SPACE_RE.sub(" ", paragraph).strip().lower()
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _domain(url: str) -> str:
+    return urlsplit(url or "").netloc.lower()
+
+
+class BoilerplateFilter:
+    """
+    Learns the paragraphs that repeat across the pages of each domain and strips them.
+
+    Cookie banners, navigation, "share this" links and footers appear on most
+    pages of a site, while article text does not. For each domain the filter
+    counts on how many distinct pages each paragraph fingerprint appeared;
+    frequent ones are removed from bodies. The counts, and the pages already
+    counted, are persisted to a JSON file.
+    """
+
+    def __init__(self, path: str = BOILERPLATE_PATH):
+        self.path = path
+        self.domains = {}
+        self.removed = {"paragraphs": 0, "tokens": 0}
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        # Held through a whole save, so concurrent saves can't write an older state last.
+        self.save_lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.domains = json.load(f)
+        for domain in self.domains.values():
+            # A dict as an ordered set: the oldest URLs are forgotten first.
+            domain["urls"] = dict.fromkeys(domain.get("urls", []))
+
+    def learn(self, url: str, paragraphs: list):
+        """
+        Counts the paragraphs of a freshly scraped page.
+
+        Each page counts once: fetching the same URL again (a disaster page looked
+        up on every question, a refresh pass) doesn't make its text look repeated.
+
+        Args:
+            url (str): The page URL; its domain selects the statistics.
+            paragraphs (list): The paragraphs of the page.
+        """
+        fingerprints = {fingerprint(p) for p in paragraphs if p.strip()}
+        page = fingerprint(urlsplit(url or "")._replace(fragment="").geturl())
+        with self.lock:
+            domain = self.domains.setdefault(
+                _domain(url), {"pages": 0, "counts": {}, "urls": {}}
+            )
+            urls = domain["urls"]
+            if page in urls:
+                return
+            urls[page] = None
+            if len(urls) > MAX_URLS:
+                for key in list(urls)[: len(urls) - MAX_URLS // 2]:
+                    del urls[key]
+            domain["pages"] += 1
+            counts = domain["counts"]
+            for key in fingerprints:
+                counts[key] = counts.get(key, 0) + 1
+            if len(counts) > MAX_FINGERPRINTS:
+                domain["counts"] = {key: n for key, n in counts.items() if n > 1}
+            self.unsaved += 1
+            save = self.unsaved >= SAVE_EVERY
+        if save:
+            self.save()
+
+    def is_boilerplate(self, url: str, paragraph: str) -> bool:
+        with self.lock:
+            domain = self.domains.get(_domain(url))
+            if domain is None:
+                return False
+            seen = domain["counts"].get(fingerprint(paragraph), 0)
+            return seen >= MIN_PAGES and seen >= MIN_SHARE * domain["pages"]
+
+    def strip(self, url: str, paragraphs: list) -> list:
+        """
+        Removes empty and boilerplate paragraphs from a body.
+
+        Args:
+            url (str): The page URL.
+            paragraphs (list): The paragraphs of the page.
+
+        Returns:
+            list: The remaining paragraphs, in order.
+        """
+        kept = []
+        removed_tokens = 0
+        removed_paragraphs = 0
+        for paragraph in paragraphs:
+            if not paragraph.strip():
+                continue
+            if self.is_boilerplate(url, paragraph):
+                removed_paragraphs += 1
+                removed_tokens += count_tokens(paragraph)
+            else:
+                kept.append(paragraph)
+        if removed_paragraphs:
+            with self.lock:
+                self.removed["paragraphs"] += removed_paragraphs
+                self.removed["tokens"] += removed_tokens
+            print(f"BOILERPLATE removed {removed_paragraphs} paragraphs (~{removed_tokens} tokens) from {url}")
+        return kept
+
+    def clean(self, url: str, paragraphs: list) -> list:
+        """
+        Learns from a freshly scraped page, then strips it.
+        """
+        self.learn(url, paragraphs)
+        return self.strip(url, paragraphs)
+
+    def save(self):
+        """
+        Writes the learned counts to disk.
+        """
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(
+                    {
+                        name: {**domain, "urls": list(domain["urls"])}
+                        for name, domain in self.domains.items()
+                    }
+                )
+                self.unsaved = 0
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # A temporary file of its own: other processes may share the file.
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+            ) as f:
+                f.write(data)
+            os.replace(f.name, self.path)
+
+    def stats(self) -> dict:
+        """
+        Returns the paragraphs and estimated tokens removed so far, and the pages learned per domain.
+        """
+        with self.lock:
+            return {
+                "removed_paragraphs": self.removed["paragraphs"],
+                "removed_tokens": self.removed["tokens"],
+                "pages": {name: domain["pages"] for name, domain in self.domains.items()},
+            }
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_boilerplate_filter() -> BoilerplateFilter:
+    """
+    Returns the process-wide boilerplate filter, loading it on first use.
+    """
+    global _filter
+    with _filter_lock:
+        if _filter is None:
+            _filter = BoilerplateFilter()
+        return _filter
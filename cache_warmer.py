@@ -0,0 +1,159 @@
+import json
+import re
+import threading
+import time
+
+import fetch_scheduler
+import response_cache
+from disaster_snapshot import get_rweb_disasters_data
+from reliefweb import get_query_data, get_rweb_reports_and_news_data
+
+# Refresh before cached results expire, so active crises never go cold.
+WARM_INTERVAL_SECONDS = max(response_cache.RESPONSE_CACHE_TTL_SECONDS * 0.8, 60)
+ACTIVE_STATUSES = ["alert", "ongoing"]
+MAX_DISASTERS = 20
+
+# The " - Jul 2024" suffix of ReliefWeb disaster names ("Sudan: Floods - Jul 2024").
+_NAME_DATE_RE = re.compile(r"\s+-\s+[A-Z][a-z]{2,8}\.?\s+\d{4}\s*$")
+
+
+def disaster_query(name: str) -> str:
+    """
+    Returns the keyword query a user would send about a disaster, from its ReliefWeb name.
+
+    The month and year the disaster began are dropped: questions rarely name the
+    month, and ANDed into the search it would miss most reports.
+    "Sudan: Floods - Jul 2024" becomes "Sudan: Floods".
+    """
+    return _NAME_DATE_RE.sub("", name or "")
+
+
+def get_active_disasters(max_disasters: int = MAX_DISASTERS) -> list:
+    """
+    Lists the disasters currently on alert or ongoing, most recent first.
+
+    Args:
+        max_disasters (int, optional): Maximum number of disasters to return. Defaults to MAX_DISASTERS.
+
+    Returns:
+        list: The disaster records.
+    """
+    disasters = []
+    for status in ACTIVE_STATUSES:
+        result = get_rweb_disasters_data(
+            status=status, sort="date.event:desc", limit=max_disasters
+        )
+        try:
+            disasters.extend(json.loads(result))
+        except json.JSONDecodeError:
+            # Without a snapshot the remote API answers, with a message string on failure.
+            print(f"WARMER could not list {status} disasters: {result}")
+    disasters.sort(key=lambda d: d.get("date", {}).get("event", ""), reverse=True)
+    return disasters[:max_disasters]
+
+
+def warm_disaster(disaster: dict):
+    """
+    Fetches and scrapes the reports of a disaster into the caches.
+
+    Two queries are warmed: the latest situation reports of the disaster by id,
+    and the query get_data and the server send when asked about the disaster by
+    name (see disaster_query and reliefweb.get_query_data), with the same
+    arguments, so its response cache entry is the one they look up. Bodies land in
+    the corpus store and dedup index on the way.
+
+    Args:
+        disaster (dict): The disaster record, with "id" and "name".
+    """
+    get_rweb_reports_and_news_data(
+        disaster_id=disaster["id"],
+        format_name="Situation Report",
+        sort="date.created:desc",
+        dedupe=True,
+        use_corpus=True,
+    )
+    get_query_data(disaster_query(disaster["name"]))
+
+
+class CacheWarmer:
+    """
+    Background scheduler that keeps the reports of active crises warm.
+
+    Every interval it lists the alert/ongoing disasters and re-fetches their
+    latest situation reports, bypassing the response cache so the entries are
+    renewed before they expire. Bodies land in the corpus store and dedup index
+    on the way, so user questions about these crises are answered from cache.
+    """
+
+    def __init__(
+        self, interval: float = WARM_INTERVAL_SECONDS, max_disasters: int = MAX_DISASTERS
+    ):
+        self.interval = interval
+        self.max_disasters = max_disasters
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def warm_once(self) -> dict:
+        """
+        Runs one warming pass.
+
+        Returns:
+            dict: The number of disasters warmed, failures, and the pass duration in seconds.
+        """
+        start = time.monotonic()
+        warmed, failed = 0, 0
+        with response_cache.refreshing():
+            with fetch_scheduler.bulk():
+                disasters = get_active_disasters(self.max_disasters)
+            for disaster in disasters:
+                if self._stop.is_set():
+                    break
+                try:
+                    # Background traffic: yields to user questions, and gives up on
+                    # a disaster that cannot be warmed within the bulk deadline.
+                    with fetch_scheduler.bulk():
+                        warm_disaster(disaster)
+                    warmed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"WARMER failed for disaster {disaster.get('id')}: {e}")
+        self.last_run = {
+            "warmed": warmed,
+            "failed": failed,
+            "seconds": round(time.monotonic() - start, 2),
+        }
+        print(f"WARMER {self.last_run}")
+        return self.last_run
+
+    def start(self):
+        """
+        Starts warming in a background thread, immediately and then every interval.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.warm_once()
+                except Exception as e:
+                    print(f"WARMER pass failed: {e}")
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=run, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread after the disaster being warmed.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    CacheWarmer().warm_once()
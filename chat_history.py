@@ -0,0 +1,171 @@
+import collections
+import threading
+
+# Turns kept verbatim in the prompt; older turns are folded into the summary.
+MAX_TURNS = 4
+# Upper bound on the rolling summary, so the prompt stays a constant size.
+MAX_SUMMARY_CHARS = 2000
+MAX_SESSIONS = 10000
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant "
+    "about humanitarian disasters. Update the summary with the new turns. Keep the "
+    "disasters, locations, dates, figures and reports that were discussed, and the "
+    "user's open questions. Reply with the updated summary only, in at most {max_chars} "
+    "characters."
+)
+
+
+def make_turn(question: str, answer: str) -> dict:
+    """
+    Builds a chat history item in the shape the AssistantTemplates loop over.
+
+    Args:
+        question (str): The user's question.
+        answer (str): The assistant's answer.
+
+    Returns:
+        dict: The item, with "inputs.question" and "outputs.answer".
+    """
+    return {"inputs": {"question": question}, "outputs": {"answer": answer}}
+
+
+def format_turns(turns: list) -> str:
+    """
+    Formats chat history items as a Human/AI transcript.
+    """
+    return "\n".join(
+        f"Human: {turn['inputs']['question']}\nAI: {turn['outputs']['answer']}"
+        for turn in turns
+    )
+
+
+def truncate_summarizer(summary: str, turns: list, max_chars: int = MAX_SUMMARY_CHARS) -> str:
+    """
+    Folds turns into the summary without an LLM, keeping the most recent text.
+
+    Args:
+        summary (str): The current summary.
+        turns (list): The chat history items to fold in.
+        max_chars (int, optional): Maximum summary length. Defaults to MAX_SUMMARY_CHARS.
+
+    Returns:
+        str: The updated summary.
+    """
+    text = "\n".join(part for part in (summary, format_turns(turns)) if part)
+    return text[-max_chars:]
+
+
+def llm_summarizer(llm, max_chars: int = MAX_SUMMARY_CHARS):
+    """
+    Returns a summarizer that folds turns into the summary with a chat model.
+
+    Args:
+        llm: A LangChain chat model, e.g. ChatMistralAI.
+        max_chars (int, optional): Maximum summary length. Defaults to MAX_SUMMARY_CHARS.
+
+    Returns:
+        callable: A summarizer taking (summary, turns) and returning the updated summary.
+    """
+
+    def summarize(summary: str, turns: list) -> str:
+        messages = [
+            ("system", SUMMARY_SYSTEM_PROMPT.format(max_chars=max_chars)),
+            (
+                "user",
+                f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{format_turns(turns)}",
+            ),
+        ]
+        return llm.invoke(messages).content[:max_chars]
+
+    return summarize
+
+
+class ChatHistoryManager:
+    """
+    Keeps multi-turn prompts at a bounded size.
+
+    For each session the last max_turns turns are kept verbatim. Turns that fall
+    out of that window are folded, once each, into a rolling summary cached with
+    the session, so every turn costs at most one incremental summary update
+    instead of re-sending the whole conversation.
+    """
+
+    def __init__(
+        self,
+        summarizer=truncate_summarizer,
+        max_turns: int = MAX_TURNS,
+        max_sessions: int = MAX_SESSIONS,
+    ):
+        self.summarizer = summarizer
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _session(self, session_id: str) -> dict:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = {"turns": [], "summary": "", "lock": threading.Lock()}
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def add_turn(self, session_id: str, question: str, answer: str):
+        """
+        Records a turn, folding turns beyond the verbatim window into the summary.
+
+        Args:
+            session_id (str): The conversation id.
+            question (str): The user's question.
+            answer (str): The assistant's answer.
+        """
+        with self.lock:
+            session = self._session(session_id)
+        with session["lock"]:
+            session["turns"].append(make_turn(question, answer))
+            overflow = len(session["turns"]) - self.max_turns
+            if overflow > 0:
+                folded = session["turns"][:overflow]
+                session["turns"] = session["turns"][overflow:]
+                session["summary"] = self.summarizer(session["summary"], folded)
+
+    def get_context(self, session_id: str) -> dict:
+        """
+        Returns the template variables for a session's history.
+
+        Args:
+            session_id (str): The conversation id.
+
+        Returns:
+            dict: "chat_history" with the recent turns and "history_summary" with the summary of older ones.
+        """
+        with self.lock:
+            session = self._session(session_id)
+        with session["lock"]:
+            return {
+                "chat_history": list(session["turns"]),
+                "history_summary": session["summary"],
+            }
+
+    def load(self, session_id: str, chat_history: list):
+        """
+        Replaces a session's history with a full chat history, compacting it.
+
+        Args:
+            session_id (str): The conversation id.
+            chat_history (list): Items with "inputs.question" and "outputs.answer".
+        """
+        with self.lock:
+            self.sessions.pop(session_id, None)
+        for item in chat_history:
+            self.add_turn(session_id, item["inputs"]["question"], item["outputs"]["answer"])
+
+    def clear(self, session_id: str):
+        """
+        Forgets a session.
+        """
+        with self.lock:
+            self.sessions.pop(session_id, None)
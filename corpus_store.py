@@ -0,0 +1,265 @@
+import collections
+import fcntl
+import json
+import mmap
+import os
+import re
+import threading
+import zlib
+
+CORPUS_PATH = os.environ.get("CORPUS_PATH", "cache/corpus")
+
+# zlib can only reference the last 32KB of a preset dictionary.
+DICTIONARY_SIZE = 32 * 1024
+COMPRESSION_LEVEL = 9
+# Until a dictionary has been trained, bodies are stored with plain zlib. Once this
+# many bodies are stored, a dictionary is trained from them automatically.
+AUTO_TRAIN_SAMPLES = 50
+
+_PHRASE_RE = re.compile(r"[^.!?\n]{12,200}[.!?]?")
+
+
+def train_dictionary(samples: list, size: int = DICTIONARY_SIZE) -> bytes:
+    """
+    Builds a shared compression dictionary from sample report bodies.
+
+    The dictionary is made of the phrases that recur most across samples (agency
+    names, boilerplate sentences, recurring situation report wording). zlib finds
+    matches more cheaply near the end of the dictionary, so the most common
+    phrases are placed last.
+
+    Args:
+        samples (list): Sample bodies, as strings.
+        size (int, optional): Maximum dictionary size in bytes. Defaults to DICTIONARY_SIZE.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    counts = collections.Counter()
+    for sample in samples:
+        counts.update(set(p.strip() for p in _PHRASE_RE.findall(sample)))
+
+    phrases = []
+    total = 0
+    for phrase, count in counts.most_common():
+        if count < 2:
+            break
+        encoded = phrase.encode("utf-8")
+        if total + len(encoded) + 1 > size:
+            continue
+        phrases.append(encoded)
+        total += len(encoded) + 1
+    return b" ".join(reversed(phrases))
+
+
+class CorpusStore:
+    """
+    Append-only store of compressed report bodies.
+
+    Bodies are zlib-compressed against a shared dictionary and appended to a single
+    segment file. An append-only offset index maps each key to its slice of the
+    segment, so any body can be decompressed on its own. Readers memory-map the
+    segment read-only, which lets several worker processes share it through the
+    page cache; a single process (or several, serialized by a file lock) writes.
+
+    Files, for a store at <path>:
+        <path>.seg     concatenated compressed bodies
+        <path>.idx     one "key<TAB>offset<TAB>length<TAB>dictionary" line per body
+        <path>.dict.N  dictionary version N (version 0 means no dictionary)
+    """
+
+    def __init__(self, path: str = CORPUS_PATH, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self.segment_path = f"{path}.seg"
+        self.index_path = f"{path}.idx"
+        self.index = {}
+        self.index_position = 0
+        self.dictionaries = {0: b""}
+        self.dictionary_version = 0
+        self.lock = threading.RLock()
+        self._map = None
+        self._map_size = 0
+        self._segment_file = None
+
+        if not readonly:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            for file_path in (self.segment_path, self.index_path):
+                open(file_path, "ab").close()
+        self._load_dictionaries()
+        self.refresh()
+
+    def _dictionary_path(self, version: int) -> str:
+        return f"{self.path}.dict.{version}"
+
+    def _load_dictionaries(self):
+        version = 1
+        while os.path.exists(self._dictionary_path(version)):
+            with open(self._dictionary_path(version), "rb") as f:
+                self.dictionaries[version] = f.read()
+            version += 1
+        self.dictionary_version = version - 1
+
+    def train(self, samples: list) -> int:
+        """
+        Trains a new dictionary from samples and uses it for every body stored afterwards.
+
+        Bodies already stored keep the dictionary they were compressed with.
+
+        Args:
+            samples (list): Sample bodies, as strings.
+
+        Returns:
+            int: The new dictionary version.
+        """
+        if self.readonly:
+            raise PermissionError("Corpus store is opened read-only")
+        dictionary = train_dictionary(samples)
+        with self.lock, open(self.index_path, "ab") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._load_dictionaries()
+                version = self.dictionary_version + 1
+                tmp_path = f"{self._dictionary_path(version)}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(dictionary)
+                os.replace(tmp_path, self._dictionary_path(version))
+                self.dictionaries[version] = dictionary
+                self.dictionary_version = version
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        print(f"CORPUS trained dictionary v{version} ({len(dictionary)} bytes)")
+        return version
+
+    def refresh(self):
+        """
+        Picks up index entries appended by other processes since the last refresh.
+        """
+        with self.lock:
+            if not os.path.exists(self.index_path):
+                return
+            with open(self.index_path, "rb") as f:
+                f.seek(self.index_position)
+                data = f.read()
+            # Ignore a trailing line that a writer has not finished yet.
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode("utf-8").splitlines():
+                key, offset, length, version = line.split("\t")
+                self.index[key] = (int(offset), int(length), int(version))
+            self.index_position += end
+
+    def _segment(self):
+        size = os.path.getsize(self.segment_path)
+        if self._map is None or size > self._map_size:
+            if self._map is not None:
+                self._map.close()
+            if self._segment_file is None:
+                self._segment_file = open(self.segment_path, "rb")
+            self._map = mmap.mmap(self._segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = size
+        return self._map
+
+    def __contains__(self, key) -> bool:
+        key = str(key)
+        if key not in self.index:
+            self.refresh()
+        return key in self.index
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.index)
+
+    def get(self, key, default=None):
+        """
+        Decompresses a single stored body.
+
+        Args:
+            key (str): The key the body was stored under.
+            default (optional): The value to return when the key is not stored. Defaults to None.
+
+        Returns:
+            The stored body, or default.
+        """
+        key = str(key)
+        with self.lock:
+            if key not in self.index:
+                self.refresh()
+            entry = self.index.get(key)
+            if entry is None:
+                return default
+            offset, length, version = entry
+            if version not in self.dictionaries:
+                self._load_dictionaries()
+            data = self._segment()[offset : offset + length]
+        decompressor = zlib.decompressobj(zdict=self.dictionaries[version])
+        return json.loads(decompressor.decompress(data) + decompressor.flush())
+
+    def put(self, key, body):
+        """
+        Compresses a body and appends it to the store.
+
+        Storing a key again appends a new copy; the index then points at the latest one.
+
+        Args:
+            key (str): The key to store the body under, e.g. "reports/4036587".
+            body: The body, any JSON-serializable value (a string or a list of paragraphs).
+        """
+        if self.readonly:
+            raise PermissionError("Corpus store is opened read-only")
+        key = str(key)
+        with self.lock:
+            version = self.dictionary_version
+            compressor = zlib.compressobj(
+                COMPRESSION_LEVEL, zdict=self.dictionaries[version]
+            )
+            data = compressor.compress(json.dumps(body).encode("utf-8"))
+            data += compressor.flush()
+
+            with open(self.segment_path, "ab") as segment, open(
+                self.index_path, "ab"
+            ) as index:
+                fcntl.flock(index, fcntl.LOCK_EX)
+                try:
+                    segment.seek(0, os.SEEK_END)
+                    offset = segment.tell()
+                    segment.write(data)
+                    segment.flush()
+                    os.fsync(segment.fileno())
+                    index.write(f"{key}\t{offset}\t{len(data)}\t{version}\n".encode("utf-8"))
+                    index.flush()
+                finally:
+                    fcntl.flock(index, fcntl.LOCK_UN)
+            self.index[key] = (offset, len(data), version)
+
+            if self.dictionary_version == 0 and len(self.index) >= AUTO_TRAIN_SAMPLES:
+                samples = [self.get(k) for k in list(self.index)[:AUTO_TRAIN_SAMPLES]]
+                self.train([s if isinstance(s, str) else " ".join(s) for s in samples])
+
+    def close(self):
+        """
+        Releases the memory map and file handles.
+        """
+        with self.lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment_file = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_corpus() -> CorpusStore:
+    """
+    Returns the process-wide corpus store at CORPUS_PATH, opening it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CorpusStore(CORPUS_PATH)
+        return _store
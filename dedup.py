@@ -0,0 +1,300 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+DEDUP_INDEX_PATH = os.environ.get("DEDUP_INDEX_PATH", "cache/dedup_index.json")
+# The index is written to disk once this many reports were added since the last
+# save, and when the process exits.
+SAVE_EVERY = 50
+
+# Two bodies whose 64-bit SimHash signatures differ in at most this many bits are
+# treated as the same report (reposts, re-generated copies with small edits).
+MAX_HAMMING_DISTANCE = 3
+
+SHINGLE_SIZE = 3
+SIGNATURE_BITS = 64
+# The signature is split into MAX_HAMMING_DISTANCE + 1 bands: two signatures within
+# the distance threshold always share at least one identical band (pigeonhole),
+# so candidates can be found with exact band lookups instead of a full scan.
+BAND_COUNT = MAX_HAMMING_DISTANCE + 1
+BAND_BITS = SIGNATURE_BITS // BAND_COUNT
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def body_text(body) -> str:
+    """
+    Returns the scraped body of a record as a single string.
+
+    Args:
+        body (str | list | None): The body as stored on a record, either a string or a list of paragraphs.
+
+    Returns:
+        str: The body text.
+    """
+    if body is None:
+        return ""
+    if isinstance(body, list):
+        return " ".join(body)
+    return str(body)
+
+
+def simhash(text: str) -> int:
+    """
+    Computes a 64-bit SimHash signature over word shingles of a text.
+
+    Args:
+        text (str): The text to fingerprint.
+
+    Returns:
+        int: The signature as an unsigned 64-bit integer.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [
+            " ".join(words[i : i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        ]
+
+    weights = [0] * SIGNATURE_BITS
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        for bit in range(SIGNATURE_BITS):
+            if value >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """
+    Returns the number of differing bits between two signatures.
+    """
+    return bin(a ^ b).count("1")
+
+
+def _bands(signature: int) -> list:
+    mask = (1 << BAND_BITS) - 1
+    return [
+        f"{band}:{signature >> (band * BAND_BITS) & mask}" for band in range(BAND_COUNT)
+    ]
+
+
+class SignatureIndex:
+    """
+    Persistent index of report SimHash signatures.
+
+    Each indexed report belongs to a cluster of near-duplicates. The index keeps the
+    URLs of every member of a cluster so a collapsed record can still cite all of
+    the sources it stands for.
+    """
+
+    def __init__(self, path: str = DEDUP_INDEX_PATH):
+        self.path = path
+        self.signatures = {}
+        self.clusters = {}
+        self.bands = {}
+        # Cluster id -> {report id: url}, so a cluster's URLs are found without a scan.
+        self.members = {}
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        # Held through a whole save, so concurrent saves can't write an older state last.
+        self.save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Loads the index from disk, if it exists.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.signatures = {k: int(v) for k, v in data.get("signatures", {}).items()}
+        self.clusters = data.get("clusters", {})
+        self.bands = {}
+        for report_id, signature in self.signatures.items():
+            for band in _bands(signature):
+                self.bands.setdefault(band, set()).add(report_id)
+        self.members = {}
+        for report_id, entry in self.clusters.items():
+            self.members.setdefault(entry["cluster"], {})[report_id] = entry.get("url")
+
+    def save(self):
+        """
+        Writes the index to disk, if anything was added since the last save.
+        """
+        with self.save_lock:
+            with self.lock:
+                if not self.unsaved:
+                    return
+                data = json.dumps(
+                    {
+                        "signatures": {k: str(v) for k, v in self.signatures.items()},
+                        "clusters": self.clusters,
+                    }
+                )
+                self.unsaved = 0
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # A temporary file of its own: other processes may share the index.
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+            ) as f:
+                f.write(data)
+            os.replace(f.name, self.path)
+
+    def save_if_due(self):
+        """
+        Saves the index once SAVE_EVERY reports were added since the last save.
+        """
+        if self.unsaved >= SAVE_EVERY:
+            self.save()
+
+    def find(self, signature: int, exclude: str = None):
+        """
+        Finds an indexed report that is a near-duplicate of the given signature.
+
+        Args:
+            signature (int): The SimHash signature to look up.
+            exclude (str, optional): A report id to ignore. Defaults to None.
+
+        Returns:
+            str: The id of the closest indexed report, or None if there is none within MAX_HAMMING_DISTANCE.
+        """
+        with self.lock:
+            candidates = set()
+            for band in _bands(signature):
+                candidates |= self.bands.get(band, set())
+            best_id, best_distance = None, MAX_HAMMING_DISTANCE + 1
+            for candidate in candidates:
+                if candidate == exclude:
+                    continue
+                distance = hamming_distance(signature, self.signatures[candidate])
+                if distance < best_distance:
+                    best_id, best_distance = candidate, distance
+            return best_id
+
+    def add(self, report_id: str, signature: int, url: str = None) -> str:
+        """
+        Adds a report to the index, joining the cluster of its closest near-duplicate.
+
+        Args:
+            report_id (str): The ReliefWeb id of the report.
+            signature (int): The SimHash signature of the report body.
+            url (str, optional): The report URL to remember for citations. Defaults to None.
+
+        Returns:
+            str: The id of the cluster the report belongs to.
+        """
+        report_id = str(report_id)
+        match = self.find(signature, exclude=report_id)
+        with self.lock:
+            if match is not None:
+                cluster_id = self.clusters[match]["cluster"]
+            else:
+                cluster_id = self.clusters.get(report_id, {}).get("cluster", report_id)
+            self.signatures[report_id] = signature
+            for band in _bands(signature):
+                self.bands.setdefault(band, set()).add(report_id)
+            previous = self.clusters.get(report_id)
+            if previous is not None and previous["cluster"] != cluster_id:
+                self.members.get(previous["cluster"], {}).pop(report_id, None)
+            self.clusters[report_id] = {"cluster": cluster_id, "url": url}
+            self.members.setdefault(cluster_id, {})[report_id] = url
+            self.unsaved += 1
+            return cluster_id
+
+    def cluster_urls(self, cluster_id: str) -> list:
+        """
+        Returns the URLs of every indexed report in a cluster.
+        """
+        with self.lock:
+            return [url for url in self.members.get(cluster_id, {}).values() if url]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SignatureIndex:
+    """
+    Returns the process-wide signature index, loading it on first use.
+
+    Whatever was added since the last periodic save is written at exit.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SignatureIndex()
+            atexit.register(_index.save)
+        return _index
+
+
+def collapse_duplicates(results: list, index: SignatureIndex = None) -> list:
+    """
+    Collapses near-duplicate records to a single representative.
+
+    The first record of each group of near-duplicates is kept. Its "urls" field
+    lists the URL of every copy seen, in this batch or earlier, so the answer can
+    still cite all of them; "sources" is extended with the other copies' sources.
+
+    Args:
+        results (list): The records as built by get_rweb_data, each with an "id", "url" and "body".
+        index (SignatureIndex, optional): The signature index to use. Defaults to the shared persistent index.
+
+    Returns:
+        list: The deduplicated records, in their original order.
+    """
+    if index is None:
+        index = get_index()
+
+    representatives = {}
+    collapsed = []
+    for record in results:
+        text = body_text(record.get("body"))
+        if not text.strip():
+            collapsed.append(record)
+            continue
+        signature = simhash(text)
+        cluster_id = index.add(record.get("id"), signature, record.get("url"))
+
+        representative = representatives.get(cluster_id)
+        if representative is None:
+            representatives[cluster_id] = record
+            record["urls"] = [record.get("url")]
+            collapsed.append(record)
+            continue
+
+        if record.get("url") not in representative["urls"]:
+            representative["urls"].append(record.get("url"))
+        if isinstance(representative.get("source"), list) and isinstance(
+            record.get("source"), list
+        ):
+            names = {s.get("name") for s in representative["source"]}
+            for source in record["source"]:
+                if source.get("name") not in names:
+                    representative["source"].append(source)
+
+    for cluster_id, representative in representatives.items():
+        for url in index.cluster_urls(cluster_id):
+            if url not in representative["urls"]:
+                representative["urls"].append(url)
+
+    index.save_if_due()
+    if len(collapsed) < len(results):
+        print(f"DEDUP collapsed {len(results)} reports to {len(collapsed)}")
+    return collapsed
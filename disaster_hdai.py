@@ -9,7 +9,8 @@ Original file is located at
 """
 import datetime
 import json
-import requests
+
+import http_client
 from bs4 import BeautifulSoup
 
 from langchain import PromptTemplate, LLMChain
@@ -63,7 +64,7 @@ def get_rweb_data(query: dict, endpoint: str) -> list:
 
     print(f"Getting {url} \n\n {query} ...")
 
-    response = requests.post(url, json=query)
+    response = http_client.post(url, json=query)
     if response.status_code == 200:
         answer = response.json()
     else:
@@ -74,7 +75,7 @@ def get_rweb_data(query: dict, endpoint: str) -> list:
     results = []
     for article in answer["data"]:
         article_url = article["fields"]["url"]
-        article_response = requests.get(article_url)
+        article_response = http_client.get(article_url)
         soup = BeautifulSoup(article_response.text, "html.parser")
         web_content = [p.text for p in soup.find_all("p")]
         article["fields"]["endpoint"] = endpoint
@@ -361,6 +362,7 @@ def invoke_with_tools(prompt:str):
     model="mistral-large-latest",
     temperature=0.7,
     # other params...
+    **http_client.mistral_client_kwargs(),
     )
 
     llm_with_tools = llm.bind_tools(tools)
@@ -0,0 +1,422 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+import fetch_scheduler
+import reliefweb
+from reliefweb import convert_to_iso8601, query_rweb
+
+SNAPSHOT_PATH = os.environ.get("DISASTER_SNAPSHOT_PATH", "cache/disasters_snapshot.json")
+REFRESH_INTERVAL_SECONDS = 6 * 60 * 60
+# After a failed refresh the next attempt waits this long, doubling with each
+# further failure up to the refresh interval.
+RETRY_BASE_SECONDS = 60
+# The ReliefWeb API returns at most 1000 items per call.
+PAGE_SIZE = 1000
+
+SNAPSHOT_FIELDS = [
+    "name",
+    "date",
+    "url",
+    "id",
+    "status",
+    "glide",
+    "country",
+    "primary_country",
+    "type",
+    "description",
+]
+# Fields returned by get_rweb_disasters_data, so local answers have the same shape.
+RESULT_FIELDS = ["name", "date", "url", "id", "status", "glide", "country"]
+
+# Indexed fields, and how to read their (possibly several) values from a record.
+INDEXED_FIELDS = {
+    "country.name": lambda record: [c.get("name") for c in record.get("country", [])],
+    "type.name": lambda record: [t.get("name") for t in record.get("type", [])],
+    "status": lambda record: [record.get("status")],
+    "glide": lambda record: [record.get("glide")],
+}
+
+
+def fetch_all_disasters() -> list:
+    """
+    Pages through the whole ReliefWeb disasters catalogue, without scraping disaster pages.
+
+    Returns:
+        list: The fields of every disaster.
+
+    Raises:
+        RuntimeError: If a page cannot be fetched.
+    """
+    records = []
+    offset = 0
+    while True:
+        query = {
+            "appname": "myapp",
+            "limit": PAGE_SIZE,
+            "offset": offset,
+            "fields": {"include": SNAPSHOT_FIELDS},
+            "sort": ["id:asc"],
+        }
+        answer = query_rweb(query, "disasters")
+        if answer is None:
+            raise RuntimeError(f"Failed to fetch disasters at offset {offset}")
+        records.extend(item["fields"] for item in answer["data"])
+        offset += len(answer["data"])
+        if not answer["data"] or offset >= answer.get("totalCount", 0):
+            return records
+
+
+class DisasterSnapshot:
+    """
+    Local copy of the ReliefWeb disasters catalogue, with secondary indexes.
+
+    Lookups by country, type, status, GLIDE number, id and event date range are
+    answered from in-memory indexes; the remote API is only used by refresh().
+    Each refresh builds a new set of indexes and swaps it in at once, so readers
+    never see a half-built snapshot. A stale snapshot keeps being served while a
+    new one is fetched; failed refreshes are retried with exponential backoff.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self.fetched_at = 0
+        self.failures = 0
+        # time.monotonic() before which no refresh is attempted, after a failure.
+        self.retry_at = 0
+        self._state = self._build([])
+        self._refresh_lock = threading.Lock()
+        # Guards starting one-off refreshes and the first download.
+        self._background_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._background = None
+        self.load()
+
+    @staticmethod
+    def _build(records: list) -> dict:
+        by_id = {str(record["id"]): record for record in records}
+        indexes = {field: {} for field in INDEXED_FIELDS}
+        for record_id, record in by_id.items():
+            for field, values in INDEXED_FIELDS.items():
+                for value in values(record):
+                    if value:
+                        indexes[field].setdefault(value.lower(), set()).add(record_id)
+        by_date = sorted(
+            (record.get("date", {}).get("event", ""), record_id)
+            for record_id, record in by_id.items()
+        )
+        return {
+            "by_id": by_id,
+            "indexes": indexes,
+            "dates": [date for date, _ in by_date],
+            "date_ids": [record_id for _, record_id in by_date],
+        }
+
+    def load(self) -> bool:
+        """
+        Loads the snapshot saved by the last refresh, if any.
+
+        Returns:
+            bool: True if a snapshot was loaded.
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._state = self._build(data["records"])
+        self.fetched_at = data["fetched_at"]
+        return True
+
+    def refresh(self):
+        """
+        Downloads the catalogue, rebuilds the indexes and saves the snapshot.
+        """
+        with self._refresh_lock:
+            # Paging through the catalogue is background traffic.
+            with fetch_scheduler.bulk():
+                records = fetch_all_disasters()
+            self._state = self._build(records)
+            self.fetched_at = time.time()
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self.fetched_at, "records": records}, f)
+            os.replace(tmp_path, self.path)
+        print(f"SNAPSHOT refreshed {len(records)} disasters")
+
+    def try_refresh(self, interval: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """
+        Refreshes the snapshot unless a recent failure is still being backed off from.
+
+        Errors are reported and counted rather than raised; the current snapshot,
+        stale or not, stays in use.
+
+        Returns:
+            bool: True if the snapshot was refreshed.
+        """
+        if time.monotonic() < self.retry_at:
+            return False
+        try:
+            self.refresh()
+        except Exception as e:
+            self.failures += 1
+            delay = min(RETRY_BASE_SECONDS * 2 ** (self.failures - 1), interval)
+            self.retry_at = time.monotonic() + delay
+            print(f"SNAPSHOT refresh failed ({self.failures} in a row), retrying in {delay}s: {e}")
+            return False
+        self.failures = 0
+        self.retry_at = 0
+        return True
+
+    def refresh_in_background(self):
+        """
+        Starts a one-off refresh in a background thread, unless one is running already.
+        """
+        if self._thread is not None:
+            # The periodic refresh thread takes care of it.
+            return
+        with self._background_lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            self._background = threading.Thread(
+                target=self.try_refresh, name="disaster-snapshot-refresh", daemon=True
+            )
+            self._background.start()
+
+    def ensure_data(self):
+        """
+        Downloads the snapshot if there is none yet; concurrent callers wait for the same download.
+        """
+        with self._background_lock:
+            if not self.has_data():
+                self.try_refresh()
+
+    def has_data(self) -> bool:
+        """
+        Returns whether a snapshot was ever loaded or fetched.
+        """
+        return self.fetched_at > 0
+
+    def is_stale(self, max_age: float = REFRESH_INTERVAL_SECONDS) -> bool:
+        """
+        Returns whether the snapshot is older than max_age seconds (or missing).
+        """
+        return time.time() - self.fetched_at > max_age
+
+    def start(self, interval: float = REFRESH_INTERVAL_SECONDS):
+        """
+        Refreshes the snapshot in a background thread every interval seconds.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                if self.is_stale(interval):
+                    self.try_refresh(interval)
+                self._stop.wait(min(interval, 60))
+
+        self._thread = threading.Thread(target=run, name="disaster-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background refresh thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __len__(self) -> int:
+        return len(self._state["by_id"])
+
+    def get(self, id) -> dict:
+        """
+        Returns a disaster by id, or None.
+        """
+        return self._state["by_id"].get(str(id))
+
+    def records(self) -> list:
+        """
+        Returns every disaster in the snapshot.
+        """
+        return list(self._state["by_id"].values())
+
+    def search(
+        self,
+        keyword: str = "",
+        date_from: str = None,
+        date_to: str = None,
+        sort: str = None,
+        limit: int = 20,
+        offset: int = 0,
+        status: str = None,
+        country: str = None,
+        id: str = None,
+        disaster_type: str = None,
+        glide: str = None,
+    ) -> list:
+        """
+        Finds disasters matching the same filters as get_rweb_disasters_data, or a GLIDE number.
+
+        Filters are intersected smallest first. The keyword must match every one of
+        its words in the name, description, countries or types.
+
+        Returns:
+            list: The matching disaster records.
+        """
+        state = self._state
+        candidates = []
+        if id is not None:
+            candidates.append({str(id)} if str(id) in state["by_id"] else set())
+        for field, value in (
+            ("status", status),
+            ("country.name", country),
+            ("type.name", disaster_type),
+            ("glide", glide),
+        ):
+            if value is not None:
+                candidates.append(state["indexes"][field].get(value.lower(), set()))
+        date_range = None
+        if date_from is not None and date_to is not None:
+            date_range = (convert_to_iso8601(date_from), convert_to_iso8601(date_to))
+
+        if candidates:
+            candidates.sort(key=len)
+            ids = set(candidates[0])
+            for other in candidates[1:]:
+                ids &= other
+            records = [state["by_id"][record_id] for record_id in ids]
+            if date_range is not None:
+                records = [
+                    r
+                    for r in records
+                    if date_range[0] <= r.get("date", {}).get("event", "") <= date_range[1]
+                ]
+        elif date_range is not None:
+            start = bisect.bisect_left(state["dates"], date_range[0])
+            end = bisect.bisect_right(state["dates"], date_range[1])
+            records = [state["by_id"][record_id] for record_id in state["date_ids"][start:end]]
+        else:
+            records = list(state["by_id"].values())
+
+        words = (keyword or "").lower().split()
+        if words:
+            records = [r for r in records if all(w in _search_text(r) for w in words)]
+
+        field, _, direction = (sort or "date.event:desc").partition(":")
+        records.sort(key=lambda r: _sort_key(r, field), reverse=direction != "asc")
+        return records[offset : offset + limit]
+
+
+def _search_text(record: dict) -> str:
+    parts = [record.get("name", ""), record.get("description", "")]
+    parts += [c.get("name", "") for c in record.get("country", [])]
+    parts += [t.get("name", "") for t in record.get("type", [])]
+    return " ".join(parts).lower()
+
+
+def _sort_key(record: dict, field: str):
+    value = record
+    for part in field.split("."):
+        value = value.get(part, "") if isinstance(value, dict) else ""
+    return (isinstance(value, str), value)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot(block: bool = True) -> DisasterSnapshot:
+    """
+    Returns the process-wide snapshot, loading it on first use.
+
+    A stale snapshot is returned as is and refreshed in the background. Only when
+    there is no snapshot at all is it downloaded first; if that fails, the
+    snapshot is returned empty (see has_data) and retried after a backoff.
+
+    Args:
+        block (bool, optional): Wait for the first download when there is no snapshot yet. Defaults to True.
+    """
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = DisasterSnapshot()
+        snapshot = _snapshot
+    if not snapshot.has_data():
+        if block:
+            snapshot.ensure_data()
+    elif snapshot.is_stale():
+        snapshot.refresh_in_background()
+    return snapshot
+
+
+def get_rweb_disasters_data(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    sort: str = None,
+    limit: int = 20,
+    offset: int = 0,
+    status: str = None,
+    country: str = None,
+    id: str = None,
+    disaster_type: str = None,
+    detailed_query: bool = False,
+    glide: str = None,
+) -> list:
+    """
+    Local counterpart of reliefweb.get_rweb_disasters_data, answered from the snapshot.
+
+    Takes the same parameters, plus glide to look a disaster up by GLIDE number. Records have the same fields as the remote version,
+    except that disaster pages are not scraped into a "body". While no snapshot
+    could be fetched yet, the remote version answers instead.
+
+    Returns:
+        str: JSON string containing the matching disaster data.
+    """
+    snapshot = get_snapshot()
+    if not snapshot.has_data():
+        if glide is not None:
+            return json.dumps([], indent=4)
+        return reliefweb.get_rweb_disasters_data(
+            keyword=keyword,
+            date_from=date_from,
+            date_to=date_to,
+            sort=sort,
+            limit=limit,
+            offset=offset,
+            status=status,
+            country=country,
+            id=id,
+            disaster_type=disaster_type,
+            detailed_query=detailed_query,
+        )
+    records = snapshot.search(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+        status=status,
+        country=country,
+        id=id,
+        disaster_type=disaster_type,
+        glide=glide,
+    )
+    fields = RESULT_FIELDS + (["description"] if detailed_query is True else [])
+    results = []
+    for record in records:
+        result = {field: record[field] for field in fields if field in record}
+        result["endpoint"] = "disasters"
+        results.append(result)
+    return json.dumps(results, indent=4)
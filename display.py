@@ -1,5 +1,13 @@
+import datetime
+
+import altair as alt
+import pandas as pd
+import pydeck as pdk
 import streamlit as st
-import requests
+
+import geo_bins
+import http_client
+from disaster_snapshot import get_snapshot
 
 st.title("Mistral AI Quickstart App")
 
@@ -29,7 +37,7 @@ def generate_response(input_text):
     }
 
     # Sending request to Mistral AI
-    response = requests.post(mistral_api_url, json=payload, headers=headers)
+    response = http_client.post(mistral_api_url, json=payload, headers=headers)
 
     if response.status_code == 200:
         response_data = response.json()
@@ -44,3 +52,76 @@ with st.form("my_form"):
     
     if submitted:
         generate_response(text)
+
+
+CACHE_TTL_SECONDS = 3600
+# Binned results kept per zoom, time bucket and window.
+MAX_CACHED_VIEWS = 64
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner="Loading disasters and reports...")
+def load_points() -> pd.DataFrame:
+    return geo_bins.load_points(get_snapshot().records())
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=MAX_CACHED_VIEWS)
+def binned_cells(zoom: int, time_bucket: str, date_from, date_to) -> pd.DataFrame:
+    return geo_bins.bin_points(load_points(), zoom, time_bucket, date_from, date_to)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=MAX_CACHED_VIEWS)
+def binned_timeline(time_bucket: str, date_from, date_to) -> pd.DataFrame:
+    return geo_bins.timeline(load_points(), time_bucket, date_from, date_to)
+
+
+st.header("Disasters and reports")
+# Points are binned here and only the cell counts go to the browser, so the page
+# stays light however many records there are.
+today = datetime.date.today()
+zoom = st.slider("Map detail", min_value=0, max_value=8, value=2)
+time_bucket = st.selectbox("Time bucket", list(geo_bins.TIME_BUCKETS), index=1)
+window = st.date_input("Time window", value=(today.replace(year=today.year - 5), today))
+if len(window) != 2:
+    # The second date has not been picked yet.
+    st.stop()
+date_from, date_to = window[0], window[1] + datetime.timedelta(days=1)
+kinds = st.multiselect("Show", ["disaster", "report"], default=["disaster", "report"])
+
+cells = binned_cells(zoom, time_bucket, date_from, date_to)
+cells = cells[cells["kind"].isin(kinds)]
+periods = sorted(cells["period"].dt.date.unique())
+if len(periods) > 1:
+    period = st.select_slider("Period", options=["All"] + periods, value="All")
+    if period != "All":
+        cells = cells[cells["period"].dt.date == period]
+cells = cells.groupby(["lat", "lon"], as_index=False)["count"].sum()
+
+cell_meters = geo_bins.cell_degrees(zoom) * 111_000
+st.pydeck_chart(
+    pdk.Deck(
+        layers=[
+            pdk.Layer(
+                "ColumnLayer",
+                data=cells,
+                get_position=["lon", "lat"],
+                get_elevation="count",
+                elevation_scale=cell_meters / max(cells["count"].max(), 1) if len(cells) else 1,
+                radius=cell_meters / 2,
+                get_fill_color=[200, 30, 0, 160],
+                pickable=True,
+                extruded=True,
+            )
+        ],
+        initial_view_state=pdk.ViewState(latitude=10, longitude=20, zoom=zoom, pitch=40),
+        tooltip={"text": "{count} records"},
+    )
+)
+
+timeline = binned_timeline(time_bucket, date_from, date_to)
+timeline = timeline[timeline["kind"].isin(kinds)]
+st.altair_chart(
+    alt.Chart(timeline)
+    .mark_bar()
+    .encode(x="period:T", y="count:Q", color="kind:N", tooltip=["period:T", "kind:N", "count:Q"]),
+    use_container_width=True,
+)
@@ -0,0 +1,279 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+import http_client
+
+# Traffic classes, highest priority first. A waiting request of a class is always
+# started before any request of the classes after it.
+PRIORITIES = ["interactive", "bulk"]
+# ReliefWeb requests in flight at once, across every class.
+MAX_ACTIVE_FETCHES = int(
+    os.environ.get("FETCH_MAX_ACTIVE", str(http_client.MAX_CONNECTIONS_PER_HOST))
+)
+# Requests in flight per class. Keeping bulk well under MAX_ACTIVE_FETCHES leaves
+# interactive requests free slots even while background jobs are saturated.
+CLASS_LIMITS = {
+    "interactive": int(os.environ.get("FETCH_INTERACTIVE_LIMIT", str(MAX_ACTIVE_FETCHES))),
+    "bulk": int(os.environ.get("FETCH_BULK_LIMIT", "3")),
+}
+# Default time budget of a bulk job, after which its remaining fetches are cancelled.
+BULK_DEADLINE_SECONDS = float(os.environ.get("FETCH_BULK_DEADLINE_SECONDS", "600"))
+
+# (class, absolute time.monotonic() deadline or None) of the code running now.
+# Thread pools must run their tasks in a copy of the submitter's context
+# (contextvars.copy_context().run) for the class to carry over.
+fetch_priority = contextvars.ContextVar("fetch_priority", default=("interactive", None))
+
+
+class FetchDeadlineExceeded(TimeoutError):
+    """
+    Raised when a fetch cannot start before the deadline of its job.
+    """
+
+
+@contextlib.contextmanager
+def priority(name: str, deadline_seconds: float = None):
+    """
+    Runs the block's ReliefWeb fetches in the given traffic class.
+
+    Args:
+        name (str): One of PRIORITIES.
+        deadline_seconds (float, optional): Time budget of the block; fetches still waiting when it runs out raise FetchDeadlineExceeded, and those in flight time out. Defaults to None (no deadline).
+    """
+    if name not in CLASS_LIMITS:
+        raise ValueError(f"Unknown fetch priority {name!r}, expected one of {PRIORITIES}")
+    deadline = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+    token = fetch_priority.set((name, deadline))
+    try:
+        yield
+    finally:
+        fetch_priority.reset(token)
+
+
+def bulk(deadline_seconds: float = BULK_DEADLINE_SECONDS):
+    """
+    Runs the block's fetches as background traffic, e.g. harvesting or cache warming.
+    """
+    return priority("bulk", deadline_seconds)
+
+
+def remaining() -> float:
+    """
+    Returns the seconds left before the current job's deadline, or None if it has none.
+    """
+    _, deadline = fetch_priority.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class _Waiter:
+    def __init__(self, name: str, notify):
+        self.name = name
+        self.notify = notify
+        self.granted = False
+
+
+class FetchScheduler:
+    """
+    Admits ReliefWeb requests by traffic class, shared by threads and event loops.
+
+    Each class has its own concurrency limit, under a global one. Requests wait in
+    a FIFO queue per class; when a slot frees up, queued interactive requests
+    start first and bulk requests only start once no interactive request is
+    waiting. Requests of a job with a deadline give up waiting when it passes.
+    """
+
+    def __init__(self, limits: dict = None, max_active: int = MAX_ACTIVE_FETCHES):
+        self.limits = dict(limits or CLASS_LIMITS)
+        self.max_active = max_active
+        self.active = {name: 0 for name in self.limits}
+        self.queues = {name: collections.deque() for name in self.limits}
+        self.counts = {
+            name: {"started": 0, "expired": 0, "wait_seconds": 0.0} for name in self.limits
+        }
+        self.lock = threading.Lock()
+
+    def _can_start(self, name: str) -> bool:
+        return (
+            self.active[name] < self.limits[name]
+            and sum(self.active.values()) < self.max_active
+        )
+
+    def _dispatch(self):
+        # Called with the lock held.
+        for name in PRIORITIES:
+            queue = self.queues[name]
+            while queue and self._can_start(name):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self.active[name] += 1
+                waiter.notify()
+            if queue:
+                # Lower classes wait until every request of this one has started.
+                break
+
+    def _enqueue(self, name: str, notify) -> _Waiter:
+        waiter = _Waiter(name, notify)
+        with self.lock:
+            self.queues[name].append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Withdraws a waiting request. Returns True if it had been granted its slot meanwhile.
+        """
+        with self.lock:
+            if waiter.granted:
+                return True
+            self.queues[waiter.name].remove(waiter)
+            return False
+
+    def _expired(self, name: str):
+        with self.lock:
+            self.counts[name]["expired"] += 1
+        print(f"FETCH {name} request cancelled, deadline exceeded")
+        raise FetchDeadlineExceeded(f"{name} fetch deadline exceeded while queued")
+
+    def _started(self, name: str, waited: float):
+        with self.lock:
+            self.counts[name]["started"] += 1
+            self.counts[name]["wait_seconds"] += waited
+
+    def release(self, name: str):
+        with self.lock:
+            self.active[name] -= 1
+            self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Holds a slot of the current traffic class for the block.
+
+        Raises:
+            FetchDeadlineExceeded: If the job's deadline passes before a slot frees up.
+        """
+        name, deadline = fetch_priority.get()
+        start = time.monotonic()
+        event = threading.Event()
+        waiter = self._enqueue(name, event.set)
+        timeout = None if deadline is None else max(deadline - start, 0)
+        if not event.wait(timeout) and not self._abandon(waiter):
+            self._expired(name)
+        self._started(name, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self):
+        """
+        Async counterpart of slot.
+        """
+        name, deadline = fetch_priority.get()
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        waiter = self._enqueue(name, lambda: loop.call_soon_threadsafe(resolve))
+        timeout = None if deadline is None else max(deadline - start, 0)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self._expired(name)
+        except BaseException:
+            if self._abandon(waiter):
+                self.release(name)
+            raise
+        self._started(name, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def stats(self) -> dict:
+        """
+        Returns, per class, the requests in flight, queued, started and expired, and the mean wait in seconds.
+        """
+        with self.lock:
+            return {
+                name: {
+                    "active": self.active[name],
+                    "queued": len(self.queues[name]),
+                    "started": counts["started"],
+                    "expired": counts["expired"],
+                    "mean_wait_seconds": round(counts["wait_seconds"] / counts["started"], 4)
+                    if counts["started"]
+                    else 0.0,
+                }
+                for name, counts in self.counts.items()
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FetchScheduler:
+    """
+    Returns the process-wide fetch scheduler, creating it on first use.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+        return _scheduler
+
+
+def _bounded(kwargs: dict) -> dict:
+    # A request in flight when its job's deadline passes times out with it.
+    left = remaining()
+    if left is None:
+        return kwargs
+    timeout = kwargs.get("timeout")
+    if isinstance(timeout, (int, float)):
+        left = min(left, timeout)
+    return {**kwargs, "timeout": max(left, 0.001)}
+
+
+def get(url: str, **kwargs):
+    """
+    Sends a GET request through the shared client once the scheduler admits it.
+    """
+    with get_scheduler().slot():
+        return http_client.get(url, **_bounded(kwargs))
+
+
+def post(url: str, **kwargs):
+    """
+    Sends a POST request through the shared client once the scheduler admits it.
+    """
+    with get_scheduler().slot():
+        return http_client.post(url, **_bounded(kwargs))
+
+
+@contextlib.contextmanager
+def stream(method: str, url: str, **kwargs):
+    """
+    Streams a response once the scheduler admits the request.
+
+    The slot is held until the response headers arrive: the body is read at the
+    caller's pace, often while it fetches other pages, which would otherwise
+    wait on a slot the stream itself holds.
+    """
+    with contextlib.ExitStack() as stack:
+        with get_scheduler().slot():
+            response = stack.enter_context(http_client.stream(method, url, **_bounded(kwargs)))
+        yield response
@@ -0,0 +1,183 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import records_parquet
+
+# pandas period codes of the time buckets offered in the UI.
+TIME_BUCKETS = {"week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+# Grid cells are this many degrees wide at zoom level 0 and halve with each level.
+BASE_CELL_DEGREES = 90.0
+MIN_CELL_DEGREES = 0.1
+
+POINT_COLUMNS = ["kind", "id", "date", "country", "lat", "lon"]
+
+
+def cell_degrees(zoom: int) -> float:
+    """
+    Returns the grid cell size for a map zoom level, so each zoom shows a similar number of cells.
+    """
+    return max(BASE_CELL_DEGREES / 2 ** max(zoom, 0), MIN_CELL_DEGREES)
+
+
+def _location(countries) -> tuple:
+    if isinstance(countries, dict):
+        countries = [countries]
+    for country in countries or []:
+        location = country.get("location") or {}
+        if location.get("lat") is not None and location.get("lon") is not None:
+            return country.get("name"), location["lat"], location["lon"]
+    return None, None, None
+
+
+def country_locations(disasters: list) -> dict:
+    """
+    Collects the coordinates ReliefWeb gives for each country from disaster records.
+
+    Returns:
+        dict: (lat, lon) per country name.
+    """
+    locations = {}
+    for disaster in disasters:
+        for country in disaster.get("country") or []:
+            name, lat, lon = _location(country)
+            if name is not None:
+                locations.setdefault(name, (lat, lon))
+    return locations
+
+
+def disaster_points(disasters: list) -> pd.DataFrame:
+    """
+    Places each disaster at its primary country, dated by its event date.
+
+    Args:
+        disasters (list): Disaster records, e.g. from the disaster snapshot.
+
+    Returns:
+        pd.DataFrame: One row per located disaster, with POINT_COLUMNS.
+    """
+    rows = []
+    for disaster in disasters:
+        name, lat, lon = _location(disaster.get("primary_country"))
+        if name is None:
+            name, lat, lon = _location(disaster.get("country"))
+        dates = disaster.get("date") or {}
+        date = dates.get("event") or dates.get("created")
+        if name is not None and date:
+            rows.append(("disaster", str(disaster.get("id")), date, name, lat, lon))
+    points = pd.DataFrame(rows, columns=POINT_COLUMNS)
+    points["date"] = pd.to_datetime(points["date"], utc=True, errors="coerce")
+    return points
+
+
+def report_points(
+    locations: dict, path: str = records_parquet.RECORDS_DATASET_PATH
+) -> pd.DataFrame:
+    """
+    Places each report of the Parquet records dataset at its country.
+
+    Only the id, date and country columns are read.
+
+    Args:
+        locations (dict): (lat, lon) per country name, from country_locations.
+        path (str, optional): The records dataset. Defaults to records_parquet.RECORDS_DATASET_PATH.
+
+    Returns:
+        pd.DataFrame: One row per located report, with POINT_COLUMNS.
+    """
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=POINT_COLUMNS)
+    points = records_parquet.read_records(
+        ["id", "date", "country"], path=path, endpoint="reports"
+    ).to_pandas()
+    points["kind"] = "report"
+    points["lat"] = points["country"].map({name: lat for name, (lat, _) in locations.items()})
+    points["lon"] = points["country"].map({name: lon for name, (_, lon) in locations.items()})
+    return points.dropna(subset=["lat", "lon", "date"])[POINT_COLUMNS]
+
+
+def load_points(disasters: list, path: str = records_parquet.RECORDS_DATASET_PATH) -> pd.DataFrame:
+    """
+    Returns the disaster and report points, reports placed with the disasters' country coordinates.
+
+    Args:
+        disasters (list): Disaster records, e.g. from the disaster snapshot.
+        path (str, optional): The records dataset. Defaults to records_parquet.RECORDS_DATASET_PATH.
+
+    Returns:
+        pd.DataFrame: The points, with POINT_COLUMNS.
+    """
+    points = pd.concat(
+        [disaster_points(disasters), report_points(country_locations(disasters), path)],
+        ignore_index=True,
+    )
+    points["date"] = pd.to_datetime(points["date"], utc=True).astype("datetime64[ns, UTC]")
+    points["kind"] = points["kind"].astype("category")
+    return points
+
+
+def _window(points: pd.DataFrame, date_from=None, date_to=None) -> pd.DataFrame:
+    mask = np.ones(len(points), dtype=bool)
+    if date_from is not None:
+        mask &= (points["date"] >= pd.Timestamp(date_from, tz="UTC")).to_numpy()
+    if date_to is not None:
+        mask &= (points["date"] < pd.Timestamp(date_to, tz="UTC")).to_numpy()
+    return points[mask]
+
+
+def _periods(dates: pd.Series, time_bucket: str) -> pd.Series:
+    return dates.dt.tz_localize(None).dt.to_period(TIME_BUCKETS[time_bucket]).dt.start_time
+
+
+def bin_points(
+    points: pd.DataFrame,
+    zoom: int,
+    time_bucket: str = "month",
+    date_from=None,
+    date_to=None,
+) -> pd.DataFrame:
+    """
+    Counts points per grid cell, kind and time bucket.
+
+    Args:
+        points (pd.DataFrame): Points with POINT_COLUMNS.
+        zoom (int): The map zoom level; sets the cell size (see cell_degrees).
+        time_bucket (str, optional): One of TIME_BUCKETS. Defaults to "month".
+        date_from (optional): Keep points on or after this date. Defaults to None.
+        date_to (optional): Keep points before this date. Defaults to None.
+
+    Returns:
+        pd.DataFrame: "kind", "period" (bucket start), "lat" and "lon" (cell centre) and "count".
+    """
+    points = _window(points, date_from, date_to)
+    size = cell_degrees(zoom)
+    cells = pd.DataFrame(
+        {
+            "kind": points["kind"].to_numpy(),
+            "period": _periods(points["date"], time_bucket).to_numpy(),
+            "lat": (np.floor((points["lat"].to_numpy() + 90) / size) + 0.5) * size - 90,
+            "lon": (np.floor((points["lon"].to_numpy() + 180) / size) + 0.5) * size - 180,
+        }
+    )
+    counts = cells.groupby(["kind", "period", "lat", "lon"], sort=True).size()
+    return counts.reset_index(name="count")
+
+
+def timeline(
+    points: pd.DataFrame, time_bucket: str = "month", date_from=None, date_to=None
+) -> pd.DataFrame:
+    """
+    Counts points per kind and time bucket.
+
+    Returns:
+        pd.DataFrame: "kind", "period" (bucket start) and "count".
+    """
+    points = _window(points, date_from, date_to)
+    periods = pd.DataFrame(
+        {
+            "kind": points["kind"].to_numpy(),
+            "period": _periods(points["date"], time_bucket).to_numpy(),
+        }
+    )
+    return periods.groupby(["kind", "period"], sort=True).size().reset_index(name="count")
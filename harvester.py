@@ -0,0 +1,304 @@
+"""
+Bulk backfill of ReliefWeb reports over a long date range.
+
+The range is cut into date shards fetched in parallel. A shard holding more
+reports than one API page is split further, so the work adapts to how busy each
+period was. Usage:
+
+    python harvester.py 2019-01-01 2024-01-01 --keyword Sudan --workers 8
+"""
+
+import argparse
+import contextvars
+import datetime
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+
+import fetch_scheduler
+from corpus_store import get_corpus
+from reliefweb import build_reports_query, fetch_body, query_rweb
+
+# Reports per API call; the ReliefWeb API returns at most 1000. A shard with more
+# reports than this is split.
+SHARD_RESULTS = 1000
+HARVEST_WORKERS = int(os.environ.get("HARVEST_WORKERS", "4"))
+# API calls per second across all workers, with bursts of up to HARVEST_BURST calls.
+HARVEST_RATE_PER_SECOND = float(os.environ.get("HARVEST_RATE_PER_SECOND", "2"))
+HARVEST_BURST = int(os.environ.get("HARVEST_BURST", "4"))
+# Attempts per shard before it is reported as failed.
+HARVEST_ATTEMPTS = 3
+# Shards are never split below this span; a busier one is paged through instead.
+MIN_SHARD_SECONDS = 60 * 60
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: acquire() blocks until a call is allowed.
+    """
+
+    def __init__(self, rate: float = HARVEST_RATE_PER_SECOND, burst: int = HARVEST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+def _parse_date(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        date = value
+    else:
+        date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date
+
+
+def _iso(date: datetime.datetime) -> str:
+    return date.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def split_range(start: datetime.datetime, end: datetime.datetime, pieces: int) -> list:
+    """
+    Cuts [start, end] into pieces shards of equal length, at least MIN_SHARD_SECONDS long.
+
+    Returns:
+        list: (start, end) tuples. Neighbouring shards share their boundary; the
+        ReliefWeb range filter includes both ends, and merging by id drops the overlap.
+    """
+    span = (end - start).total_seconds()
+    pieces = max(1, min(pieces, int(span // MIN_SHARD_SECONDS)))
+    step = (end - start) / pieces
+    bounds = [start + step * i for i in range(pieces)] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class Harvester:
+    """
+    Fetches every report matching a query over a date range, in parallel date shards.
+
+    Each shard is requested sorted by date, one page of shard_results reports. When
+    the API reports more, the page is kept, and the rest of the shard (from the
+    last date received to its end) is split into as many shards as its count
+    needs, assuming reports are spread evenly; shards that turn out busier split
+    again. Calls go through a shared rate limiter and run as bulk traffic (see
+    fetch_scheduler), so user questions are served first.
+    """
+
+    def __init__(
+        self,
+        workers: int = HARVEST_WORKERS,
+        rate: float = HARVEST_RATE_PER_SECOND,
+        shard_results: int = SHARD_RESULTS,
+    ):
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.shard_results = shard_results
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _query(self, query: dict) -> dict:
+        for attempt in range(HARVEST_ATTEMPTS):
+            self.limiter.acquire()
+            try:
+                answer = query_rweb(query, "reports")
+            except httpx.HTTPError as e:
+                print(f"HARVEST request failed: {e}")
+                answer = None
+            self._count("calls")
+            if answer is not None:
+                return answer
+            time.sleep(2**attempt)
+        return None
+
+    def _count(self, name: str, n: int = 1):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    def _fetch_shard(self, start, end, filters: dict, offset: int = 0) -> tuple:
+        """
+        Fetches one page of a shard.
+
+        Returns:
+            tuple: (records, follow-up shards as (start, end, offset) tuples).
+        """
+        query = build_reports_query(
+            date_from=_iso(start),
+            date_to=_iso(end),
+            sort="date.created:asc",
+            limit=self.shard_results,
+            offset=offset,
+            **filters,
+        )
+        # Bodies are scraped from the pages if asked for; don't transfer the API's copy
+        # of a thousand of them per call.
+        query["fields"]["include"].remove("body")
+        try:
+            answer = self._query(query)
+        except fetch_scheduler.FetchDeadlineExceeded:
+            self._count("expired_shards")
+            return [], []
+        if answer is None:
+            print(f"HARVEST failed shard {_iso(start)} .. {_iso(end)} at offset {offset}")
+            self._count("failed_shards")
+            return [], []
+        records = [item["fields"] for item in answer["data"]]
+        remaining = answer.get("totalCount", 0) - offset - len(records)
+        if remaining <= 0 or not records:
+            return records, []
+
+        last = _parse_date(records[-1]["date"]["created"])
+        if (end - last).total_seconds() < MIN_SHARD_SECONDS or last <= start:
+            # Too many reports in too short a span to split: page through it.
+            return records, [(start, end, offset + len(records))]
+        pieces = math.ceil(remaining / self.shard_results)
+        shards = [(s, e, 0) for s, e in split_range(last, end, pieces)]
+        self._count("splits")
+        return records, shards
+
+    def run(
+        self,
+        date_from: str,
+        date_to: str,
+        bodies: bool = False,
+        use_corpus: bool = True,
+        deadline_seconds: float = None,
+        **filters,
+    ) -> list:
+        """
+        Harvests the reports created between date_from and date_to.
+
+        Args:
+            date_from (str): Start of the range, as an ISO 8601 date or datetime.
+            date_to (str): End of the range, as an ISO 8601 date or datetime.
+            bodies (bool, optional): Also scrape each report's body; a body that cannot be scraped is left empty and counted in stats. Defaults to False.
+            use_corpus (bool, optional): Read and keep scraped bodies in the local corpus store. Defaults to True.
+            deadline_seconds (float, optional): Give up on shards still pending after this long, returning what was harvested. Defaults to None.
+            **filters: keyword, disaster_id and format_name, as for get_rweb_reports_and_news_data.
+
+        Returns:
+            list: The report fields, one per id, oldest first.
+        """
+        start = time.monotonic()
+        self.stats = {
+            "calls": 0,
+            "shards": 0,
+            "splits": 0,
+            "failed_shards": 0,
+            "expired_shards": 0,
+            "failed_bodies": 0,
+        }
+        merged = {}
+
+        with fetch_scheduler.priority("bulk", deadline_seconds):
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+                def submit(shard_start, shard_end, offset):
+                    self._count("shards")
+                    future = executor.submit(
+                        contextvars.copy_context().run,
+                        self._fetch_shard,
+                        shard_start,
+                        shard_end,
+                        filters,
+                        offset,
+                    )
+                    running[future] = (shard_start, shard_end)
+
+                running = {}
+                first, last = _parse_date(date_from), _parse_date(date_to)
+                for shard_start, shard_end in split_range(first, last, self.workers):
+                    submit(shard_start, shard_end, 0)
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+                        records, shards = future.result()
+                        for record in records:
+                            merged[str(record.get("id"))] = record
+                        for shard in shards:
+                            submit(*shard)
+
+                results = sorted(merged.values(), key=lambda r: r["date"]["created"])
+                if bodies:
+                    corpus = get_corpus() if use_corpus else None
+                    futures = [
+                        executor.submit(
+                            contextvars.copy_context().run, fetch_body, record, "reports", corpus
+                        )
+                        for record in results
+                    ]
+                    for record, future in zip(results, futures):
+                        record["endpoint"] = "reports"
+                        try:
+                            record["body"] = future.result()
+                        except Exception as e:
+                            # One unreachable page doesn't lose the rest of the harvest.
+                            print(f"HARVEST failed body of report {record.get('id')}: {e}")
+                            self._count("failed_bodies")
+                            record["body"] = []
+
+        self.stats["records"] = len(results)
+        self.stats["seconds"] = round(time.monotonic() - start, 2)
+        print(f"HARVEST {self.stats}")
+        return results
+
+
+def harvest_reports(date_from: str, date_to: str, workers: int = HARVEST_WORKERS, **kwargs) -> list:
+    """
+    Harvests the reports created between date_from and date_to. See Harvester.run.
+    """
+    return Harvester(workers=workers).run(date_from, date_to, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("date_from", help="start of the range, e.g. 2019-01-01")
+    parser.add_argument("date_to", help="end of the range, e.g. 2024-01-01")
+    parser.add_argument("--keyword", default="")
+    parser.add_argument("--disaster-id", default=None)
+    parser.add_argument("--format-name", default=None)
+    parser.add_argument("--workers", type=int, default=HARVEST_WORKERS)
+    parser.add_argument("--bodies", action="store_true", help="also scrape report bodies")
+    parser.add_argument(
+        "--parquet", action="store_true", help="append the reports to the Parquet records dataset"
+    )
+    args = parser.parse_args()
+
+    records = harvest_reports(
+        args.date_from,
+        args.date_to,
+        workers=args.workers,
+        bodies=args.bodies,
+        keyword=args.keyword,
+        disaster_id=args.disaster_id,
+        format_name=args.format_name,
+    )
+    if args.parquet:
+        # Imported here: pyarrow is only needed for the export.
+        from records_parquet import export_records
+
+        for record in records:
+            record["endpoint"] = "reports"
+        print(f"HARVEST exported {export_records(records)} records")
+
+
+if __name__ == "__main__":
+    main()
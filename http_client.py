@@ -0,0 +1,273 @@
+import asyncio
+import importlib.util
+import os
+import threading
+
+import httpx
+
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", "30"))
+RETRIES = int(os.environ.get("HTTP_RETRIES", "1"))
+# HTTP/2 needs the optional h2 package.
+HTTP2 = os.environ.get("HTTP_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+TIMEOUT = httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+LIMITS = httpx.Limits(
+    max_connections=MAX_CONNECTIONS,
+    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+)
+
+
+def _host(request: httpx.Request) -> str:
+    return request.url.netloc.decode("ascii")
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+
+class HostLimitedTransport(httpx.HTTPTransport):
+    """
+    Connection pool that also caps the requests in flight to any one host.
+
+    A slot is held from sending the request until its response is closed, so
+    streamed downloads count against the limit for as long as they run.
+    """
+
+    def __init__(self, max_per_host: int = MAX_CONNECTIONS_PER_HOST, **kwargs):
+        super().__init__(**kwargs)
+        self.max_per_host = max_per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.semaphores[host]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphore(_host(request))
+        semaphore.acquire()
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                semaphore.release()
+
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+
+class AsyncHostLimitedTransport(httpx.AsyncHTTPTransport):
+    """
+    Async counterpart of HostLimitedTransport.
+    """
+
+    def __init__(self, max_per_host: int = MAX_CONNECTIONS_PER_HOST, **kwargs):
+        super().__init__(**kwargs)
+        self.max_per_host = max_per_host
+        self.semaphores = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = _host(request)
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.BoundedSemaphore(self.max_per_host)
+        semaphore = self.semaphores[host]
+        await semaphore.acquire()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                semaphore.release()
+
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_AsyncReleasingStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+
+_transport = None
+_client = None
+_async_transport = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def get_transport() -> HostLimitedTransport:
+    """
+    Returns the shared connection pool, creating it on first use.
+    """
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = HostLimitedTransport(limits=LIMITS, http2=HTTP2, retries=RETRIES)
+        return _transport
+
+
+def get_client() -> httpx.Client:
+    """
+    Returns the shared HTTP client used for every ReliefWeb and model call.
+
+    Connections are kept alive and reused across calls and threads, so article
+    scrapes skip the TCP and TLS handshakes after the first request to a host.
+    """
+    global _client
+    transport = get_transport()
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(transport=transport, timeout=TIMEOUT, follow_redirects=True)
+        return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the shared async HTTP client. It is bound to the event loop that first uses it.
+    """
+    global _async_transport, _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_transport = AsyncHostLimitedTransport(
+                limits=LIMITS, http2=HTTP2, retries=RETRIES
+            )
+            _async_client = httpx.AsyncClient(
+                transport=_async_transport, timeout=TIMEOUT, follow_redirects=True
+            )
+        return _async_client
+
+
+async def aclose_async_client():
+    """
+    Closes the shared async client, e.g. on server shutdown.
+    """
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def client_for(base_url: str, headers: dict = None) -> httpx.Client:
+    """
+    Returns a client with its own base URL and headers on top of the shared pool.
+
+    For SDKs that take an httpx client, such as ChatMistralAI. Don't close it:
+    closing it would close the shared pool.
+    """
+    return httpx.Client(
+        transport=get_transport(),
+        base_url=base_url,
+        headers=headers,
+        timeout=TIMEOUT,
+        follow_redirects=True,
+    )
+
+
+def async_client_for(base_url: str, headers: dict = None) -> httpx.AsyncClient:
+    """
+    Async counterpart of client_for, on top of the shared async pool.
+    """
+    get_async_client()
+    return httpx.AsyncClient(
+        transport=_async_transport,
+        base_url=base_url,
+        headers=headers,
+        timeout=TIMEOUT,
+        follow_redirects=True,
+    )
+
+
+def get(url: str, **kwargs) -> httpx.Response:
+    """
+    Sends a GET request through the shared client.
+    """
+    return get_client().get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> httpx.Response:
+    """
+    Sends a POST request through the shared client.
+    """
+    return get_client().post(url, **kwargs)
+
+
+def stream(method: str, url: str, **kwargs):
+    """
+    Sends a request through the shared client and streams the response body.
+
+    Use as a context manager: with stream("GET", url) as response: ...
+    """
+    return get_client().stream(method, url, **kwargs)
+
+
+def mistral_client_kwargs(api_key: str = None, base_url: str = "https://api.mistral.ai/v1") -> dict:
+    """
+    Returns client and async_client arguments for ChatMistralAI that use the shared pool.
+
+    Args:
+        api_key (str, optional): The Mistral API key. Defaults to the MISTRAL_API_KEY environment variable.
+        base_url (str, optional): The Mistral API URL. Defaults to "https://api.mistral.ai/v1".
+
+    Returns:
+        dict: Keyword arguments to pass to ChatMistralAI.
+    """
+    api_key = api_key or os.environ.get("MISTRAL_API_KEY", "")
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+    return {
+        "client": client_for(base_url, headers),
+        "async_client": async_client_for(base_url, headers),
+    }
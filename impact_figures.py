@@ -0,0 +1,394 @@
+import atexit
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from dedup import body_text
+
+IMPACT_FIGURES_PATH = os.environ.get("IMPACT_FIGURES_PATH", "cache/impact_figures")
+# New figures are written as a new Parquet file of the store once this many rows
+# are buffered, in a background thread, and at exit.
+FLUSH_ROWS = 500
+
+METRICS = ["deaths", "injured", "displaced", "affected", "in_need", "funding"]
+
+SCHEMA = pa.schema(
+    [
+        ("report_id", pa.string()),
+        ("disaster_id", pa.string()),
+        ("disaster_type", pa.string()),
+        ("country", pa.string()),
+        ("date", pa.date32()),
+        ("year", pa.int16()),
+        ("source", pa.string()),
+        ("url", pa.string()),
+        ("metric", pa.string()),
+        ("value", pa.float64()),
+        ("unit", pa.string()),
+        ("snippet", pa.string()),
+    ]
+)
+
+# Context kept around each figure, for checking it against the report.
+SNIPPET_CHARS = 80
+
+# Not inside an identifier: "COVID-19 deaths" and "H5N1 cases" hold no figure.
+_NUMBER = r"(?<![\w-])(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)(?:\s*(million|billion|thousand|m|bn|k)\b)?"
+_SCALES = {
+    None: 1,
+    "thousand": 1e3,
+    "k": 1e3,
+    "million": 1e6,
+    "m": 1e6,
+    "billion": 1e9,
+    "bn": 1e9,
+}
+# Words allowed between a number and the metric: "1,200 people have been displaced".
+_PEOPLE = r"(?:\s+(?:people|persons|individuals|children|civilians|residents))?"
+_VERB = r"(?:\s+(?:have|has|had|were|was|are|is|been|reportedly|reported|now)){0,3}"
+# Words allowed between a verb and the number after it: "killing at least 12".
+_QUALIFIER = r"(?:(?:at least|some|about|nearly|almost|around|over|more than|an estimated|up to)\s+)?"
+# Words allowed between "death toll" and its number: "the death toll has risen to 85".
+_TOLL_VERB = r"(?:\s+(?:has|have|had|now|rose|risen|reached|stands|stood|climbed|is|was|of|to|at)){0,3}"
+
+# Patterns with the number before the metric come first: when two patterns match
+# the same number, the first one listed keeps it.
+_FIGURE_PATTERNS = [
+    (
+        "deaths",
+        rf"{_NUMBER}{_PEOPLE}{_VERB}\s+(?:dead|deaths|killed|died|fatalities|lives lost|deceased)",
+    ),
+    ("injured", rf"{_NUMBER}{_PEOPLE}{_VERB}\s+(?:injured|injuries|wounded|hurt)"),
+    (
+        "displaced",
+        rf"{_NUMBER}{_PEOPLE}{_VERB}\s+(?:displaced|evacuated|homeless|idps|fled|forced to flee)",
+    ),
+    ("affected", rf"{_NUMBER}{_PEOPLE}{_VERB}\s+(?:affected|impacted)"),
+    ("in_need", rf"{_NUMBER}{_PEOPLE}{_VERB}\s+(?:in need|in urgent need|requiring|require)"),
+    ("deaths", rf"(?:death toll|fatalities){_TOLL_VERB}\s+{_QUALIFIER}{_NUMBER}"),
+    ("deaths", rf"(?:killing|killed)\s+{_QUALIFIER}{_NUMBER}"),
+    ("injured", rf"injuring\s+{_QUALIFIER}{_NUMBER}"),
+    ("displaced", rf"displacing\s+{_QUALIFIER}{_NUMBER}"),
+    ("affected", rf"affecting\s+{_QUALIFIER}{_NUMBER}"),
+    ("funding", rf"(?:us\$|usd|\$)\s?{_NUMBER}"),
+]
+_COMPILED_PATTERNS = [
+    (metric, re.compile(pattern, re.IGNORECASE)) for metric, pattern in _FIGURE_PATTERNS
+]
+# Dollar amounts only count as funding in sentences about appeals and requirements.
+_FUNDING_CONTEXT = re.compile(r"appeal|fund|requir|request|plan|pledge|allocat", re.IGNORECASE)
+# A full stop inside a number ("3.5 million") does not end the sentence.
+_SENTENCE_RE = re.compile(r"(?:[^.!?]|[.!?](?=\S))+(?:[.!?]+|$)")
+
+
+def _parse_number(number: str, scale: str) -> float:
+    value = float(number.replace(",", ""))
+    return value * _SCALES[scale.lower() if scale else None]
+
+
+def extract_figures(text: str) -> list:
+    """
+    Finds impact figures in a report text.
+
+    Args:
+        text (str): The report body.
+
+    Returns:
+        list: One dict per figure mentioned, with "metric", "value", "unit" ("people" or "usd") and "snippet".
+    """
+    figures = []
+    for sentence in _SENTENCE_RE.findall(text):
+        # Start offsets of the numbers already taken, so a number counts for one metric only.
+        claimed = set()
+        found = []
+        for metric, pattern in _COMPILED_PATTERNS:
+            if metric == "funding" and not _FUNDING_CONTEXT.search(sentence):
+                continue
+            for match in pattern.finditer(sentence):
+                number, scale = match.group(1), match.group(2)
+                value = _parse_number(number, scale)
+                # A bare four-digit number before "affected" is usually a year.
+                if scale is None and "," not in number and 1900 <= value <= 2100:
+                    continue
+                if match.start(1) in claimed:
+                    continue
+                claimed.add(match.start(1))
+                start = max(match.start() - SNIPPET_CHARS, 0)
+                figure = {
+                    "metric": metric,
+                    "value": value,
+                    "unit": "usd" if metric == "funding" else "people",
+                    "snippet": sentence[start : match.end() + SNIPPET_CHARS].strip(),
+                }
+                found.append((match.start(1), figure))
+        figures.extend(figure for _, figure in sorted(found, key=lambda item: item[0]))
+    return figures
+
+
+def _first(value) -> dict:
+    if isinstance(value, list):
+        return value[0] if value else {}
+    return value or {}
+
+
+def _report_tags(record: dict) -> dict:
+    disaster = _first(record.get("disaster"))
+    disaster_types = disaster.get("type") or []
+    if isinstance(disaster_types, dict):
+        disaster_types = [disaster_types]
+    primary_type = next((t for t in disaster_types if t.get("primary")), _first(disaster_types))
+
+    created = (record.get("date") or {}).get("created")
+    date = None
+    if created:
+        try:
+            date = datetime.datetime.fromisoformat(created).date()
+        except ValueError:
+            pass
+
+    return {
+        "report_id": str(record.get("id")),
+        "disaster_id": str(disaster["id"]) if disaster.get("id") is not None else None,
+        "disaster_type": primary_type.get("name"),
+        "country": _first(record.get("primary_country")).get("name"),
+        "date": date,
+        "year": date.year if date else None,
+        "source": _first(record.get("source")).get("name"),
+        "url": record.get("url"),
+    }
+
+
+def figures_table(records: list) -> pa.Table:
+    """
+    Extracts the impact figures of reports into an Arrow table.
+
+    Reports repeat their running totals, so each report keeps only its largest
+    figure per metric.
+
+    Args:
+        records (list): Report records as built by get_rweb_data, with "body".
+
+    Returns:
+        pa.Table: One row per report and metric, with SCHEMA.
+    """
+    rows = []
+    for record in records:
+        best = {}
+        for figure in extract_figures(body_text(record.get("body"))):
+            if figure["value"] > best.get(figure["metric"], {}).get("value", -1):
+                best[figure["metric"]] = figure
+        if best:
+            tags = _report_tags(record)
+            rows.extend({**tags, **figure} for figure in best.values())
+    return pa.Table.from_pylist(rows, schema=SCHEMA)
+
+
+def aggregate(table: pa.Table, metric: str, by: list = ("year",)) -> pa.Table:
+    """
+    Totals one metric per group, e.g. deaths per year or displaced per country and year.
+
+    Successive reports on one disaster restate its cumulative figures, so a disaster
+    counts once, with the largest figure reported for it. Reports not linked to a
+    disaster count on their own.
+
+    Args:
+        table (pa.Table): Impact figures with SCHEMA.
+        metric (str): One of METRICS.
+        by (list, optional): Columns to group by. Defaults to ("year",).
+
+    Returns:
+        pa.Table: The group columns, "value" (the total) and "disasters" (how many disasters or reports it covers).
+    """
+    by = list(by)
+    table = table.filter(pc.equal(table["metric"], metric))
+    event = pc.coalesce(
+        table["disaster_id"], pc.binary_join_element_wise("report:", table["report_id"], "")
+    )
+    table = table.append_column("event", event)
+    per_event = table.group_by(["event"] + by).aggregate([("value", "max")])
+    totals = per_event.group_by(by).aggregate([("value_max", "sum"), ("event", "count")])
+    names = {"value_max_sum": "value", "event_count": "disasters"}
+    totals = totals.rename_columns([names.get(name, name) for name in totals.column_names])
+    return totals.sort_by([(column, "ascending") for column in by])
+
+
+class ImpactStore:
+    """
+    Impact figures kept in a directory of Parquet files.
+
+    Each flush appends one file with the figures added since the previous one, so
+    the cost of add() doesn't grow with the store; files are named in write
+    order. A report's figures replace its earlier ones: when files are read, or
+    figures added, the latest figures of each report win. compact() rewrites the
+    store as a single file.
+    """
+
+    def __init__(self, path: str = IMPACT_FIGURES_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        # Held through a flush, so files are written in the order rows were added.
+        self.flush_lock = threading.Lock()
+        # Tables in the order they were added, and the part holding each report's latest figures.
+        self.parts = []
+        self.latest = {}
+        self.table_cache = SCHEMA.empty_table()
+        self.pending = []
+        self.pending_rows = 0
+        for name in self._files():
+            self._append(pq.read_table(os.path.join(path, name), schema=SCHEMA))
+
+    def _files(self) -> list:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.endswith(".parquet"))
+
+    def _append(self, table: pa.Table):
+        # Called with the lock held, or from __init__.
+        for report_id in table["report_id"].unique().to_pylist():
+            self.latest[report_id] = len(self.parts)
+        self.parts.append(table)
+        self.table_cache = None
+
+    @property
+    def table(self) -> pa.Table:
+        """
+        The stored figures, each report's latest only.
+        """
+        with self.lock:
+            if self.table_cache is None:
+                current = [[] for _ in self.parts]
+                for report_id, index in self.latest.items():
+                    current[index].append(report_id)
+                kept = [
+                    part.filter(pc.is_in(part["report_id"], value_set=pa.array(ids, pa.string())))
+                    for part, ids in zip(self.parts, current)
+                ]
+                self.table_cache = pa.concat_tables(kept) if kept else SCHEMA.empty_table()
+                # Keep one part from now on, so the merge isn't repeated.
+                self.parts = [self.table_cache]
+                self.latest = {rid: 0 for rid in self.latest}
+            return self.table_cache
+
+    def add(self, records: list) -> pa.Table:
+        """
+        Extracts and stores the figures of the given reports.
+
+        The figures are held in memory and written by a background flush once
+        FLUSH_ROWS are buffered.
+
+        Args:
+            records (list): Report records as built by get_rweb_data, with "body".
+
+        Returns:
+            pa.Table: The figures extracted from these reports.
+        """
+        new = figures_table(records)
+        if new.num_rows == 0:
+            return new
+        with self.lock:
+            self._append(new)
+            self.pending.append(new)
+            self.pending_rows += new.num_rows
+            due = self.pending_rows >= FLUSH_ROWS
+        if due:
+            threading.Thread(target=self.flush, name="impact-flush", daemon=True).start()
+        return new
+
+    def flush(self):
+        """
+        Writes the figures added since the last flush as a new file of the store.
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending, self.pending_rows = self.pending, [], 0
+            if pending:
+                self._write(pa.concat_tables(pending))
+
+    def compact(self):
+        """
+        Rewrites the store as a single file holding each report's latest figures.
+        """
+        with self.flush_lock:
+            with self.lock:
+                # Buffered figures are part of the table written below.
+                self.pending, self.pending_rows = [], 0
+            old = self._files()
+            self._write(self.table)
+            for name in old:
+                os.remove(os.path.join(self.path, name))
+
+    def _write(self, table: pa.Table):
+        # Called with the flush lock held. Names sort in write order.
+        os.makedirs(self.path, exist_ok=True)
+        name = f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp_path = os.path.join(self.path, f".{name}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def aggregate(self, metric: str, by: list = ("year",), **filters) -> pa.Table:
+        """
+        Totals one metric per group over the stored figures.
+
+        Args:
+            metric (str): One of METRICS.
+            by (list, optional): Columns to group by. Defaults to ("year",).
+            **filters: Column values to keep, e.g. disaster_type="Snow Avalanche" or country="Nepal".
+
+        Returns:
+            pa.Table: See aggregate().
+        """
+        table = self.table
+        for column, value in filters.items():
+            table = table.filter(pc.equal(table[column], value))
+        return aggregate(table, metric, by)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_impact_store() -> ImpactStore:
+    """
+    Returns the process-wide impact figure store, loading it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImpactStore()
+            atexit.register(_store.flush)
+        return _store
+
+
+def record_impact_figures(reliefweb_data: str) -> str:
+    """
+    Extracts and stores the impact figures of a get_rweb_data result.
+
+    Args:
+        reliefweb_data (str): The JSON string returned by get_rweb_data.
+
+    Returns:
+        str: JSON string of the figures found, one per report and metric, with the report they come from.
+    """
+    try:
+        records = json.loads(reliefweb_data)
+    except json.JSONDecodeError:
+        # get_rweb_data returns a message string when the request fails.
+        return "[]"
+    if not isinstance(records, list):
+        return "[]"
+    figures = get_impact_store().add(records)
+    return json.dumps(figures.to_pylist(), indent=4, default=str)
+
+
+if __name__ == "__main__":
+    store = get_impact_store()
+    print(store.aggregate("deaths", by=["year"], disaster_type="Snow Avalanche").to_pandas())
+    print(store.aggregate("displaced", by=["year", "country"]).to_pandas())
@@ -0,0 +1,140 @@
+import contextvars
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from corpus_store import get_corpus
+from reliefweb import build_reports_query, fetch_body, query_rweb
+
+PREFETCH_WORKERS = 8
+
+
+class ReportRecord(dict):
+    """
+    A ReliefWeb record whose body is scraped on first access.
+
+    The record holds the API metadata (title, date, url, source, ...) from the
+    start. Reading "body" scrapes the page once and caches it on the record.
+    Serializing the record (e.g. with json.dumps) only includes the body if it has
+    been loaded already, so metadata-only workflows never download pages.
+    """
+
+    def __init__(self, fields: dict, endpoint: str, use_corpus: bool = False):
+        super().__init__(fields)
+        self["endpoint"] = endpoint
+        self.use_corpus = use_corpus
+        self._body_lock = threading.Lock()
+
+    @property
+    def body_loaded(self) -> bool:
+        return dict.__contains__(self, "body")
+
+    def load_body(self) -> list:
+        """
+        Scrapes the body if it isn't loaded yet and returns it.
+        """
+        with self._body_lock:
+            if not self.body_loaded:
+                corpus = get_corpus() if self.use_corpus else None
+                self["body"] = fetch_body(self, self["endpoint"], corpus)
+            return dict.__getitem__(self, "body")
+
+    def __getitem__(self, key):
+        if key == "body" and not self.body_loaded:
+            return self.load_body()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key == "body" and not self.body_loaded:
+            return self.load_body()
+        return super().get(key, default)
+
+    def __contains__(self, key) -> bool:
+        return key == "body" or super().__contains__(key)
+
+
+def metadata_query(query: dict) -> dict:
+    """
+    Returns a copy of a query that doesn't ask the API for report bodies.
+
+    The body is scraped from the page when needed; don't transfer the API's copy.
+    """
+    query = copy.deepcopy(query)
+    include = query.get("fields", {}).get("include")
+    if include and "body" in include:
+        include.remove("body")
+    return query
+
+
+def get_rweb_records(query: dict, endpoint: str, use_corpus: bool = False) -> list:
+    """
+    Retrieves ReliefWeb records with their metadata only; bodies are scraped on first access.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint to retrieve data from.
+        use_corpus (bool, optional): Read bodies from the local corpus store when they are loaded. Defaults to False.
+
+    Returns:
+        list: ReportRecord objects, or an empty list if the request failed.
+    """
+    answer = query_rweb(metadata_query(query), endpoint)
+    if answer is None:
+        return []
+    return [ReportRecord(item["fields"], endpoint, use_corpus) for item in answer["data"]]
+
+
+def get_rweb_reports_and_news_records(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    disaster_id: str = None,
+    sort: str = None,
+    limit: int = 5,
+    offset: int = 0,
+    format_name: str = None,
+    use_corpus: bool = False,
+) -> list:
+    """
+    Lazy counterpart of reliefweb.get_rweb_reports_and_news_data.
+
+    Takes the same parameters, but honours limit, since listing metadata is cheap.
+
+    Returns:
+        list: ReportRecord objects whose bodies are scraped on first access.
+    """
+    query = build_reports_query(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        disaster_id=disaster_id,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+        format_name=format_name,
+    )
+    return get_rweb_records(query, "reports", use_corpus=use_corpus)
+
+
+def prefetch_bodies(records: list, max_workers: int = PREFETCH_WORKERS) -> list:
+    """
+    Scrapes the bodies of the given records concurrently.
+
+    Args:
+        records (list): The ReportRecord objects to load, e.g. the top-ranked candidates.
+        max_workers (int, optional): Pages downloaded at once. Defaults to PREFETCH_WORKERS.
+
+    Returns:
+        list: The same records, with their bodies loaded.
+    """
+    pending = [record for record in records if not record.body_loaded]
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            # Each download runs in the caller's context, so it keeps its fetch priority.
+            futures = [
+                executor.submit(contextvars.copy_context().run, ReportRecord.load_body, record)
+                for record in pending
+            ]
+            for future in futures:
+                future.result()
+    return records
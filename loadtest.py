@@ -0,0 +1,481 @@
+"""
+Load test of the answering pipeline against a mock chat model and a mock ReliefWeb API.
+
+Replays a stream of questions at a given concurrency and arrival rate and
+reports throughput and p50/p95/p99 latency, overall and per pipeline stage.
+Nothing leaves the machine: the ReliefWeb API and report pages are served
+locally, the chat model only sleeps, and every cache lives in a scratch
+directory.
+
+    python loadtest.py questions.jsonl --requests 200 --concurrency 16 --rate 5
+
+With --server, the questions are posted to /ask of the web application instead,
+which also exercises its admission queue and the 429 and 504 responses:
+
+    python loadtest.py --server --requests 500 --concurrency 200 --workers 8 --max-queue 32
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+DEFAULT_QUESTIONS = [
+    "What is the humanitarian situation in Sudan?",
+    "How many people were displaced by the floods in Pakistan?",
+    "Snow avalanche total deaths every year?",
+    "What are the needs after the earthquake in Turkey?",
+]
+COUNTRIES = [
+    ("Sudan", 15.5, 32.5),
+    ("Pakistan", 30.0, 70.0),
+    ("Nepal", 28.2, 84.0),
+    ("Türkiye", 39.0, 35.0),
+]
+
+# Replies of the mock chat model, picked by a phrase of the rendered prompt.
+MOCK_REPLIES = [
+    ("extract entities", '[{"entity_type": "location", "entity": "Sudan"}]'),
+    ("generate queries for ReliefWeb", "sudan floods"),
+    ("transcript of a conversation", "sudan floods"),
+    ("evaluating the quality", "5"),
+    ("concise summaries", "Floods displaced thousands of people and damaged crops."),
+]
+MOCK_ANSWER_WORD = "answer"
+# Page text is drawn from these, so reports are not near-duplicates of each other.
+FILLER_WORDS = (
+    "flood water access health shelter food camp road bridge district rain crops "
+    "cholera response partners supplies assessment families needs village river"
+).split()
+
+
+class MockResponse:
+    def __init__(self, content: str, input_tokens: int, output_tokens: int):
+        self.content = content
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        self.response_metadata = {}
+
+
+class MockChatModel:
+    """
+    Stands in for a LangChain chat model, with a fixed time to first token and a
+    time per output token.
+
+    Args:
+        first_token_seconds (float): Delay before the first token.
+        token_seconds (float): Delay per output token.
+        answer_tokens (int): Length of free-text answers, in tokens.
+    """
+
+    def __init__(self, first_token_seconds: float, token_seconds: float, answer_tokens: int):
+        self.first_token_seconds = first_token_seconds
+        self.token_seconds = token_seconds
+        self.answer_tokens = answer_tokens
+
+    def _reply(self, messages) -> tuple:
+        last = messages[-1] if isinstance(messages, list) and messages else None
+        role = last[0] if isinstance(last, tuple) else getattr(last, "type", None)
+        if role == "system":
+            # Mistral rejects a conversation that ends with a system message.
+            raise ValueError("Expected last role User or Tool (or Assistant with prefix True) for serving")
+        prompt = str(messages)
+        content = next(
+            (reply for phrase, reply in MOCK_REPLIES if phrase in prompt),
+            " ".join([MOCK_ANSWER_WORD] * self.answer_tokens),
+        )
+        output_tokens = len(content.split())
+        delay = self.first_token_seconds + output_tokens * self.token_seconds
+        # Roughly four characters per token.
+        return MockResponse(content, len(prompt) // 4, output_tokens), delay
+
+    def invoke(self, messages):
+        response, delay = self._reply(messages)
+        time.sleep(delay)
+        return response
+
+    async def ainvoke(self, messages):
+        response, delay = self._reply(messages)
+        await asyncio.sleep(delay)
+        return response
+
+
+class MockReliefWeb:
+    """
+    A local ReliefWeb API and report site, served from a background thread.
+
+    Reports are derived from a hash of the query, so the same question always
+    gets the same reports and pages, and different questions different ones.
+
+    Args:
+        api_seconds (float): Delay of each API call.
+        page_seconds (float): Delay of each report page.
+        paragraphs (int): Paragraphs per report page.
+    """
+
+    def __init__(self, api_seconds: float, page_seconds: float, paragraphs: int):
+        self.api_seconds = api_seconds
+        self.page_seconds = page_seconds
+        self.paragraphs = paragraphs
+        self.loop = asyncio.new_event_loop()
+        self.url = None
+        self.calls = {"api": 0, "pages": 0}
+
+    def _report(self, seed: str, index: int) -> dict:
+        report_id = int(hashlib.sha256(f"{seed}:{index}".encode()).hexdigest()[:8], 16)
+        country, lat, lon = COUNTRIES[report_id % len(COUNTRIES)]
+        return {
+            "id": report_id,
+            "title": f"{country} floods situation report {index}",
+            "url": f"{self.url}/page/{report_id}",
+            "date": {"created": f"2024-{1 + report_id % 12:02d}-01T00:00:00+00:00"},
+            "format": [{"name": "Situation Report" if index % 2 else "News and Press Release"}],
+            "primary_country": {"name": country, "location": {"lat": lat, "lon": lon}},
+            "source": [{"name": "OCHA"}],
+            "disaster": [{"id": report_id % 100, "type": [{"name": "Flood", "primary": True}]}],
+        }
+
+    async def _api(self, request: web.Request) -> web.Response:
+        self.calls["api"] += 1
+        query = await request.json()
+        await asyncio.sleep(self.api_seconds)
+        seed = json.dumps(query.get("query"), sort_keys=True)
+        limit = query.get("limit", 10)
+        data = [{"id": str(i), "fields": self._report(seed, i)} for i in range(limit)]
+        if request.match_info["endpoint"] == "disasters":
+            for item in data:
+                item["fields"]["name"] = item["fields"].pop("title")
+        return web.json_response({"totalCount": len(data), "count": len(data), "data": data})
+
+    async def _page(self, request: web.Request) -> web.Response:
+        self.calls["pages"] += 1
+        await asyncio.sleep(self.page_seconds)
+        report_id = int(request.match_info["id"])
+        words = random.Random(report_id)
+        paragraphs = [
+            f"<p>{report_id % 500} people were killed and {report_id % 90000} people have "
+            f"been displaced. {' '.join(words.choices(FILLER_WORDS, k=40))}.</p>"
+            for _ in range(self.paragraphs)
+        ]
+        html = f"<html><body>{''.join(paragraphs)}</body></html>"
+        return web.Response(text=html, content_type="text/html")
+
+    def start(self) -> str:
+        """
+        Starts the server on a free local port and returns its API base URL.
+        """
+        app = web.Application()
+        app.router.add_post("/v1/{endpoint}", self._api)
+        app.router.add_get("/page/{id}", self._page)
+        runner = web.AppRunner(app, access_log=None)
+        self.loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return f"{self.url}/v1"
+
+
+def load_questions(path: str = None) -> list:
+    """
+    Reads questions from a JSON-lines file (a "question", "title" or "body" field
+    per line) or a plain text file (one question per line).
+    """
+    if path is None:
+        return list(DEFAULT_QUESTIONS)
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                questions.append(line)
+                continue
+            if isinstance(item, dict):
+                item = item.get("question") or item.get("title") or item.get("body")
+            if item:
+                questions.append(str(item))
+    return questions
+
+
+def percentiles(values: list) -> dict:
+    """
+    Returns the count, p50, p95, p99 and max of a list of latencies (nearest rank).
+    """
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def rank(p):
+        return round(values[min(int(p / 100 * len(values)), len(values) - 1)], 4)
+
+    return {
+        "count": len(values),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": round(values[-1], 4),
+    }
+
+
+def run_load_test(
+    pipeline, questions: list, requests: int, concurrency: int, rate: float, seed: int = 0
+) -> dict:
+    """
+    Replays questions against the pipeline.
+
+    Args:
+        pipeline (Pipeline): The answering pipeline.
+        questions (list): The questions, replayed in a cycle.
+        requests (int): Questions sent in total.
+        concurrency (int): Questions in flight at most.
+        rate (float): Mean arrivals per second, as a Poisson process. 0 queues every question at once, so concurrency alone sets the pace.
+        seed (int, optional): Seed of the arrival times. Defaults to 0.
+
+    Returns:
+        dict: Throughput, error count, and latency percentiles overall, per stage and for queueing before start.
+    """
+    arrivals = random.Random(seed)
+    totals, queued, errors = [], [], []
+    stages = {}
+    lock = threading.Lock()
+
+    def answer(question: str, arrived: float):
+        started = time.perf_counter()
+        try:
+            result = pipeline.run(question=question, chat_history=[], history_summary="")
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        finished = time.perf_counter()
+        with lock:
+            queued.append(started - arrived)
+            totals.append(finished - arrived)
+            for name, timing in result["timings"]["stages"].items():
+                stages.setdefault(name, []).append(timing["seconds"])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        next_arrival = start
+        futures = []
+        for i in range(requests):
+            if rate > 0:
+                next_arrival += arrivals.expovariate(rate)
+                time.sleep(max(next_arrival - time.perf_counter(), 0))
+            question = questions[i % len(questions)]
+            futures.append(executor.submit(answer, question, time.perf_counter()))
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "completed": len(totals),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(totals) / wall, 3) if wall else 0,
+        "latency": percentiles(totals),
+        "queue_wait": percentiles(queued),
+        "stages": {name: percentiles(values) for name, values in stages.items()},
+    }
+
+
+async def run_server_load_test(
+    app: web.Application,
+    questions: list,
+    requests: int,
+    concurrency: int,
+    rate: float,
+    deadline_seconds: float = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Replays questions against POST /ask of the web application, served locally.
+
+    Args:
+        app (web.Application): The application, from server.create_app.
+        questions (list): The questions, replayed in a cycle.
+        requests (int): Questions sent in total.
+        concurrency (int): Questions in flight at most. Above the server's workers and queue, some are rejected with 429.
+        rate (float): Mean arrivals per second, as a Poisson process. 0 sends every question at once.
+        deadline_seconds (float, optional): X-Deadline-Seconds of each question. Defaults to the server's default.
+        seed (int, optional): Seed of the arrival times. Defaults to 0.
+
+    Returns:
+        dict: Throughput, error count, latency percentiles of answered questions and
+        per response status, and the server's /health at the end of the run.
+    """
+    arrivals = random.Random(seed)
+    statuses, errors = {}, []
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {} if deadline_seconds is None else {"X-Deadline-Seconds": str(deadline_seconds)}
+
+    # No connection limit on the client side; the server's admission queue is what is tested.
+    async with TestClient(TestServer(app), connector=aiohttp.TCPConnector(limit=0)) as client:
+
+        async def ask(question: str, arrived: float):
+            async with semaphore:
+                try:
+                    async with client.post("/ask", json={"question": question}, headers=headers) as response:
+                        await response.read()
+                        status = response.status
+                except Exception as e:
+                    errors.append(repr(e))
+                    return
+            statuses.setdefault(status, []).append(time.perf_counter() - arrived)
+
+        start = time.perf_counter()
+        next_arrival = start
+        tasks = []
+        for i in range(requests):
+            if rate > 0:
+                next_arrival += arrivals.expovariate(rate)
+                await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+            question = questions[i % len(questions)]
+            tasks.append(asyncio.create_task(ask(question, time.perf_counter())))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+
+        async with client.get("/health") as response:
+            health = await response.json()
+
+    answered = statuses.get(200, [])
+    return {
+        "requests": requests,
+        "completed": len(answered),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(answered) / wall, 3) if wall else 0,
+        "latency": percentiles(answered),
+        "statuses": {str(status): percentiles(values) for status, values in sorted(statuses.items())},
+        "health": health,
+    }
+
+
+def print_server_report(report: dict):
+    print(
+        f"\n{report['completed']}/{report['requests']} answered, {report['errors']} errors, "
+        f"{report['wall_seconds']}s, {report['throughput_per_second']} answers/s"
+    )
+    print(f"{'status':28} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for status, stats in report["statuses"].items():
+        print(
+            f"{status:28} {stats['count']:6d} {stats['p50']:8.3f} {stats['p95']:8.3f} "
+            f"{stats['p99']:8.3f} {stats['max']:8.3f}"
+        )
+    for error in report["first_errors"]:
+        print(f"ERROR {error}")
+
+
+def print_report(report: dict):
+    print(
+        f"\n{report['completed']}/{report['requests']} answered, {report['errors']} errors, "
+        f"{report['wall_seconds']}s, {report['throughput_per_second']} answers/s"
+    )
+    rows = [("total", report["latency"]), ("queue wait", report["queue_wait"])]
+    rows += sorted(report["stages"].items(), key=lambda item: -item[1].get("p50", 0))
+    print(f"{'':28} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, stats in rows:
+        if stats["count"]:
+            print(
+                f"{name:28} {stats['count']:6d} {stats['p50']:8.3f} {stats['p95']:8.3f} "
+                f"{stats['p99']:8.3f} {stats['max']:8.3f}"
+            )
+    for error in report["first_errors"]:
+        print(f"ERROR {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("questions", nargs="?", help="JSON-lines or text file of questions")
+    parser.add_argument("--requests", type=int, default=50, help="questions sent in total")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions in flight at most")
+    parser.add_argument("--rate", type=float, default=0, help="arrivals per second (0: all questions queued at once)")
+    parser.add_argument("--stage-workers", type=int, default=8, help="stage threads per question")
+    parser.add_argument("--small-first-token", type=float, default=0.1)
+    parser.add_argument("--small-token", type=float, default=0.005)
+    parser.add_argument("--large-first-token", type=float, default=0.3)
+    parser.add_argument("--large-token", type=float, default=0.02)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.2, help="mock ReliefWeb API delay")
+    parser.add_argument("--page-latency", type=float, default=0.1, help="mock report page delay")
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per report page")
+    parser.add_argument("--warm-caches", action="store_true", help="keep the response cache on")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    parser.add_argument("--server", action="store_true", help="post the questions to /ask of the web application")
+    parser.add_argument("--workers", type=int, default=8, help="server workers (with --server)")
+    parser.add_argument("--max-queue", type=int, default=32, help="server queue length (with --server)")
+    parser.add_argument("--deadline", type=float, help="X-Deadline-Seconds of each question (with --server)")
+    args = parser.parse_args()
+
+    mock_reliefweb = MockReliefWeb(args.api_latency, args.page_latency, args.paragraphs)
+    os.environ["RELIEFWEB_API_URL"] = mock_reliefweb.start()
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    for name, filename in [
+        ("CORPUS_PATH", "corpus"),
+        ("DEDUP_INDEX_PATH", "dedup_index.json"),
+        ("SUMMARY_CACHE_PATH", "summaries.jsonl"),
+        ("IMPACT_FIGURES_PATH", "impact_figures"),
+        ("BOILERPLATE_PATH", "boilerplate.json"),
+        ("DISASTER_SNAPSHOT_PATH", "disasters_snapshot.json"),
+        ("PDF_CACHE_DIR", "pdf_text"),
+        ("RECORDS_DATASET_PATH", "records"),
+        ("TEMPLATE_BYTECODE_CACHE", "jinja2"),
+    ]:
+        os.environ[name] = os.path.join(scratch, filename)
+    if not args.warm_caches:
+        os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+    os.environ["WORKERS"] = str(args.workers)
+    os.environ["MAX_QUEUE"] = str(args.max_queue)
+
+    # Imported only now, so the modules pick up the mock API and scratch paths.
+    from model_router import ModelRouter
+    from pipeline import build_assistant_pipeline
+
+    router = ModelRouter(
+        models={
+            "small": MockChatModel(args.small_first_token, args.small_token, args.answer_tokens),
+            "large": MockChatModel(args.large_first_token, args.large_token, args.answer_tokens),
+        }
+    )
+    questions = load_questions(args.questions)
+
+    if args.server:
+        from server import create_app
+
+        report = asyncio.run(
+            run_server_load_test(
+                create_app(router), questions, args.requests, args.concurrency, args.rate, args.deadline
+            )
+        )
+    else:
+        pipeline = build_assistant_pipeline(router, max_workers=args.stage_workers)
+        report = run_load_test(pipeline, questions, args.requests, args.concurrency, args.rate)
+    report["mock_reliefweb_calls"] = dict(mock_reliefweb.calls)
+    report["models"] = router.stats()
+    (print_server_report if args.server else print_report)(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
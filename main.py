@@ -1,5 +1,6 @@
 import json
-import requests
+
+import http_client
 from typing import List, Dict
 from transformers import pipeline
 import spacy
@@ -21,7 +22,7 @@ def fetch_disaster_reports(query: str) -> List[Dict]:
     Returns:
         List[Dict]: A list of reports in JSON format.
     """
-    response = requests.get(f"{RELIEFWEB_API_URL}?q={query}")
+    response = http_client.get(f"{RELIEFWEB_API_URL}?q={query}")
     if response.status_code == 200:
         return response.json().get('data', [])
     else:
@@ -1,6 +1,7 @@
 import os
 import api
 import getpass
+import http_client
 from langchain.chains import LLMChain
 from langchain_core.tools import Tool
 from langchain_mistralai import ChatMistralAI
@@ -15,7 +16,7 @@ tools = Tool(
 
 # Initialize the model with tools
 os.environ["MISTRAL_API_KEY"] = getpass.getpass()
-llm = ChatMistralAI(model="mistral-large-latest")
+llm = ChatMistralAI(model="mistral-large-latest", **http_client.mistral_client_kwargs())
 llm_with_tools = llm.bind_tools([tools])
 
 # Define the prompt template
@@ -0,0 +1,265 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from langchain_mistralai import ChatMistralAI
+
+import http_client
+import prompt_templates
+from profiling import profiled
+
+# Model and price (USD per million input/output tokens) of each tier.
+TIERS = {
+    "small": {
+        "model": os.environ.get("SMALL_MODEL", "mistral-small-latest"),
+        "input_cost": 0.2,
+        "output_cost": 0.6,
+    },
+    "large": {
+        "model": os.environ.get("LARGE_MODEL", "mistral-large-latest"),
+        "input_cost": 2.0,
+        "output_cost": 6.0,
+    },
+}
+# The tier a failed call is retried on.
+ESCALATION = {"small": "large"}
+DEFAULT_TIER = "large"
+
+# Extraction and scoring stages run on the small model; only the answer needs the large one.
+TEMPLATE_TIERS = {
+    "extract_query_from_question": "small",
+    "extract_entities": "small",
+    "create_Reliefweb_query": "small",
+    "summarize_basic": "small",
+    "summarize_cod": "small",
+    "groundedness_check": "small",
+    "respones": "large",
+}
+
+# Latencies kept per tier for the percentiles in stats().
+LATENCY_SAMPLES = 1000
+MAX_QUERY_CHARS = 200
+
+
+def _single_line(text: str):
+    if not text or "\n" in text.strip():
+        raise ValueError("Expected a single non-empty line")
+
+
+def _entities(text: str):
+    entities = json.loads(text)
+    if not isinstance(entities, list):
+        raise ValueError("Expected a JSON array")
+    for entity in entities:
+        if not isinstance(entity, dict) or not isinstance(entity.get("entity"), str):
+            raise ValueError(f"Invalid entity: {entity!r}")
+        if entity.get("entity_type") not in ("disaster_type", "location"):
+            raise ValueError(f"Invalid entity type: {entity.get('entity_type')!r}")
+
+
+def _query(text: str):
+    _single_line(text)
+    if len(text) > MAX_QUERY_CHARS:
+        raise ValueError(f"Query longer than {MAX_QUERY_CHARS} characters")
+
+
+def _score(text: str):
+    words = text.split()
+    if not words or not words[0].isdigit() or not 1 <= int(words[0]) <= 5:
+        raise ValueError("Expected a score between 1 and 5")
+
+
+# Checks on each template's output. They raise ValueError (json.JSONDecodeError is
+# one) when the output can't be used, which makes the router escalate.
+VALIDATORS = {
+    "extract_query_from_question": _query,
+    "extract_entities": _entities,
+    "create_Reliefweb_query": _query,
+    "groundedness_check": _score,
+}
+
+
+def _token_usage(response) -> tuple:
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class ModelRouter:
+    """
+    Sends each prompt template to the model tier it needs.
+
+    Cheap stages go to the small model. When its output fails the template's
+    validator, the call is retried on the next tier up (see ESCALATION). Latency,
+    tokens and cost are tracked per tier.
+
+    Args:
+        models (dict, optional): Chat model per tier. Tiers missing here are created from TIERS on first use.
+        template_tiers (dict, optional): Tier per template. Defaults to TEMPLATE_TIERS.
+    """
+
+    def __init__(self, models: dict = None, template_tiers: dict = TEMPLATE_TIERS):
+        self.models = dict(models or {})
+        self.template_tiers = template_tiers
+        self.lock = threading.Lock()
+        self.stats_by_tier = {}
+
+    @classmethod
+    def for_model(cls, llm) -> "ModelRouter":
+        """
+        Returns a router that sends every template to the same chat model.
+        """
+        return cls(models={tier: llm for tier in TIERS})
+
+    def tier_for(self, template: str) -> str:
+        return self.template_tiers.get(template, DEFAULT_TIER)
+
+    def model(self, tier: str):
+        """
+        Returns the chat model of a tier, creating it on first use.
+        """
+        with self.lock:
+            if tier not in self.models:
+                self.models[tier] = ChatMistralAI(
+                    model=TIERS[tier]["model"],
+                    temperature=0,
+                    **http_client.mistral_client_kwargs(),
+                )
+            return self.models[tier]
+
+    def _record(self, tier: str, seconds: float, response=None, failed: bool = False, escalated: bool = False):
+        input_tokens, output_tokens = _token_usage(response) if response is not None else (0, 0)
+        price = TIERS.get(tier, {})
+        cost = (
+            input_tokens * price.get("input_cost", 0) + output_tokens * price.get("output_cost", 0)
+        ) / 1_000_000
+        with self.lock:
+            stats = self.stats_by_tier.setdefault(
+                tier,
+                {
+                    "calls": 0,
+                    "failures": 0,
+                    "escalations": 0,
+                    "seconds": 0.0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "cost": 0.0,
+                    "latencies": collections.deque(maxlen=LATENCY_SAMPLES),
+                },
+            )
+            stats["calls"] += 1
+            stats["failures"] += failed
+            stats["escalations"] += escalated
+            stats["seconds"] += seconds
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost"] += cost
+            stats["latencies"].append(seconds)
+
+    def _check(self, template: str, tier: str, response) -> bool:
+        validator = VALIDATORS.get(template)
+        if validator is None:
+            return True
+        try:
+            validator(response.content.strip())
+        except ValueError as e:
+            print(f"ROUTER {template} output from {tier} failed validation: {e}")
+            return False
+        return True
+
+    @profiled("llm")
+    def invoke_messages(self, template: str, messages: list):
+        """
+        Calls the model of the template's tier, escalating while the output fails validation.
+
+        Args:
+            template (str): The prompt template the messages were rendered from.
+            messages (list): The chat messages.
+
+        Returns:
+            The model's reply message. If every tier failed validation, the last tier's reply.
+        """
+        tier = self.tier_for(template)
+        while True:
+            start = time.perf_counter()
+            response = self.model(tier).invoke(messages)
+            valid = self._check(template, tier, response)
+            escalate = not valid and tier in ESCALATION
+            self._record(tier, time.perf_counter() - start, response, not valid, escalate)
+            if not escalate:
+                return response
+            tier = ESCALATION[tier]
+
+    @profiled("llm")
+    async def ainvoke_messages(self, template: str, messages: list):
+        """
+        Async counterpart of invoke_messages.
+        """
+        tier = self.tier_for(template)
+        while True:
+            start = time.perf_counter()
+            response = await self.model(tier).ainvoke(messages)
+            valid = self._check(template, tier, response)
+            escalate = not valid and tier in ESCALATION
+            self._record(tier, time.perf_counter() - start, response, not valid, escalate)
+            if not escalate:
+                return response
+            tier = ESCALATION[tier]
+
+    def complete(self, template: str, **variables) -> str:
+        """
+        Renders a template and returns the routed model's reply text.
+        """
+        messages = prompt_templates.render_messages(template, **variables)
+        return self.invoke_messages(template, messages).content.strip()
+
+    def bind(self, template: str) -> "RoutedModel":
+        """
+        Returns a chat-model-like object whose calls are routed as the given template.
+
+        For code that takes a LangChain chat model, such as summarize.summarize_reports.
+        """
+        return RoutedModel(self, template)
+
+    def stats(self) -> dict:
+        """
+        Returns calls, validation failures, escalations, latency (mean, p50, p95),
+        tokens and cost in USD per tier.
+        """
+        with self.lock:
+            result = {}
+            for tier, stats in self.stats_by_tier.items():
+                latencies = sorted(stats["latencies"])
+                result[tier] = {
+                    "model": TIERS.get(tier, {}).get("model"),
+                    "calls": stats["calls"],
+                    "failures": stats["failures"],
+                    "escalations": stats["escalations"],
+                    "mean_seconds": round(stats["seconds"] / stats["calls"], 4),
+                    "p50_seconds": round(latencies[len(latencies) // 2], 4),
+                    "p95_seconds": round(latencies[int(len(latencies) * 0.95)], 4),
+                    "input_tokens": stats["input_tokens"],
+                    "output_tokens": stats["output_tokens"],
+                    "cost": round(stats["cost"], 6),
+                }
+            return result
+
+
+class RoutedModel:
+    """
+    A template bound to a ModelRouter, with the invoke/ainvoke interface of a chat model.
+    """
+
+    def __init__(self, router: ModelRouter, template: str):
+        self.router = router
+        self.template = template
+
+    def invoke(self, messages):
+        return self.router.invoke_messages(self.template, messages)
+
+    async def ainvoke(self, messages):
+        return await self.router.ainvoke_messages(self.template, messages)
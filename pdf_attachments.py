@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+from pypdf import PdfReader
+
+import fetch_scheduler
+
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", "cache/pdf_text")
+# Downloads larger than this are abandoned.
+MAX_PDF_BYTES = 50 * 1024 * 1024
+MAX_PAGES = 30
+MAX_CHARS = 50000
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT_SECONDS = 60
+PROCESS_WORKERS = 2
+# Restart parser processes regularly so memory from large documents is released.
+TASKS_PER_PROCESS = 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to parse PDFs, creating it on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS, max_tasks_per_child=TASKS_PER_PROCESS
+            )
+        return _pool
+
+
+def download_pdf(url: str, max_bytes: int = MAX_PDF_BYTES):
+    """
+    Streams a PDF to a temporary file, hashing it on the way.
+
+    Args:
+        url (str): The attachment URL.
+        max_bytes (int, optional): Size limit. Defaults to MAX_PDF_BYTES.
+
+    Returns:
+        tuple: (path, sha256 hex digest) of the downloaded file, or (None, None) if the download failed, timed out or was too large.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    path = None
+    try:
+        with fetch_scheduler.stream("GET", url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+            if response.status_code != 200:
+                print(f"Error: could not download {url} ({response.status_code})")
+                return None, None
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                path = f.name
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError(f"larger than {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+    # FetchDeadlineExceeded is a TimeoutError: the job ran out of time while queued.
+    except (httpx.HTTPError, TimeoutError, ValueError) as e:
+        print(f"Error: could not download {url}: {e}")
+        if path is not None:
+            os.remove(path)
+        return None, None
+    return path, digest.hexdigest()
+
+
+def extract_pdf_text(path: str, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> list:
+    """
+    Extracts text from a PDF page by page, within page and character budgets.
+
+    Pages are read one at a time from the file, so memory depends on the largest
+    page rather than the document. Runs in the parser process pool.
+
+    Args:
+        path (str): The PDF file.
+        max_pages (int, optional): Pages to read at most. Defaults to MAX_PAGES.
+        max_chars (int, optional): Characters to return at most. Defaults to MAX_CHARS.
+
+    Returns:
+        list: The text of each page read.
+    """
+    pages = []
+    total = 0
+    reader = PdfReader(path)
+    for index, page in enumerate(reader.pages):
+        if index >= max_pages or total >= max_chars:
+            break
+        text = (page.extract_text() or "").strip()
+        text = text[: max_chars - total]
+        if text:
+            pages.append(text)
+            total += len(text)
+    return pages
+
+
+def _cache_path(digest: str, max_pages: int, max_chars: int) -> str:
+    return os.path.join(PDF_CACHE_DIR, f"{digest}-{max_pages}-{max_chars}.json")
+
+
+def get_pdf_text(url: str, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> list:
+    """
+    Downloads a PDF and returns its text, cached by file hash.
+
+    Args:
+        url (str): The attachment URL.
+        max_pages (int, optional): Pages to read at most. Defaults to MAX_PAGES.
+        max_chars (int, optional): Characters to return at most. Defaults to MAX_CHARS.
+
+    Returns:
+        list: The text of each page read, or an empty list if the PDF could not be downloaded or read.
+    """
+    path, digest = download_pdf(url)
+    if path is None:
+        return []
+    try:
+        cache_path = _cache_path(digest, max_pages, max_chars)
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        try:
+            pages = get_pool().submit(extract_pdf_text, path, max_pages, max_chars).result()
+        except Exception as e:
+            print(f"Error: could not parse {url}: {e}")
+            return []
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(pages, f)
+        return pages
+    finally:
+        os.remove(path)
+
+
+def get_attachment_text(fields: dict, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> list:
+    """
+    Returns the text of a report's PDF attachments, up to a shared character budget.
+
+    Args:
+        fields (dict): The report fields, with the "file" attachments list.
+        max_pages (int, optional): Pages to read at most per attachment. Defaults to MAX_PAGES.
+        max_chars (int, optional): Characters to return at most in total. Defaults to MAX_CHARS.
+
+    Returns:
+        list: The text of each page read.
+    """
+    pages = []
+    remaining = max_chars
+    for attachment in fields.get("file", []):
+        url = attachment.get("url", "")
+        if attachment.get("mimetype") != "application/pdf" and not url.lower().endswith(".pdf"):
+            continue
+        if remaining <= 0:
+            break
+        attachment_pages = get_pdf_text(url, max_pages, remaining)
+        pages.extend(attachment_pages)
+        remaining -= sum(len(page) for page in attachment_pages)
+    return pages
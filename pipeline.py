@@ -0,0 +1,344 @@
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cachetools import LRUCache
+
+import prompt_templates
+from disaster_snapshot import get_rweb_disasters_data
+from impact_figures import record_impact_figures
+from model_router import ModelRouter
+from reliefweb import get_query_data, query_params
+from summarize import summarize_reliefweb_data
+
+MAX_WORKERS = 8
+MEMO_SIZE = 1024
+
+
+class Stage:
+    """
+    A pipeline step: a function from named inputs to named outputs.
+
+    Args:
+        name (str): The stage name.
+        func (callable): Called with the inputs as keyword arguments. Returns a dict
+            with the outputs, or a single value when the stage has one output.
+        inputs (list): Names of the values the stage reads.
+        outputs (list): Names of the values the stage produces.
+        memoize (bool, optional): Reuse the outputs of an earlier run with the same inputs. Defaults to True.
+    """
+
+    def __init__(self, name: str, func, inputs: list, outputs: list, memoize: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.memoize = memoize
+
+
+class Pipeline:
+    """
+    Runs stages as a DAG: each stage starts as soon as all of its inputs exist.
+
+    Stages whose inputs are ready at the same time run concurrently on a thread
+    pool. Outputs are memoized per stage, keyed by a hash of the stage's inputs,
+    and every run reports per-stage timings and its critical path.
+    """
+
+    def __init__(self, stages: list, max_workers: int = MAX_WORKERS, memo_size: int = MEMO_SIZE):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.memo = LRUCache(maxsize=memo_size)
+        self.lock = threading.Lock()
+
+        self.producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(
+                        f"Output {output} is produced by both {self.producers[output]} and {stage.name}"
+                    )
+                self.producers[output] = stage.name
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle through stage {name}")
+            visiting.add(name)
+            for value in self.stages[name].inputs:
+                if value in self.producers:
+                    visit(self.producers[value])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _memo_key(self, stage: Stage, inputs: dict) -> str:
+        encoded = json.dumps(inputs, sort_keys=True, default=str)
+        return f"{stage.name}:{hashlib.sha256(encoded.encode('utf-8')).hexdigest()}"
+
+    def _run_stage(self, stage: Stage, inputs: dict):
+        start = time.perf_counter()
+        key = self._memo_key(stage, inputs) if stage.memoize else None
+        with self.lock:
+            outputs = self.memo.get(key) if key else None
+        cached = outputs is not None
+        if not cached:
+            result = stage.func(**inputs)
+            if len(stage.outputs) == 1 and not (
+                isinstance(result, dict) and set(result) == set(stage.outputs)
+            ):
+                result = {stage.outputs[0]: result}
+            outputs = {name: result[name] for name in stage.outputs}
+            if key:
+                with self.lock:
+                    self.memo[key] = outputs
+        return outputs, time.perf_counter() - start, cached
+
+    def run(self, **values) -> dict:
+        """
+        Runs every stage that can be reached from the given values.
+
+        Args:
+            **values: The initial values, e.g. question and chat_history.
+
+        Returns:
+            dict: "values" with every value produced, and "timings" with the wall
+            time, each stage's start, duration and whether it was memoized, and the
+            critical path (the chain of stages that determined the wall time).
+
+        Raises:
+            ValueError: If some stages can never run because an input is missing.
+        """
+        run_start = time.perf_counter()
+        values = dict(values)
+        timings = {}
+        finished_at = {}
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(value in values for value in stage.inputs):
+                        inputs = {value: values[value] for value in stage.inputs}
+                        started = time.perf_counter() - run_start
+                        # Stages run in the caller's context, e.g. its fetch priority.
+                        future = executor.submit(
+                            contextvars.copy_context().run, self._run_stage, stage, inputs
+                        )
+                        running[future] = (name, started)
+                        del pending[name]
+                if not running:
+                    missing = {
+                        name: [v for v in stage.inputs if v not in values]
+                        for name, stage in pending.items()
+                    }
+                    raise ValueError(f"Stages cannot run, missing inputs: {missing}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, started = running.pop(future)
+                    outputs, duration, cached = future.result()
+                    values.update(outputs)
+                    finished_at[name] = time.perf_counter() - run_start
+                    timings[name] = {
+                        "start": round(started, 4),
+                        "seconds": round(duration, 4),
+                        "memoized": cached,
+                    }
+
+        return {
+            "values": values,
+            "timings": {
+                "total_seconds": round(time.perf_counter() - run_start, 4),
+                "stages": timings,
+                "critical_path": self._critical_path(finished_at),
+            },
+        }
+
+    def _critical_path(self, finished_at: dict) -> list:
+        # Walk back from the last stage to finish, each time through the input
+        # producer that finished last (the one the stage was waiting on).
+        if not finished_at:
+            return []
+        path = [max(finished_at, key=finished_at.get)]
+        while True:
+            producers = [
+                self.producers[value]
+                for value in self.stages[path[-1]].inputs
+                if value in self.producers and self.producers[value] in finished_at
+            ]
+            if not producers:
+                return list(reversed(path))
+            path.append(max(producers, key=finished_at.get))
+
+
+def build_assistant_pipeline(llm=None, max_workers: int = MAX_WORKERS) -> Pipeline:
+    """
+    Wires the AssistantTemplates into a pipeline answering a question from ReliefWeb data.
+
+    Stages: extract_query_from_question, extract_entities, create_Reliefweb_query,
+    then fetch_reports and fetch_disasters concurrently, summarize_reports (one
+    summarize_basic call per report, concurrently) alongside extract_impact_figures
+    (stored in the impact figure table), respond from the summaries and figures,
+    and groundedness_check against them.
+
+    Each template is sent to its model tier through a ModelRouter, so the
+    extraction stages run on the small model and only respond on the large one.
+
+    Args:
+        llm (optional): A ModelRouter, or a LangChain chat model to use for every stage. Defaults to a ModelRouter with the default tiers.
+        max_workers (int, optional): Stages run at once. Defaults to MAX_WORKERS.
+
+    Returns:
+        Pipeline: Run it with question, chat_history and history_summary.
+    """
+
+    if llm is None:
+        router = ModelRouter()
+    elif isinstance(llm, ModelRouter):
+        router = llm
+    else:
+        router = ModelRouter.for_model(llm)
+
+    def extract_query(question, chat_history, history_summary):
+        return router.complete(
+            "extract_query_from_question",
+            question=question,
+            chat_history=chat_history,
+            history_summary=history_summary,
+        )
+
+    def extract_entities(search_query):
+        text = router.complete("extract_entities", text=search_query)
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return []
+
+    def create_query(entities, search_query):
+        if not entities:
+            return search_query
+        messages = prompt_templates.render_messages("create_Reliefweb_query")
+        messages.append(("user", json.dumps(entities)))
+        return router.invoke_messages("create_Reliefweb_query", messages).content.strip().strip('"')
+
+    def fetch_reports(reliefweb_query):
+        return get_query_data(reliefweb_query)
+
+    def fetch_disasters(reliefweb_query):
+        params = query_params(reliefweb_query)
+        # Years are left out: a disaster is dated by when it began, and one still
+        # ongoing in the year asked about may have begun before it. Answered from
+        # the local snapshot, whose description stands in for the scraped page.
+        return get_rweb_disasters_data(
+            keyword=params["keyword"],
+            disaster_type=params.get("disaster_type"),
+            limit=1,
+            detailed_query=True,
+        )
+
+    def summarize_reports(reports):
+        return summarize_reliefweb_data(
+            reports, router.bind("summarize_basic"), max_workers=max_workers
+        )
+
+    def extract_impact_figures(reports):
+        return record_impact_figures(reports)
+
+    def respond(
+        question, report_summaries, disasters, impact_figures, chat_history, history_summary
+    ):
+        return router.complete(
+            "respones",
+            question=question,
+            reliefweb_data=(
+                f"{report_summaries}\n\n{disasters}\n\nImpact figures:\n{impact_figures}"
+            ),
+            chat_history=chat_history,
+            history_summary=history_summary,
+        )
+
+    def groundedness(report_summaries, answer):
+        score = router.complete(
+            "groundedness_check",
+            context=json.dumps(report_summaries),
+            answer=json.dumps(answer),
+        )
+        try:
+            return int(score.split()[0])
+        except (ValueError, IndexError):
+            return None
+
+    stages = [
+        Stage(
+            "extract_query_from_question",
+            extract_query,
+            ["question", "chat_history", "history_summary"],
+            ["search_query"],
+        ),
+        Stage("extract_entities", extract_entities, ["search_query"], ["entities"]),
+        Stage(
+            "create_Reliefweb_query",
+            create_query,
+            ["entities", "search_query"],
+            ["reliefweb_query"],
+        ),
+        # Fetches are not memoized here: the response cache already keeps them, with a TTL.
+        Stage("fetch_reports", fetch_reports, ["reliefweb_query"], ["reports"], memoize=False),
+        Stage(
+            "fetch_disasters",
+            fetch_disasters,
+            ["reliefweb_query"],
+            ["disasters"],
+            memoize=False,
+        ),
+        # Summaries are cached by report id and body hash in the summary cache.
+        Stage(
+            "summarize_reports",
+            summarize_reports,
+            ["reports"],
+            ["report_summaries"],
+            memoize=False,
+        ),
+        # Figures are parsed from the full bodies, before summaries drop them.
+        Stage(
+            "extract_impact_figures",
+            extract_impact_figures,
+            ["reports"],
+            ["impact_figures"],
+            memoize=False,
+        ),
+        Stage(
+            "respond",
+            respond,
+            [
+                "question",
+                "report_summaries",
+                "disasters",
+                "impact_figures",
+                "chat_history",
+                "history_summary",
+            ],
+            ["answer"],
+            memoize=False,
+        ),
+        Stage(
+            "groundedness_check",
+            groundedness,
+            ["report_summaries", "answer"],
+            ["groundedness"],
+            memoize=False,
+        ),
+    ]
+    return Pipeline(stages, max_workers=max_workers)
@@ -0,0 +1,258 @@
+import cProfile
+import functools
+import inspect
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+
+# Opt-in: with PROFILE_MEMORY unset, profiled() returns functions unchanged.
+PROFILE_MEMORY = os.environ.get("PROFILE_MEMORY", "0") == "1"
+# Directory for one cProfile dump per request (outermost profiled call), if set.
+PROFILE_CPROFILE_DIR = os.environ.get("PROFILE_CPROFILE_DIR")
+# Allocation sites reported per stage.
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "10"))
+# Frames kept per allocation. More frames show who called into bs4 or json, at a higher cost.
+PROFILE_TRACEBACK_FRAMES = int(os.environ.get("PROFILE_TRACEBACK_FRAMES", "1"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Allocations of the profilers themselves are left out of the reports.
+_IGNORED = [
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _rss() -> int:
+    """
+    Returns the resident set size of the process in bytes.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return _max_rss()
+
+
+def _max_rss() -> int:
+    """
+    Returns the peak resident set size of the process in bytes.
+    """
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _mb(size: int) -> float:
+    return round(size / 2**20, 2)
+
+
+class MemoryProfiler:
+    """
+    Records memory use per stage of the data path: get_rweb_data, get_data and the LLM calls.
+
+    Each profiled call takes a tracemalloc snapshot on entry and exit and keeps the
+    allocation sites that grew most in between, along with the peak of traced
+    memory during the call (which catches short-lived objects such as soup trees
+    freed before it returns) and the change in RSS and in peak RSS. Tracing is process-wide, so stages running concurrently show up
+    in each other's figures; profile one request at a time for clean numbers.
+    """
+
+    def __init__(self, top_n: int = PROFILE_TOP_N, cprofile_dir: str = PROFILE_CPROFILE_DIR):
+        self.top_n = top_n
+        self.cprofile_dir = cprofile_dir
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Calls being profiled, by id. tracemalloc has a single peak counter, so
+        # whenever it is reset its value is first folded into every open call.
+        self.open = {}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEBACK_FRAMES)
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def _fold_peak(self):
+        # Called with the lock held.
+        peak = tracemalloc.get_traced_memory()[1]
+        for begin in self.open.values():
+            begin["peak"] = max(begin["peak"], peak)
+
+    def _begin(self) -> dict:
+        begin = {
+            "snapshot": self._snapshot(),
+            "rss": _rss(),
+            "max_rss": _max_rss(),
+            "start": time.perf_counter(),
+        }
+        with self.lock:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+            begin["traced"], begin["peak"] = tracemalloc.get_traced_memory()
+            self.open[id(begin)] = begin
+        return begin
+
+    def _end(self, stage: str, begin: dict) -> dict:
+        seconds = time.perf_counter() - begin["start"]
+        with self.lock:
+            self._fold_peak()
+            del self.open[id(begin)]
+        diff = self._snapshot().compare_to(begin["snapshot"], "lineno")
+        top_sites = [
+            {
+                "site": str(stat.traceback),
+                "size_diff_mb": _mb(stat.size_diff),
+                "count_diff": stat.count_diff,
+            }
+            for stat in diff[: self.top_n]
+        ]
+        result = {
+            "seconds": round(seconds, 4),
+            "traced_diff_mb": _mb(sum(stat.size_diff for stat in diff)),
+            "traced_peak_mb": _mb(begin["peak"] - begin["traced"]),
+            "rss_diff_mb": _mb(_rss() - begin["rss"]),
+            "peak_rss_diff_mb": _mb(_max_rss() - begin["max_rss"]),
+            "top_sites": top_sites,
+        }
+        self._record(stage, result)
+        print(
+            f"PROFILE {stage} {result['seconds']}s traced {result['traced_diff_mb']:+} MB "
+            f"(peak +{result['traced_peak_mb']} MB), "
+            f"RSS {result['rss_diff_mb']:+} MB, peak RSS {result['peak_rss_diff_mb']:+} MB"
+        )
+        for site in top_sites:
+            print(f"PROFILE   {site['size_diff_mb']:+} MB ({site['count_diff']:+} blocks) {site['site']}")
+        return result
+
+    def _record(self, stage: str, result: dict):
+        with self.lock:
+            stats = self.stages.setdefault(
+                stage,
+                {
+                    "calls": 0,
+                    "traced_diff_mb": 0.0,
+                    "max_traced_peak_mb": 0.0,
+                    "max_peak_rss_diff_mb": 0.0,
+                    "last": None,
+                },
+            )
+            stats["calls"] += 1
+            stats["traced_diff_mb"] = round(stats["traced_diff_mb"] + result["traced_diff_mb"], 2)
+            stats["max_traced_peak_mb"] = max(stats["max_traced_peak_mb"], result["traced_peak_mb"])
+            stats["max_peak_rss_diff_mb"] = max(
+                stats["max_peak_rss_diff_mb"], result["peak_rss_diff_mb"]
+            )
+            stats["last"] = result
+
+    def _start_cprofile(self):
+        # One dump per request: only the outermost profiled call on a thread runs cProfile.
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+        if depth or not self.cprofile_dir:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            return None
+        return profile
+
+    def _stop_cprofile(self, stage: str, profile):
+        self.local.depth -= 1
+        if profile is None:
+            return
+        profile.disable()
+        os.makedirs(self.cprofile_dir, exist_ok=True)
+        path = os.path.join(
+            self.cprofile_dir, f"{stage}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+        )
+        profile.dump_stats(path)
+        print(f"PROFILE {stage} cProfile written to {path}")
+
+    def wrap(self, stage: str, func):
+        """
+        Returns func profiled as the given stage. Coroutine functions are supported,
+        without the cProfile dump: the event loop interleaves other requests with theirs.
+        """
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                begin = self._begin()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._end(stage, begin)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            begin = self._begin()
+            profile = self._start_cprofile()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._stop_cprofile(stage, profile)
+                self._end(stage, begin)
+
+        return wrapper
+
+    def stats(self) -> dict:
+        """
+        Returns, per stage, the calls, the total traced growth, the largest traced peak and peak RSS increase, and the last call's figures.
+        """
+        with self.lock:
+            return {stage: dict(stats) for stage, stats in self.stages.items()}
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> MemoryProfiler:
+    """
+    Returns the process-wide memory profiler, starting tracemalloc on first use.
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = MemoryProfiler()
+        return _profiler
+
+
+def profiled(stage: str):
+    """
+    Decorator that profiles a function as a stage of the data path when PROFILE_MEMORY is set.
+
+    Callers are unaffected: with profiling off the function is returned as is, so
+    it costs nothing.
+
+    Args:
+        stage (str): The name the stage is reported under.
+    """
+
+    def decorator(func):
+        if not PROFILE_MEMORY:
+            return func
+        return get_profiler().wrap(stage, func)
+
+    return decorator
+
+
+def stats() -> dict:
+    """
+    Returns the profiled stages' figures, or an empty dict if profiling is off.
+    """
+    if not PROFILE_MEMORY:
+        return {}
+    return get_profiler().stats()
@@ -0,0 +1,169 @@
+import os
+import re
+import threading
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, meta
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "AssistantTemplates")
+BYTECODE_CACHE_DIR = os.environ.get("TEMPLATE_BYTECODE_CACHE", "cache/jinja2")
+
+# Variables each template expects, with their types. Templates are checked against
+# this at load time, and render() checks the values it is given against it.
+TEMPLATE_VARIABLES = {
+    "summarize_basic": {"text": str},
+    "summarize_cod": {"text": str},
+    "groundedness_check": {"context": str, "answer": str},
+    "extract_entities": {"text": str},
+    "create_Reliefweb_query": {},
+    "extract_query_from_question": {
+        "question": str,
+        "chat_history": list,
+        "history_summary": str,
+    },
+    "respones": {
+        "question": str,
+        "reliefweb_data": str,
+        "chat_history": list,
+        "history_summary": str,
+    },
+}
+
+# Variables that may be left out of render(); they default to an empty value.
+OPTIONAL_VARIABLES = {"chat_history", "history_summary", "reliefweb_data"}
+
+_ROLE_RE = re.compile(r"^(system|user|assistant):\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+class TemplateRegistry:
+    """
+    Loads every AssistantTemplates prompt once and renders them from memory.
+
+    All templates are compiled up front into one shared Environment, backed by an
+    on-disk bytecode cache so later processes skip parsing as well. Since the
+    environment never auto-reloads, rendering never touches the disk.
+    """
+
+    def __init__(self, directory: str = TEMPLATES_DIR, variables: dict = TEMPLATE_VARIABLES):
+        os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+        self.variables = variables
+        self.environment = Environment(
+            loader=FileSystemLoader(directory),
+            bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+            auto_reload=False,
+            cache_size=-1,
+            keep_trailing_newline=True,
+        )
+        self.templates = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        Compiles every template and validates its variables.
+
+        Raises:
+            ValueError: If a template is missing or uses variables other than those declared in TEMPLATE_VARIABLES.
+        """
+        for name, expected in self.variables.items():
+            filename = f"{name}.jinja2"
+            source = self.environment.loader.get_source(self.environment, filename)[0]
+            used = meta.find_undeclared_variables(self.environment.parse(source))
+            if used != set(expected):
+                raise ValueError(
+                    f"Template {name} uses variables {sorted(used)}, expected {sorted(expected)}"
+                )
+            self.templates[name] = self.environment.get_template(filename)
+            self.stats[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def render(self, name: str, **variables) -> str:
+        """
+        Renders a template.
+
+        Args:
+            name (str): The template name, without the .jinja2 extension.
+            **variables: The template variables.
+
+        Returns:
+            str: The rendered prompt.
+
+        Raises:
+            KeyError: If the template is unknown.
+            TypeError: If a variable is missing, unexpected or of the wrong type.
+        """
+        start = time.perf_counter()
+        expected = self.variables[name]
+        for variable, expected_type in expected.items():
+            if variable not in variables:
+                if variable not in OPTIONAL_VARIABLES:
+                    raise TypeError(f"Template {name} is missing variable {variable}")
+                variables[variable] = expected_type()
+            elif not isinstance(variables[variable], expected_type):
+                raise TypeError(
+                    f"Template {name} expects {variable} to be {expected_type.__name__}, "
+                    f"got {type(variables[variable]).__name__}"
+                )
+        unexpected = set(variables) - set(expected)
+        if unexpected:
+            raise TypeError(f"Template {name} got unexpected variables {sorted(unexpected)}")
+
+        text = self.templates[name].render(**variables)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            stats = self.stats[name]
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        return text
+
+    def render_messages(self, name: str, **variables) -> list:
+        """
+        Renders a template and splits it into chat messages.
+
+        The templates use the promptflow chat format, where lines such as "system:"
+        and "user:" start a new message.
+
+        Args:
+            name (str): The template name, without the .jinja2 extension.
+            **variables: The template variables.
+
+        Returns:
+            list: (role, content) tuples, as accepted by LangChain chat models.
+        """
+        text = self.render(name, **variables)
+        parts = _ROLE_RE.split(text)
+        messages = []
+        for role, content in zip(parts[1::2], parts[2::2]):
+            content = content.strip()
+            if content:
+                messages.append((role.lower(), content))
+        return messages
+
+    def render_stats(self) -> dict:
+        """
+        Returns render counts and timings, in milliseconds, per template.
+        """
+        with self.lock:
+            return {
+                name: dict(stats, mean_ms=stats["total_ms"] / stats["count"] if stats["count"] else 0.0)
+                for name, stats in self.stats.items()
+            }
+
+
+registry = TemplateRegistry()
+
+
+def render(name: str, **variables) -> str:
+    """
+    Renders a template from the shared registry. See TemplateRegistry.render.
+    """
+    return registry.render(name, **variables)
+
+
+def render_messages(name: str, **variables) -> list:
+    """
+    Renders a template from the shared registry as chat messages. See TemplateRegistry.render_messages.
+    """
+    return registry.render_messages(name, **variables)
@@ -0,0 +1,181 @@
+import re
+
+# Words that don't change what ReliefWeb returns for an AND keyword query. Words
+# that can be part of a name ("new" in Papua New Guinea, "who" for the WHO) are kept.
+STOP_WORDS = frozenset(
+    """
+    a about after an and are as at be been by can did do does during for
+    from get give going happening has have how i in into is it its latest me news now of
+    on or please recent show since tell than that the their there these this
+    to today update updates was were what when where which why with
+    """.split()
+)
+
+# Spelling variants, plurals and short names, to one canonical form.
+ALIASES = {
+    "crises": "crisis",
+    "conflicts": "conflict",
+    "wars": "war",
+    "refugees": "refugee",
+    "famines": "famine",
+    "outbreaks": "outbreak",
+    "drc": "democratic republic of the congo",
+    "dr congo": "democratic republic of the congo",
+    "burma": "myanmar",
+    "uk": "united kingdom",
+    "usa": "united states",
+    "turkey": "türkiye",
+    "ivory coast": "côte d'ivoire",
+    "east timor": "timor-leste",
+    "swaziland": "eswatini",
+    "opt": "occupied palestinian territory",
+}
+
+# Words and phrases naming a ReliefWeb disaster type, mapped onto the type filter.
+DISASTER_TYPES = {
+    "flash flood": "Flash Flood",
+    "flash floods": "Flash Flood",
+    "flood": "Flood",
+    "floods": "Flood",
+    "flooding": "Flood",
+    "earthquake": "Earthquake",
+    "earthquakes": "Earthquake",
+    "quake": "Earthquake",
+    "drought": "Drought",
+    "droughts": "Drought",
+    "tropical cyclone": "Tropical Cyclone",
+    "cyclone": "Tropical Cyclone",
+    "cyclones": "Tropical Cyclone",
+    "hurricane": "Tropical Cyclone",
+    "hurricanes": "Tropical Cyclone",
+    "typhoon": "Tropical Cyclone",
+    "typhoons": "Tropical Cyclone",
+    "epidemic": "Epidemic",
+    "epidemics": "Epidemic",
+    "wildfire": "Wild Fire",
+    "wildfires": "Wild Fire",
+    "wild fire": "Wild Fire",
+    "forest fire": "Wild Fire",
+    "bushfire": "Wild Fire",
+    "landslide": "Land Slide",
+    "landslides": "Land Slide",
+    "mudslide": "Mud Slide",
+    "mudslides": "Mud Slide",
+    "tsunami": "Tsunami",
+    "volcano": "Volcano",
+    "volcanic eruption": "Volcano",
+    "eruption": "Volcano",
+    "heat wave": "Heat Wave",
+    "heatwave": "Heat Wave",
+    "cold wave": "Cold Wave",
+    "storm surge": "Storm Surge",
+    "avalanche": "Snow Avalanche",
+    "locust": "Insect Infestation",
+    "locusts": "Insect Infestation",
+}
+
+_TOKEN_RE = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+_YEAR_RE = re.compile(r"^(?:19|20)\d\d$")
+# Longest alias or type phrase, in words.
+_MAX_PHRASE = max(len(phrase.split()) for phrase in [*ALIASES, *DISASTER_TYPES])
+
+
+def _replace_phrases(tokens: list, phrases: dict) -> list:
+    """
+    Replaces the longest matching phrases of tokens by (value,) tuples.
+    """
+    out = []
+    i = 0
+    while i < len(tokens):
+        for n in range(min(_MAX_PHRASE, len(tokens) - i), 0, -1):
+            words = tokens[i : i + n]
+            if all(isinstance(word, str) for word in words) and " ".join(words) in phrases:
+                out.append((phrases[" ".join(words)],))
+                i += n
+                break
+        else:
+            out.append(tokens[i])
+            i += 1
+    return out
+
+
+def _words(keyword: str) -> list:
+    """
+    Returns the lowercased words of a query, aliases resolved.
+    """
+    tokens = _TOKEN_RE.findall((keyword or "").lower())
+    tokens = _replace_phrases(tokens, ALIASES)
+    return [
+        word
+        for token in tokens
+        for word in (token[0].split() if isinstance(token, tuple) else [token])
+    ]
+
+
+def ranking_keyword(keyword: str) -> str:
+    """
+    Returns the words of a query to rank reports on, in a canonical order.
+
+    Unlike the canonical keyword, years and disaster-type words are kept: they
+    move to filters for the API call, but still tell which titles match best.
+
+    Args:
+        keyword (str): The keyword query.
+
+    Returns:
+        str: The alias-resolved words without stop words, deduplicated and sorted.
+    """
+    return " ".join(sorted({word for word in _words(keyword) if word not in STOP_WORDS}))
+
+
+def canonicalize_query(
+    keyword: str, date_from: str = None, date_to: str = None, disaster_type: str = None
+) -> dict:
+    """
+    Rewrites a keyword query to a canonical form, so equivalent questions share one API call and cache entry.
+
+    The keywords are lowercased, aliases resolved, stop words dropped and the
+    rest deduplicated and sorted; the ReliefWeb query is an AND of the words, so
+    their order does not matter. Years become a date range and disaster-type
+    words become the disaster type filter, unless the caller set those already.
+    "Sudan conflict 2024" and "2024 conflict Sudan" both become keyword
+    "conflict sudan" from 2024-01-01 to the end of 2024.
+
+    Args:
+        keyword (str): The keyword query, e.g. from create_Reliefweb_query.
+        date_from (str, optional): A start date already chosen. Defaults to None.
+        date_to (str, optional): An end date already chosen. Defaults to None.
+        disaster_type (str, optional): A disaster type already chosen. Defaults to None.
+
+    Returns:
+        dict: "keyword", "date_from", "date_to" and "disaster_type", to pass on as keyword arguments.
+    """
+    tokens = _replace_phrases(_words(keyword), DISASTER_TYPES)
+
+    words, years, types = set(), [], []
+    for token in tokens:
+        if isinstance(token, tuple):
+            types.append(token[0])
+        elif _YEAR_RE.match(token):
+            years.append(int(token))
+        elif token not in STOP_WORDS:
+            words.add(token)
+
+    if years and date_from is None and date_to is None:
+        date_from = f"{min(years)}-01-01"
+        date_to = f"{max(years)}-12-31T23:59:59+00:00"
+    elif years:
+        # Dates are set already: keep the years as words rather than lose them.
+        words.update(str(year) for year in years)
+    if types and disaster_type is None:
+        disaster_type = types[0]
+        types = types[1:]
+    # Further types only narrow the text search.
+    words.update(word for name in types for word in name.lower().split())
+
+    return {
+        "keyword": " ".join(sorted(words)),
+        "date_from": date_from,
+        "date_to": date_to,
+        "disaster_type": disaster_type,
+    }
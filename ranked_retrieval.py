@@ -0,0 +1,270 @@
+import datetime
+import json
+import re
+
+import response_cache
+from dedup import body_text, collapse_duplicates
+from lazy_records import get_rweb_records, prefetch_bodies
+from profiling import profiled
+from reliefweb import build_reports_query
+
+# Reports listed (metadata only) before ranking.
+CANDIDATE_COUNT = 50
+# Reports scraped and returned at most.
+TOP_K = 5
+# Characters of report bodies returned at most, roughly what the answer prompt can hold.
+CONTEXT_CHARS = 40000
+
+# A report loses half of its recency score every this many days.
+RECENCY_HALF_LIFE_DAYS = 30
+FORMAT_SCORES = {
+    "Situation Report": 1.0,
+    "Assessment": 0.8,
+    "Flash Update": 0.8,
+    "Analysis": 0.7,
+    "News and Press Release": 0.5,
+}
+DEFAULT_FORMAT_SCORE = 0.3
+SCORE_WEIGHTS = {"recency": 1.0, "format": 1.0, "country": 1.5, "keyword": 2.0}
+
+_WORD_RE = re.compile(r"\w+")
+# Query words this short carry no signal ("of", "in", ...).
+MIN_TERM_LENGTH = 3
+
+
+def _terms(text: str) -> set:
+    return {word for word in _WORD_RE.findall(text.lower()) if len(word) >= MIN_TERM_LENGTH}
+
+
+def _names(value) -> list:
+    # ReliefWeb fields hold one {"name": ...} object or a list of them.
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [item.get("name", "") for item in value if isinstance(item, dict)]
+
+
+def _age_days(record: dict, now: datetime.datetime) -> float:
+    created = (record.get("date") or {}).get("created")
+    if not created:
+        return None
+    try:
+        date = datetime.datetime.fromisoformat(created)
+    except ValueError:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max((now - date).total_seconds() / 86400, 0)
+
+
+def score_record(record: dict, keyword: str, country: str = None, now: datetime.datetime = None) -> dict:
+    """
+    Scores a report from its metadata alone.
+
+    Args:
+        record (dict): The report fields, without the body.
+        keyword (str): The search query.
+        country (str, optional): The country the question is about. When not given, a primary country named in the query counts as a match. Defaults to None.
+        now (datetime, optional): The time recency is measured from. Defaults to the current time.
+
+    Returns:
+        dict: The "recency", "format", "country" and "keyword" scores, each between 0 and 1, and their weighted "total".
+    """
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    age = _age_days(record, now)
+    recency = 0.0 if age is None else 0.5 ** (age / RECENCY_HALF_LIFE_DAYS)
+
+    formats = _names(record.get("format"))
+    format_score = max(
+        (FORMAT_SCORES.get(name, DEFAULT_FORMAT_SCORE) for name in formats),
+        default=DEFAULT_FORMAT_SCORE,
+    )
+
+    query_terms = _terms(keyword)
+    countries = [name.lower() for name in _names(record.get("primary_country")) if name]
+    if country:
+        country_score = 1.0 if country.lower() in countries else 0.0
+    else:
+        named = [_terms(name) for name in countries]
+        country_score = 1.0 if any(terms and terms <= query_terms for terms in named) else 0.0
+
+    if query_terms:
+        title_terms = _terms(record.get("title", ""))
+        keyword_score = len(query_terms & title_terms) / len(query_terms)
+    else:
+        keyword_score = 0.0
+
+    scores = {
+        "recency": recency,
+        "format": format_score,
+        "country": country_score,
+        "keyword": keyword_score,
+    }
+    scores["total"] = sum(SCORE_WEIGHTS[name] * value for name, value in scores.items())
+    return scores
+
+
+def rank_records(records: list, keyword: str, country: str = None) -> list:
+    """
+    Orders reports by score_record, best first.
+
+    Args:
+        records (list): The report records, metadata only.
+        keyword (str): The search query.
+        country (str, optional): The country the question is about. Defaults to None.
+
+    Returns:
+        list: The same records, sorted. Ties keep the API's order.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    totals = {id(record): score_record(record, keyword, country, now)["total"] for record in records}
+    return sorted(records, key=lambda record: -totals[id(record)])
+
+
+def select_within_budget(
+    ranked: list,
+    top_k: int = TOP_K,
+    context_chars: int = CONTEXT_CHARS,
+    dedupe: bool = False,
+) -> list:
+    """
+    Scrapes ranked reports in order until top_k are kept or the context budget is full.
+
+    Only as many pages as are still needed are scraped per round, concurrently, so
+    reports below the cut are never downloaded.
+
+    Args:
+        ranked (list): ReportRecord objects, best first.
+        top_k (int, optional): Reports to keep at most. Defaults to TOP_K.
+        context_chars (int, optional): Body characters to keep at most; the best report is always kept. Defaults to CONTEXT_CHARS.
+        dedupe (bool, optional): Collapse near-duplicates as they are scraped, so copies don't use up the budget. Defaults to False.
+
+    Returns:
+        list: The kept records, best first, with their bodies loaded.
+    """
+    selected = []
+    used = 0
+    position = 0
+    full = False
+    while not full and len(selected) < top_k and position < len(ranked):
+        batch = ranked[position : position + top_k - len(selected)]
+        position += len(batch)
+        prefetch_bodies(batch)
+        used, full = keep_within_budget(selected, used, batch, context_chars)
+        if dedupe:
+            selected = collapse_duplicates(selected)
+            used = sum(len(body_text(record["body"])) for record in selected)
+    print(f"RANKED scraped {position} of {len(ranked)} candidates, kept {len(selected)} ({used} chars)")
+    return selected
+
+
+def keep_within_budget(selected: list, used: int, batch: list, context_chars: int) -> tuple:
+    """
+    Appends the scraped records of a batch to selected, in order, while they fit the budget.
+
+    Returns:
+        tuple: (body characters now used, whether the budget is full).
+    """
+    for record in batch:
+        size = len(body_text(record["body"]))
+        if selected and used + size > context_chars:
+            return used, True
+        selected.append(record)
+        used += size
+    return used, False
+
+
+def ranked_query(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    disaster_id: str = None,
+    disaster_type: str = None,
+    candidates: int = CANDIDATE_COUNT,
+) -> dict:
+    """
+    Builds the query listing the candidate reports of get_rweb_ranked_data.
+    """
+    return build_reports_query(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        disaster_id=disaster_id,
+        limit=candidates,
+        disaster_type=disaster_type,
+    )
+
+
+def ranked_cache_key(query: dict, **options) -> str:
+    """
+    Builds the response cache key of a ranked query; options are those of get_rweb_ranked_data that change its result.
+    """
+    return response_cache.make_key(query, "reports", ranked=True, **options)
+
+
+@profiled("get_rweb_data")
+def get_rweb_ranked_data(
+    keyword: str = "",
+    country: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    disaster_id: str = None,
+    disaster_type: str = None,
+    candidates: int = CANDIDATE_COUNT,
+    top_k: int = TOP_K,
+    context_chars: int = CONTEXT_CHARS,
+    dedupe: bool = False,
+    use_corpus: bool = False,
+    rank_keyword: str = None,
+) -> str:
+    """
+    Two-phase counterpart of reliefweb.get_rweb_reports_and_news_data.
+
+    Lists metadata for a wide candidate set of reports and news, ranks them locally
+    by recency, format, country match and keyword match, then scrapes bodies only
+    for the best ones until top_k or the context budget is reached.
+
+    Args:
+        keyword (str, optional): The search query. Defaults to an empty string.
+        country (str, optional): The country the question is about. Defaults to None.
+        date_from (str, optional): The starting date for the search. Defaults to None.
+        date_to (str, optional): The ending date for the search. Defaults to None.
+        disaster_id (str, optional): The ID of the disaster to filter the results. Defaults to None.
+        disaster_type (str, optional): Keep reports about this disaster type, e.g. "Flood". Defaults to None.
+        candidates (int, optional): Reports listed before ranking. Defaults to CANDIDATE_COUNT.
+        top_k (int, optional): Reports returned at most. Defaults to TOP_K.
+        context_chars (int, optional): Body characters returned at most. Defaults to CONTEXT_CHARS.
+        dedupe (bool, optional): Collapse reposted copies of the same report. Defaults to False.
+        use_corpus (bool, optional): Reuse report bodies already kept in the local corpus store. Defaults to False.
+        rank_keyword (str, optional): The words reports are ranked on, when the search keyword was stripped of some (see query_canonical.ranking_keyword). Defaults to keyword.
+
+    Returns:
+        str: JSON string of the selected reports, best first, in the format of get_rweb_data; "[]" when none match.
+    """
+    query = ranked_query(keyword, date_from, date_to, disaster_id, disaster_type, candidates)
+    cache_key = ranked_cache_key(
+        query,
+        country=country,
+        top_k=top_k,
+        context_chars=context_chars,
+        dedupe=dedupe,
+        rank_keyword=rank_keyword,
+    )
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    records = get_rweb_records(query, "reports", use_corpus=use_corpus)
+    if not records:
+        print(f"RANKED no reports for {query}")
+        return "[]"
+
+    ranked = rank_records(records, keyword if rank_keyword is None else rank_keyword, country)
+    selected = select_within_budget(ranked, top_k, context_chars, dedupe=dedupe)
+
+    report_components = json.dumps(selected, indent=4)
+    response_cache.put(cache_key, report_components)
+    return report_components
@@ -0,0 +1,318 @@
+import datetime
+import json
+import os
+import shutil
+import uuid
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from dedup import body_text
+from rweb_stream import iter_rweb_data
+
+RECORDS_DATASET_PATH = os.environ.get("RECORDS_DATASET_PATH", "cache/records")
+# Records written per Parquet file when exporting a stream.
+EXPORT_BATCH_SIZE = 1000
+# Rows read per batch by iter_batches.
+READ_BATCH_SIZE = 10000
+
+SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("endpoint", pa.string()),
+        ("title", pa.string()),
+        ("url", pa.string()),
+        ("urls", pa.list_(pa.string())),
+        ("date", pa.timestamp("s", tz="UTC")),
+        ("status", pa.string()),
+        ("format", pa.string()),
+        ("source", pa.list_(pa.string())),
+        ("countries", pa.list_(pa.string())),
+        ("disaster_ids", pa.list_(pa.string())),
+        ("disaster_type", pa.string()),
+        ("glide", pa.string()),
+        ("body", pa.string()),
+        ("year", pa.int16()),
+        ("country", pa.string()),
+    ]
+)
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("country", pa.string())]), flavor="hive"
+)
+
+
+def _names(value) -> list:
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [item["name"] for item in value if isinstance(item, dict) and item.get("name")]
+
+
+def _date(record: dict):
+    dates = record.get("date") or {}
+    # Reports carry date.created, disasters date.event.
+    value = dates.get("created") or dates.get("event") or dates.get("original")
+    if not value:
+        return None
+    try:
+        date = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date
+
+
+def flatten_record(record: dict) -> dict:
+    """
+    Flattens a report or disaster record from get_rweb_data to a row with SCHEMA.
+
+    Args:
+        record (dict): The record fields, with "endpoint".
+
+    Returns:
+        dict: The row. "year" and "country" (the primary country, else the first
+        one listed) are the partition columns.
+    """
+    date = _date(record)
+    countries = _names(record.get("primary_country"))
+    countries += [name for name in _names(record.get("country")) if name not in countries]
+    disasters = record.get("disaster") or []
+    if isinstance(disasters, dict):
+        disasters = [disasters]
+    # Disasters have their own type; reports take the type of their first disaster.
+    disaster_types = _names(record.get("type"))
+    for disaster in disasters:
+        disaster_types.extend(_names(disaster.get("type")))
+
+    return {
+        "id": str(record.get("id")),
+        "endpoint": record.get("endpoint"),
+        "title": record.get("title") or record.get("name"),
+        "url": record.get("url"),
+        "urls": record.get("urls"),
+        "date": date,
+        "status": record.get("status"),
+        "format": next(iter(_names(record.get("format"))), None),
+        "source": _names(record.get("source")),
+        "countries": countries,
+        "disaster_ids": [str(d["id"]) for d in disasters if d.get("id") is not None],
+        "disaster_type": disaster_types[0] if disaster_types else None,
+        "glide": record.get("glide"),
+        "body": body_text(record.get("body")) or record.get("description"),
+        "year": date.year if date else None,
+        "country": countries[0] if countries else None,
+    }
+
+
+def export_records(
+    records, path: str = RECORDS_DATASET_PATH, batch_size: int = EXPORT_BATCH_SIZE
+) -> int:
+    """
+    Appends records to the Parquet dataset, partitioned by year and country.
+
+    Records are converted batch_size at a time and streamed into a single
+    dataset write, so an iterator (e.g. rweb_stream.iter_rweb_data) can be
+    exported without holding it in memory, and each call adds at most one file
+    per partition. Exporting the same records twice stores them twice.
+
+    Args:
+        records (iterable): Report or disaster records as built by get_rweb_data.
+        path (str, optional): The dataset directory. Defaults to RECORDS_DATASET_PATH.
+        batch_size (int, optional): Records converted at a time. Defaults to EXPORT_BATCH_SIZE.
+
+    Returns:
+        int: The number of records written.
+    """
+    count = [0]
+
+    def batches():
+        batch = []
+        for record in records:
+            batch.append(flatten_record(record))
+            if len(batch) >= batch_size:
+                count[0] += len(batch)
+                yield pa.RecordBatch.from_pylist(batch, schema=SCHEMA)
+                batch = []
+        if batch:
+            count[0] += len(batch)
+            yield pa.RecordBatch.from_pylist(batch, schema=SCHEMA)
+
+    _write(pa.RecordBatchReader.from_batches(SCHEMA, batches()), path)
+    return count[0]
+
+
+def _write(data, path: str):
+    ds.write_dataset(
+        data,
+        path,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def compact_dataset(path: str = RECORDS_DATASET_PATH):
+    """
+    Rewrites the dataset with one file per partition.
+
+    Every export adds files; scans slow down as small files pile up, so compact
+    after many small exports. The rewrite is streamed, then swapped in.
+    """
+    if not os.path.isdir(path):
+        return
+    tmp_path = f"{path}.compacting"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    _write(open_dataset(path).scanner(batch_size=READ_BATCH_SIZE).to_reader(), tmp_path)
+    old_path = f"{path}.old"
+    os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path)
+
+
+def export_reliefweb_data(reliefweb_data: str, path: str = RECORDS_DATASET_PATH) -> int:
+    """
+    Appends the records of a get_rweb_data result to the Parquet dataset.
+
+    Args:
+        reliefweb_data (str): The JSON string returned by get_rweb_data.
+        path (str, optional): The dataset directory. Defaults to RECORDS_DATASET_PATH.
+
+    Returns:
+        int: The number of records written.
+    """
+    try:
+        records = json.loads(reliefweb_data)
+    except json.JSONDecodeError:
+        # get_rweb_data returns a message string when the request fails.
+        return 0
+    if not isinstance(records, list):
+        return 0
+    return export_records(records, path)
+
+
+def export_query(
+    query: dict, endpoint: str, path: str = RECORDS_DATASET_PATH, use_corpus: bool = False
+) -> int:
+    """
+    Streams the result of a ReliefWeb query into the Parquet dataset, article by article.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint to retrieve data from.
+        path (str, optional): The dataset directory. Defaults to RECORDS_DATASET_PATH.
+        use_corpus (bool, optional): Read scraped bodies from the local corpus store. Defaults to False.
+
+    Returns:
+        int: The number of records written.
+    """
+    return export_records(iter_rweb_data(query, endpoint, use_corpus=use_corpus), path)
+
+
+def open_dataset(path: str = RECORDS_DATASET_PATH) -> ds.Dataset:
+    """
+    Opens the Parquet dataset with memory-mapped file access.
+
+    Files are mapped rather than read into buffers, so scans only page in the
+    column chunks they touch and the OS can drop them again under pressure.
+    """
+    return ds.dataset(
+        path,
+        schema=SCHEMA,
+        format="parquet",
+        partitioning=PARTITIONING,
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def build_filter(
+    year: int = None,
+    country: str = None,
+    endpoint: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    disaster_type: str = None,
+):
+    """
+    Builds a dataset filter from common conditions.
+
+    year and country prune whole partition directories; the other conditions are
+    pushed down to the Parquet row-group statistics.
+
+    Args:
+        year (int, optional): Keep this year only. Defaults to None.
+        country (str, optional): Keep this partition country only. Defaults to None.
+        endpoint (str, optional): "reports" or "disasters". Defaults to None.
+        date_from (str, optional): Keep records dated on or after this ISO 8601 date. Defaults to None.
+        date_to (str, optional): Keep records dated before this ISO 8601 date. Defaults to None.
+        disaster_type (str, optional): Keep records of this disaster type. Defaults to None.
+
+    Returns:
+        pyarrow.compute.Expression: The filter, or None if no condition is given.
+    """
+    conditions = []
+    if year is not None:
+        conditions.append(ds.field("year") == year)
+    if country is not None:
+        conditions.append(ds.field("country") == country)
+    if endpoint is not None:
+        conditions.append(ds.field("endpoint") == endpoint)
+    if date_from is not None:
+        conditions.append(ds.field("date") >= pa.scalar(_date({"date": {"created": date_from}})))
+    if date_to is not None:
+        conditions.append(ds.field("date") < pa.scalar(_date({"date": {"created": date_to}})))
+    if disaster_type is not None:
+        conditions.append(ds.field("disaster_type") == disaster_type)
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def read_records(
+    columns: list = None, filter=None, path: str = RECORDS_DATASET_PATH, **conditions
+) -> pa.Table:
+    """
+    Reads the matching records, with only the requested columns.
+
+    Args:
+        columns (list, optional): Columns to read, e.g. ["id", "title", "date"]. Leaving out "body" avoids reading the largest column. Defaults to all.
+        filter (pyarrow.compute.Expression, optional): A dataset filter. Defaults to None.
+        path (str, optional): The dataset directory. Defaults to RECORDS_DATASET_PATH.
+        **conditions: Conditions for build_filter, combined with filter.
+
+    Returns:
+        pa.Table: The records.
+    """
+    expression = build_filter(**conditions)
+    if filter is not None:
+        expression = filter if expression is None else expression & filter
+    return open_dataset(path).to_table(columns=columns, filter=expression)
+
+
+def iter_batches(
+    columns: list = None,
+    filter=None,
+    path: str = RECORDS_DATASET_PATH,
+    batch_size: int = READ_BATCH_SIZE,
+    **conditions,
+):
+    """
+    Scans the matching records batch by batch, so memory stays bounded by batch_size.
+
+    Args:
+        See read_records. batch_size (int, optional): Rows per batch. Defaults to READ_BATCH_SIZE.
+
+    Yields:
+        pa.RecordBatch: The records, batch_size rows at most at a time.
+    """
+    expression = build_filter(**conditions)
+    if filter is not None:
+        expression = filter if expression is None else expression & filter
+    scanner = open_dataset(path).scanner(columns=columns, filter=expression, batch_size=batch_size)
+    yield from scanner.to_batches()
@@ -1,11 +1,31 @@
 import datetime
 import json
+import os
 
-import requests
 from bs4 import BeautifulSoup
 from promptflow import tool
 
-RELIEFWEB_API_URL = "https://api.reliefweb.int/v1"
+import fetch_scheduler
+import response_cache
+from boilerplate import get_boilerplate_filter
+from corpus_store import get_corpus
+from dedup import collapse_duplicates
+from pdf_attachments import get_attachment_text
+from profiling import profiled
+from query_canonical import canonicalize_query, ranking_keyword
+
+RELIEFWEB_API_URL = os.environ.get("RELIEFWEB_API_URL", "https://api.reliefweb.int/v1")
+# Use the text of PDF attachments when a report page has no body text of its own.
+ATTACHMENT_FALLBACK = True
+# get_data lists a wide candidate set and scrapes only the best-ranked reports
+# (see ranked_retrieval) instead of the first few the API returns.
+RANKED_RETRIEVAL = True
+# get_data rewrites its query to a canonical form (see query_canonical), so
+# differently worded questions about the same thing share one API call.
+CANONICAL_QUERIES = True
+# Drop the paragraphs each source site repeats on every page (navigation, cookie
+# banners, footers) before bodies are stored or sent to the model (see boilerplate).
+STRIP_BOILERPLATE = True
 
 
 def convert_to_iso8601(date_str):
@@ -27,7 +47,7 @@ def convert_to_iso8601(date_str):
     """
     try:
         # Parse the date string to a datetime object
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
         # Format the datetime object to ISO 8601 format with timezone offset
         iso8601_date = date_obj.strftime("%Y-%m-%dT%H:%M:%S+00:00")
         return iso8601_date
@@ -36,37 +56,110 @@ def convert_to_iso8601(date_str):
         return date_str
 
 
-def get_rweb_data(query: dict, endpoint: str) -> list:
+def extract_body(html: str) -> list:
     """
-    Retrieves ReliefWeb data based on the provided query and endpoint.
+    Extracts the paragraphs of a scraped ReliefWeb page.
+
+    Args:
+        html (str): The page HTML.
+
+    Returns:
+        list: The text of every <p> element on the page.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    paragraphs = [p.text for p in soup.find_all("p")]
+    # Break the tree's reference cycles so it is freed now, not at the next GC pass.
+    soup.decompose()
+    return paragraphs
+
+
+def fetch_body(fields: dict, endpoint: str, corpus=None) -> list:
+    """
+    Scrapes the body of a ReliefWeb record from its page.
+
+    Reports published only as PDFs have no text on their page; for those, the
+    text of the PDF attachments is used instead (see ATTACHMENT_FALLBACK).
+    Scraped pages teach the boilerplate filter, and repeated paragraphs are
+    stripped from every body returned (see STRIP_BOILERPLATE).
+
+    Args:
+        fields (dict): The record fields, with "id" and "url".
+        endpoint (str): The endpoint the record comes from.
+        corpus (CorpusStore, optional): Store to read the body from, and to keep it in once scraped. Defaults to None.
+
+    Returns:
+        list: The paragraphs of the page.
+    """
+    corpus_key = f"{endpoint}/{fields.get('id')}"
+    web_content = corpus.get(corpus_key) if corpus is not None else None
+    if web_content is None:
+        article_response = fetch_scheduler.get(fields["url"])
+        web_content = extract_body(article_response.text)
+        if STRIP_BOILERPLATE:
+            web_content = get_boilerplate_filter().clean(fields["url"], web_content)
+        if ATTACHMENT_FALLBACK and fields.get("file") and not "".join(web_content).strip():
+            web_content = get_attachment_text(fields)
+        if corpus is not None:
+            corpus.put(corpus_key, web_content)
+    elif STRIP_BOILERPLATE:
+        # Bodies stored before a paragraph was recognised as boilerplate still carry it.
+        web_content = get_boilerplate_filter().strip(fields["url"], web_content)
+    return web_content
+
+
+def query_rweb(query: dict, endpoint: str):
+    """
+    Posts a query to the ReliefWeb API, without scraping the pages it returns.
 
     Args:
         query (dict): The query parameters for the ReliefWeb API.
-        endpoint (str): The endpoint to retrieve data from.
+        endpoint (str): The endpoint to query.
 
     Returns:
-        list: A list of report components containing relevant information from the retrieved data.
+        dict: The API response, with "totalCount" and the "data" items, or None if the request failed.
     """
     url = f"{RELIEFWEB_API_URL}/{endpoint}"
 
     print(f"Getting {url} \n\n {query} ...")
 
-    response = requests.post(url, json=query)
+    response = fetch_scheduler.post(url, json=query)
     if response.status_code == 200:
-        answer = response.json()
-        # print(answer)
-    else:
-        print("Error: No data was returned for keyword")
+        return response.json()
+    print("Error: No data was returned for keyword")
+    return None
+
+
+@profiled("get_rweb_data")
+def get_rweb_data(
+    query: dict, endpoint: str, dedupe: bool = False, use_corpus: bool = False
+) -> list:
+    """
+    Retrieves ReliefWeb data based on the provided query and endpoint.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint to retrieve data from.
+        dedupe (bool, optional): Collapse near-duplicate bodies to one record that keeps every source URL. Defaults to False.
+        use_corpus (bool, optional): Read scraped bodies from the local corpus store, scraping and storing only missing ones. Defaults to False.
+
+    Returns:
+        list: A list of report components containing relevant information from the retrieved data.
+    """
+    cache_key = response_cache.make_key(query, endpoint, dedupe=dedupe)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    answer = query_rweb(query, endpoint)
+    if answer is None:
         query = str(query).replace("'", '"')
         return f"No data was returned for query: {query}"
 
+    corpus = get_corpus() if use_corpus else None
+
     results = []
     for article in answer["data"]:
-        article_url = article["fields"]["url"]
-        # This method needed if downloading PDFs too. Removed for the workshop to save tokens
-        article_response = requests.get(article_url)
-        soup = BeautifulSoup(article_response.text, "html.parser")
-        web_content = [p.text for p in soup.find_all("p")]
+        web_content = fetch_body(article["fields"], endpoint, corpus)
         # main_content = article['body']
         # title = article['fields'][title_field[endpoint]]
         # disaster = article['fields'][disaster_field[endpoint]]
@@ -77,12 +170,16 @@ def get_rweb_data(query: dict, endpoint: str) -> list:
         results.append(article["fields"])
     print(f"REPORT SIZE {len(results)}")
 
+    if dedupe:
+        results = collapse_duplicates(results)
+
     report_components = json.dumps(results, indent=4)
+    response_cache.put(cache_key, report_components)
 
     return report_components
 
 
-def get_rweb_reports_and_news_data(
+def build_reports_query(
     keyword: str = "",
     date_from: str = None,
     date_to: str = None,
@@ -91,25 +188,17 @@ def get_rweb_reports_and_news_data(
     limit: int = 5,
     offset: int = 0,
     format_name: str = None,
-) -> list:
+    disaster_type: str = None,
+) -> dict:
     """
-    Retrieves reports and news data from ReliefWeb API based on the specified parameters.
+    Builds the ReliefWeb API query for the reports endpoint.
 
     Args:
-        keyword (str, optional): The keyword to search for in the reports and news data. Defaults to an empty string.
-        date_from (str, optional): The starting date for the search in ISO 8601 format. Defaults to "2023-01-01T00:00:00+00:00".
-        date_to (str, optional): The ending date for the search in ISO 8601 format. Defaults to "2025-01-01T00:00:00+00:00".
-        disaster_id (str, optional): The ID of the disaster to filter the results. Defaults to None.
-        sort (str, optional): The sorting order for the results. Defaults to "date.created:desc".
-        limit (int, optional): The maximum number of results to retrieve. Defaults to 10.
-        offset (int, optional): The offset for pagination. Defaults to 0.
-        format_name (str, optional): The name of the format to filter the results. Defaults to None.
+        See get_rweb_reports_and_news_data.
 
     Returns:
-        str: The retrieved reports and news data in string format.
+        dict: The query, ready to be posted to the reports endpoint.
     """
-
-    endpoint = "reports"
     filter = {"conditions": []}
 
     if date_from is not None and date_to is not None:
@@ -129,7 +218,10 @@ def get_rweb_reports_and_news_data(
         filter_conditions = filter["conditions"]
         filter_conditions.append({"field": "format.name", "value": format_name})
         filter["conditions"] = filter_conditions
-    limit = 5
+    if disaster_type is not None:
+        filter_conditions = filter["conditions"]
+        filter_conditions.append({"field": "disaster_type.name", "value": disaster_type})
+        filter["conditions"] = filter_conditions
     fields = {
         # "include": ["title", "body", "url", "source", "date", "format", "theme", "country", \
         #            "status", "primary_country", "disaster", "language", "id"]
@@ -143,6 +235,8 @@ def get_rweb_reports_and_news_data(
             "status",
             "primary_country",
             "id",
+            "file",
+            "disaster",
         ]
     }
     query = {
@@ -158,12 +252,62 @@ def get_rweb_reports_and_news_data(
     if sort is not None:
         query["sort"] = [sort]
 
+    return query
+
+
+def get_rweb_reports_and_news_data(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    disaster_id: str = None,
+    sort: str = None,
+    limit: int = 5,
+    offset: int = 0,
+    format_name: str = None,
+    dedupe: bool = False,
+    use_corpus: bool = False,
+    disaster_type: str = None,
+) -> list:
+    """
+    Retrieves reports and news data from ReliefWeb API based on the specified parameters.
+
+    Args:
+        keyword (str, optional): The keyword to search for in the reports and news data. Defaults to an empty string.
+        date_from (str, optional): The starting date for the search in ISO 8601 format. Defaults to "2023-01-01T00:00:00+00:00".
+        date_to (str, optional): The ending date for the search in ISO 8601 format. Defaults to "2025-01-01T00:00:00+00:00".
+        disaster_id (str, optional): The ID of the disaster to filter the results. Defaults to None.
+        sort (str, optional): The sorting order for the results. Defaults to "date.created:desc".
+        limit (int, optional): The maximum number of results to retrieve. Defaults to 10.
+        offset (int, optional): The offset for pagination. Defaults to 0.
+        format_name (str, optional): The name of the format to filter the results. Defaults to None.
+        dedupe (bool, optional): Collapse reposted copies of the same report. Defaults to False.
+        use_corpus (bool, optional): Reuse report bodies already kept in the local corpus store. Defaults to False.
+        disaster_type (str, optional): Keep reports about this disaster type, e.g. "Flood". Defaults to None.
+
+    Returns:
+        str: The retrieved reports and news data in string format.
+    """
+
+    endpoint = "reports"
+    limit = 5
+    query = build_reports_query(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        disaster_id=disaster_id,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+        format_name=format_name,
+        disaster_type=disaster_type,
+    )
+
     print(json.dumps(query, indent=4))
 
-    return get_rweb_data(query, endpoint)
+    return get_rweb_data(query, endpoint, dedupe=dedupe, use_corpus=use_corpus)
 
 
-def get_rweb_disasters_data(
+def build_disasters_query(
     keyword: str = "",
     date_from: str = None,
     date_to: str = None,
@@ -175,28 +319,16 @@ def get_rweb_disasters_data(
     id: str = None,
     disaster_type: str = None,
     detailed_query: bool = False,
-) -> list:
+) -> dict:
     """
-    Retrieves disaster data from ReliefWeb API based on the specified parameters.
+    Builds the ReliefWeb API query for the disasters endpoint.
 
     Args:
-        keyword (str, optional): Keyword to search for in the disaster data. Defaults to an empty string.
-        date_from (str, optional): Start date for filtering the disaster data. Defaults to "2023-01-01T00:00:00+00:00".
-        date_to (str, optional): End date for filtering the disaster data. Defaults to "2025-01-01T00:00:00+00:00".
-        sort (str, optional): Sort order for the disaster data. Defaults to "date.event:desc".
-        limit (int, optional): Maximum number of results to retrieve. Defaults to 20.
-        offset (int, optional): Offset for pagination of results. Defaults to 0.
-        status (str, optional): Filter by disaster status. Defaults to None.
-        country (str, optional): Filter by country name. Defaults to None.
-        id (str, optional): Filter by disaster ID. Defaults to None.
-        disaster_type (str, optional): Filter by disaster type. Defaults to None.
-        detailed_query (bool, optional): Flag indicating whether to include detailed description in the results. Defaults to False.
+        See get_rweb_disasters_data.
 
     Returns:
-        str: JSON string containing the retrieved disaster data.
+        dict: The query, ready to be posted to the disasters endpoint.
     """
-
-    endpoint = "disasters"
     filter = {"operator": "AND", "conditions": []}
     if date_from is not None and date_to is not None:
         date_from = convert_to_iso8601(date_from)
@@ -239,10 +371,112 @@ def get_rweb_disasters_data(
     if sort is not None:
         query["sort"] = [sort]
 
+    return query
+
+
+def get_rweb_disasters_data(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    sort: str = None,
+    limit: int = 20,
+    offset: int = 0,
+    status: str = None,
+    country: str = None,
+    id: str = None,
+    disaster_type: str = None,
+    detailed_query: bool = False,
+) -> list:
+    """
+    Retrieves disaster data from ReliefWeb API based on the specified parameters.
+
+    Args:
+        keyword (str, optional): Keyword to search for in the disaster data. Defaults to an empty string.
+        date_from (str, optional): Start date for filtering the disaster data. Defaults to "2023-01-01T00:00:00+00:00".
+        date_to (str, optional): End date for filtering the disaster data. Defaults to "2025-01-01T00:00:00+00:00".
+        sort (str, optional): Sort order for the disaster data. Defaults to "date.event:desc".
+        limit (int, optional): Maximum number of results to retrieve. Defaults to 20.
+        offset (int, optional): Offset for pagination of results. Defaults to 0.
+        status (str, optional): Filter by disaster status. Defaults to None.
+        country (str, optional): Filter by country name. Defaults to None.
+        id (str, optional): Filter by disaster ID. Defaults to None.
+        disaster_type (str, optional): Filter by disaster type. Defaults to None.
+        detailed_query (bool, optional): Flag indicating whether to include detailed description in the results. Defaults to False.
+
+    Returns:
+        str: JSON string containing the retrieved disaster data.
+    """
+
+    endpoint = "disasters"
+    query = build_disasters_query(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+        status=status,
+        country=country,
+        id=id,
+        disaster_type=disaster_type,
+        detailed_query=detailed_query,
+    )
+
     return get_rweb_data(query, endpoint)
 
 
+def query_params(keyword: str) -> dict:
+    """
+    Returns the search arguments for a keyword query: its canonical keyword, dates
+    and disaster type (see CANONICAL_QUERIES), or just the keyword as given.
+    """
+    if CANONICAL_QUERIES:
+        return canonicalize_query(keyword)
+    return {"keyword": keyword}
+
+
+def get_query_data(query: str) -> str:
+    """
+    Fetches the reports get_data answers with for a keyword query: ranked when
+    RANKED_RETRIEVAL is on, else the first situation reports returned.
+
+    Args:
+        query (str): The search query string.
+
+    Returns:
+        str: JSON string of the reports.
+    """
+    params = query_params(query)
+    if RANKED_RETRIEVAL:
+        # Imported here: ranked_retrieval builds on this module.
+        from ranked_retrieval import get_rweb_ranked_data
+
+        return get_rweb_ranked_data(
+            **params, dedupe=True, use_corpus=True, rank_keyword=query_rank_keyword(query)
+        )
+    return get_rweb_reports_and_news_data(
+        **params,
+        sort=None,
+        limit=5,
+        offset=0,
+        format_name="Situation Report",
+        dedupe=True,
+        use_corpus=True,
+    )
+
+
+def query_rank_keyword(keyword: str) -> str:
+    """
+    Returns the words to rank the reports of a keyword query on: the query's own
+    words when CANONICAL_QUERIES moved some of them into filters, else None.
+    """
+    if CANONICAL_QUERIES:
+        return ranking_keyword(keyword)
+    return None
+
+
 @tool
+@profiled("get_data")
 def get_data(query=None) -> str:
     """
     List or search updates, headlines, or maps.
@@ -271,15 +505,7 @@ def get_data(query=None) -> str:
     #    "Statistical Snapshot"
     # ],
 
-    result = get_rweb_reports_and_news_data(
-        keyword=query,
-        date_from=None,
-        date_to=None,
-        sort=None,
-        limit=5,
-        offset=0,
-        format_name="Situation Report",
-    )
+    result = get_query_data(query)
 
     # These are report disaster_type options as extracted from ReliefWeb API
     # [
@@ -0,0 +1,377 @@
+import asyncio
+import contextvars
+import json
+import time
+
+import httpx
+from langchain_core.tools import tool
+
+import fetch_scheduler
+import ranked_retrieval
+import reliefweb
+import response_cache
+from boilerplate import get_boilerplate_filter
+from corpus_store import get_corpus
+from dedup import body_text, collapse_duplicates
+from http_client import get_async_client
+from lazy_records import metadata_query
+from pdf_attachments import get_attachment_text
+from profiling import profiled
+from reliefweb import (
+    RELIEFWEB_API_URL,
+    build_disasters_query,
+    build_reports_query,
+    extract_body,
+)
+
+TIMEOUT_SECONDS = 30
+# Article pages scraped at once for a single query.
+MAX_CONCURRENT_SCRAPES = 10
+
+# Absolute time.monotonic() deadline of the request being served, if any. Every
+# ReliefWeb call made on behalf of the request is bounded by what is left of it.
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+def remaining_timeout() -> float:
+    """
+    Returns the seconds left before the current request's deadline, capped at TIMEOUT_SECONDS.
+
+    The deadline of a bulk job (see fetch_scheduler.bulk) bounds its calls the same way.
+
+    Raises:
+        asyncio.TimeoutError: If the deadline has already passed.
+    """
+    remaining = fetch_scheduler.remaining()
+    deadline = request_deadline.get()
+    if deadline is not None:
+        left = deadline - time.monotonic()
+        remaining = left if remaining is None else min(remaining, left)
+    if remaining is None:
+        return TIMEOUT_SECONDS
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Request deadline exceeded")
+    return min(remaining, TIMEOUT_SECONDS)
+
+
+def _deadline_priority():
+    """
+    Returns a fetch_scheduler.priority block for sync fetches made on behalf of
+    the current request, bounded by what is left of its deadline.
+    """
+    name, _ = fetch_scheduler.fetch_priority.get()
+    left = fetch_scheduler.remaining()
+    deadline = request_deadline.get()
+    if deadline is not None:
+        until_deadline = deadline - time.monotonic()
+        left = until_deadline if left is None else min(left, until_deadline)
+    return fetch_scheduler.priority(name, left)
+
+
+async def _scrape(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, fields: dict) -> list:
+    async with semaphore, fetch_scheduler.get_scheduler().aslot():
+        response = await client.get(fields["url"], timeout=remaining_timeout())
+    # Parsing is CPU-bound; keep it off the event loop.
+    web_content = await asyncio.to_thread(_parse, fields["url"], response.text)
+    if reliefweb.ATTACHMENT_FALLBACK and fields.get("file") and not "".join(web_content).strip():
+        # Downloads and parses PDFs with blocking calls, in a worker thread.
+        with _deadline_priority():
+            web_content = await asyncio.to_thread(get_attachment_text, fields)
+    return web_content
+
+
+def _parse(url: str, html: str) -> list:
+    web_content = extract_body(html)
+    if reliefweb.STRIP_BOILERPLATE:
+        web_content = get_boilerplate_filter().clean(url, web_content)
+    return web_content
+
+
+async def _load_bodies(
+    client: httpx.AsyncClient, semaphore: asyncio.Semaphore, results: list, endpoint: str, corpus
+):
+    """
+    Sets the "endpoint" and "body" of each record, from the corpus store or scraped concurrently.
+    """
+    pending = {}
+    for fields in results:
+        corpus_key = f"{endpoint}/{fields.get('id')}"
+        web_content = None
+        if corpus is not None:
+            # Reads (and decompresses) from disk; keep it off the event loop.
+            web_content = await asyncio.to_thread(corpus.get, corpus_key)
+        if web_content is None:
+            pending[corpus_key] = (fields, _scrape(client, semaphore, fields))
+        elif reliefweb.STRIP_BOILERPLATE:
+            web_content = get_boilerplate_filter().strip(fields["url"], web_content)
+        fields["endpoint"] = endpoint
+        fields["body"] = web_content
+
+    bodies = await asyncio.gather(*(scrape for _, scrape in pending.values()))
+    for (corpus_key, (fields, _)), web_content in zip(pending.items(), bodies):
+        fields["body"] = web_content
+        if corpus is not None:
+            await asyncio.to_thread(corpus.put, corpus_key, web_content)
+
+
+@profiled("get_rweb_data")
+async def aget_rweb_data(
+    query: dict, endpoint: str, dedupe: bool = False, use_corpus: bool = False
+) -> list:
+    """
+    Async counterpart of reliefweb.get_rweb_data. Article pages are scraped concurrently.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint to retrieve data from.
+        dedupe (bool, optional): Collapse near-duplicate bodies to one record that keeps every source URL. Defaults to False.
+        use_corpus (bool, optional): Read scraped bodies from the local corpus store, scraping and storing only missing ones. Defaults to False.
+
+    Returns:
+        list: A list of report components containing relevant information from the retrieved data.
+    """
+    cache_key = response_cache.make_key(query, endpoint, dedupe=dedupe)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    client = get_async_client()
+    url = f"{RELIEFWEB_API_URL}/{endpoint}"
+
+    print(f"Getting {url} \n\n {query} ...")
+
+    async with fetch_scheduler.get_scheduler().aslot():
+        response = await client.post(url, json=query, timeout=remaining_timeout())
+    if response.status_code == 200:
+        answer = response.json()
+    else:
+        print("Error: No data was returned for keyword")
+        query = str(query).replace("'", '"')
+        return f"No data was returned for query: {query}"
+
+    corpus = get_corpus() if use_corpus else None
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+
+    results = [article["fields"] for article in answer["data"]]
+    await _load_bodies(client, semaphore, results, endpoint, corpus)
+    print(f"REPORT SIZE {len(results)}")
+
+    if dedupe:
+        results = await asyncio.to_thread(collapse_duplicates, results)
+
+    report_components = json.dumps(results, indent=4)
+    response_cache.put(cache_key, report_components)
+    return report_components
+
+
+async def aget_rweb_reports_and_news_data(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    disaster_id: str = None,
+    sort: str = None,
+    limit: int = 5,
+    offset: int = 0,
+    format_name: str = None,
+    dedupe: bool = False,
+    use_corpus: bool = False,
+    disaster_type: str = None,
+) -> list:
+    """
+    Async counterpart of reliefweb.get_rweb_reports_and_news_data, with the same parameters.
+
+    Returns:
+        str: The retrieved reports and news data in string format.
+    """
+    endpoint = "reports"
+    limit = 5
+    query = build_reports_query(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        disaster_id=disaster_id,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+        format_name=format_name,
+        disaster_type=disaster_type,
+    )
+    return await aget_rweb_data(query, endpoint, dedupe=dedupe, use_corpus=use_corpus)
+
+
+async def aget_rweb_disasters_data(
+    keyword: str = "",
+    date_from: str = None,
+    date_to: str = None,
+    sort: str = None,
+    limit: int = 20,
+    offset: int = 0,
+    status: str = None,
+    country: str = None,
+    id: str = None,
+    disaster_type: str = None,
+    detailed_query: bool = False,
+) -> list:
+    """
+    Async counterpart of reliefweb.get_rweb_disasters_data, with the same parameters.
+
+    Returns:
+        str: JSON string containing the retrieved disaster data.
+    """
+    endpoint = "disasters"
+    query = build_disasters_query(
+        keyword=keyword,
+        date_from=date_from,
+        date_to=date_to,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+        status=status,
+        country=country,
+        id=id,
+        disaster_type=disaster_type,
+        detailed_query=detailed_query,
+    )
+    return await aget_rweb_data(query, endpoint)
+
+
+@profiled("get_rweb_data")
+async def aget_rweb_ranked_data(
+    keyword: str = "",
+    country: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    disaster_id: str = None,
+    disaster_type: str = None,
+    candidates: int = ranked_retrieval.CANDIDATE_COUNT,
+    top_k: int = ranked_retrieval.TOP_K,
+    context_chars: int = ranked_retrieval.CONTEXT_CHARS,
+    dedupe: bool = False,
+    use_corpus: bool = False,
+    rank_keyword: str = None,
+) -> str:
+    """
+    Async counterpart of ranked_retrieval.get_rweb_ranked_data, with the same parameters.
+
+    The candidates are listed and the selected pages scraped on the event loop,
+    as aget_rweb_data does; only the scoring runs in a worker thread.
+
+    Returns:
+        str: JSON string of the selected reports, best first; "[]" when none match.
+    """
+    query = ranked_retrieval.ranked_query(
+        keyword, date_from, date_to, disaster_id, disaster_type, candidates
+    )
+    cache_key = ranked_retrieval.ranked_cache_key(
+        query,
+        country=country,
+        top_k=top_k,
+        context_chars=context_chars,
+        dedupe=dedupe,
+        rank_keyword=rank_keyword,
+    )
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    client = get_async_client()
+    url = f"{RELIEFWEB_API_URL}/reports"
+    print(f"Getting {url} \n\n {query} ...")
+    async with fetch_scheduler.get_scheduler().aslot():
+        response = await client.post(
+            url, json=metadata_query(query), timeout=remaining_timeout()
+        )
+    records = response.json()["data"] if response.status_code == 200 else []
+    if not records:
+        print(f"RANKED no reports for {query}")
+        return "[]"
+
+    ranked = await asyncio.to_thread(
+        ranked_retrieval.rank_records,
+        [item["fields"] for item in records],
+        keyword if rank_keyword is None else rank_keyword,
+        country,
+    )
+
+    corpus = get_corpus() if use_corpus else None
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+    selected = []
+    used = 0
+    position = 0
+    full = False
+    while not full and len(selected) < top_k and position < len(ranked):
+        batch = ranked[position : position + top_k - len(selected)]
+        position += len(batch)
+        await _load_bodies(client, semaphore, batch, "reports", corpus)
+        used, full = ranked_retrieval.keep_within_budget(selected, used, batch, context_chars)
+        if dedupe:
+            selected = await asyncio.to_thread(collapse_duplicates, selected)
+            used = sum(len(body_text(record["body"])) for record in selected)
+    print(f"RANKED scraped {position} of {len(ranked)} candidates, kept {len(selected)} ({used} chars)")
+
+    report_components = json.dumps(selected, indent=4)
+    response_cache.put(cache_key, report_components)
+    return report_components
+
+
+async def aget_query_data(query: str) -> str:
+    """
+    Async counterpart of reliefweb.get_query_data.
+
+    Args:
+        query (str): The search query string.
+
+    Returns:
+        str: JSON string of the reports.
+    """
+    params = reliefweb.query_params(query)
+    if reliefweb.RANKED_RETRIEVAL:
+        return await aget_rweb_ranked_data(
+            **params,
+            dedupe=True,
+            use_corpus=True,
+            rank_keyword=reliefweb.query_rank_keyword(query),
+        )
+    return await aget_rweb_reports_and_news_data(
+        **params,
+        sort=None,
+        limit=5,
+        offset=0,
+        format_name="Situation Report",
+        dedupe=True,
+        use_corpus=True,
+    )
+
+
+@tool
+@profiled("get_data")
+async def aget_data(query=None) -> str:
+    """
+    List or search updates, headlines, or maps.
+
+    Args:
+        query_value (str): The search query string.
+
+    Returns:
+        response containing reports, dictionary
+    """
+    result = await aget_query_data(query)
+    try:
+        return json.dumps(json.loads(result), indent=4)
+    except json.JSONDecodeError:
+        # aget_rweb_data returns a message string when the API request fails.
+        return result
+
+
+@tool
+async def aget_disasters(query=None) -> str:
+    """
+    List or search disasters.
+
+    Args:
+        query (str): The search query string.
+
+    Returns:
+        response containing disasters, dictionary
+    """
+    return await aget_rweb_disasters_data(keyword=query or "", limit=1)
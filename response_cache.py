@@ -0,0 +1,82 @@
+import contextlib
+import json
+import os
+import threading
+
+from cachetools import TTLCache
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "900"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "2048"))
+
+_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=max(RESPONSE_CACHE_TTL_SECONDS, 1))
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_local = threading.local()
+
+
+def make_key(query: dict, endpoint: str, **options) -> str:
+    """
+    Builds the cache key of a ReliefWeb query.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint queried.
+        **options: Post-processing options that change the result, e.g. dedupe.
+
+    Returns:
+        str: The key.
+    """
+    return json.dumps(
+        {"endpoint": endpoint, "query": query, "options": options}, sort_keys=True
+    )
+
+
+def get(key: str):
+    """
+    Returns the cached result for a key, or None if it is missing or expired.
+    """
+    if RESPONSE_CACHE_TTL_SECONDS <= 0 or getattr(_local, "bypass", False):
+        return None
+    with _lock:
+        value = _cache.get(key)
+        _stats["hits" if value is not None else "misses"] += 1
+        return value
+
+
+def put(key: str, value):
+    """
+    Caches a result for RESPONSE_CACHE_TTL_SECONDS.
+    """
+    if RESPONSE_CACHE_TTL_SECONDS <= 0:
+        return
+    with _lock:
+        _cache[key] = value
+
+
+@contextlib.contextmanager
+def refreshing():
+    """
+    Within this block, lookups on the current thread miss, so results are fetched
+    again and re-cached with a fresh TTL. Used to refresh entries before they expire.
+    """
+    _local.bypass = True
+    try:
+        yield
+    finally:
+        _local.bypass = False
+
+
+def stats() -> dict:
+    """
+    Returns hit and miss counts and the number of cached results.
+    """
+    with _lock:
+        return dict(_stats, size=len(_cache))
+
+
+def clear():
+    """
+    Drops every cached result.
+    """
+    with _lock:
+        _cache.clear()
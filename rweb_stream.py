@@ -0,0 +1,182 @@
+import codecs
+import json
+
+import fetch_scheduler
+from corpus_store import get_corpus
+from reliefweb import RELIEFWEB_API_URL, fetch_body
+
+CHUNK_SIZE = 64 * 1024
+# Consumed text is dropped from the parse buffer once it grows past this size.
+COMPACT_AT = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+class _JSONStreamReader:
+    """
+    Reads JSON values one at a time from a stream of text chunks.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.pos > COMPACT_AT:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk.
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks, key: str = "data"):
+    """
+    Yields the items of the array under a top-level key of a streamed JSON object.
+
+    Only one item is held in memory at a time; other top-level values are parsed
+    and discarded.
+
+    Args:
+        chunks (iterable): The JSON text, in chunks.
+        key (str, optional): The top-level key of the array. Defaults to "data".
+
+    Yields:
+        The array items.
+
+    Raises:
+        ValueError: If the stream is not a JSON object.
+    """
+    reader = _JSONStreamReader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    separator = reader.peek()
+                    reader.pos += 1
+                    if separator == "]":
+                        break
+                    if separator != ",":
+                        raise ValueError(f"Expected ',' or ']' at offset {reader.pos - 1}")
+        else:
+            reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' at offset {reader.pos - 1}")
+
+
+def _decode(byte_chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in byte_chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_rweb_data(query: dict, endpoint: str, use_corpus: bool = False):
+    """
+    Streaming counterpart of reliefweb.get_rweb_data.
+
+    The API response is parsed incrementally and each article is scraped and
+    yielded on its own, so its page HTML and parse tree are released before the
+    next one is fetched. Peak memory stays flat whatever the result count.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint to retrieve data from.
+        use_corpus (bool, optional): Read scraped bodies from the local corpus store, scraping and storing only missing ones. Defaults to False.
+
+    Yields:
+        dict: The fields of each article, with "endpoint" and "body".
+
+    Raises:
+        RuntimeError: If the API request fails.
+    """
+    url = f"{RELIEFWEB_API_URL}/{endpoint}"
+
+    print(f"Getting {url} \n\n {query} ...")
+
+    corpus = get_corpus() if use_corpus else None
+    with fetch_scheduler.stream("POST", url, json=query) as response:
+        if response.status_code != 200:
+            query = str(query).replace("'", '"')
+            raise RuntimeError(f"No data was returned for query: {query}")
+        for article in iter_json_array(_decode(response.iter_bytes(CHUNK_SIZE))):
+            fields = article["fields"]
+            fields["endpoint"] = endpoint
+            fields["body"] = fetch_body(fields, endpoint, corpus)
+            yield fields
+
+
+def stream_rweb_data(query: dict, endpoint: str, out, use_corpus: bool = False) -> int:
+    """
+    Writes the result of a ReliefWeb query to a file as a JSON array, one article at a time.
+
+    The output is the same JSON as get_rweb_data returns, without ever holding
+    the whole result in memory.
+
+    Args:
+        query (dict): The query parameters for the ReliefWeb API.
+        endpoint (str): The endpoint to retrieve data from.
+        out: A text file-like object to write to.
+        use_corpus (bool, optional): Read scraped bodies from the local corpus store. Defaults to False.
+
+    Returns:
+        int: The number of articles written.
+    """
+    count = 0
+    out.write("[")
+    for fields in iter_rweb_data(query, endpoint, use_corpus=use_corpus):
+        out.write(",\n    " if count else "\n    ")
+        out.write(json.dumps(fields, indent=4).replace("\n", "\n    "))
+        count += 1
+    out.write("\n]" if count else "]")
+    print(f"REPORT SIZE {count}")
+    return count
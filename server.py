@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from aiohttp import web
+
+import fetch_scheduler
+import http_client
+import profiling
+import prompt_templates
+from boilerplate import get_boilerplate_filter
+from cache_warmer import CacheWarmer
+from chat_history import ChatHistoryManager
+from dedup import get_index
+from disaster_snapshot import get_snapshot
+from impact_figures import record_impact_figures
+from model_router import ModelRouter, TIERS
+from reliefweb_async import aget_query_data, remaining_timeout, request_deadline
+from summarize import summarize_reliefweb_data
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8080"))
+# Jobs handled at once; the rest wait in the queue.
+WORKERS = int(os.environ.get("WORKERS", "32"))
+# Jobs allowed to wait. Beyond this, requests are rejected with 429 straight away.
+MAX_QUEUE = int(os.environ.get("MAX_QUEUE", "256"))
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("DEFAULT_DEADLINE_SECONDS", "60"))
+MAX_DEADLINE_SECONDS = 300
+RETRY_AFTER_SECONDS = 1
+
+
+async def invoke_llm(router: ModelRouter, template: str, messages: list) -> str:
+    """
+    Calls the template's model tier, bounded by the current request's deadline.
+
+    Args:
+        router (ModelRouter): The model router.
+        template (str): The prompt template the messages were rendered from.
+        messages (list): The chat messages.
+
+    Returns:
+        str: The model's reply.
+    """
+    response = await asyncio.wait_for(
+        router.ainvoke_messages(template, messages), timeout=remaining_timeout()
+    )
+    return response.content
+
+
+async def condense_reports(router: ModelRouter, reliefweb_data: str) -> str:
+    """
+    Replaces the report bodies with per-report summaries and their impact figures,
+    as the pipeline's summarize_reports and extract_impact_figures stages do.
+
+    Summaries run on the summarize_basic tier; both stages make blocking calls, so
+    they run in worker threads.
+
+    Args:
+        router (ModelRouter): The model router.
+        reliefweb_data (str): The JSON string of the reports.
+
+    Returns:
+        str: The reliefweb_data for the respones template.
+    """
+    summaries, figures = await asyncio.gather(
+        asyncio.to_thread(
+            summarize_reliefweb_data, reliefweb_data, router.bind("summarize_basic")
+        ),
+        asyncio.to_thread(record_impact_figures, reliefweb_data),
+    )
+    return f"{summaries}\n\nImpact figures:\n{figures}"
+
+
+async def answer_question(app: web.Application, question: str, session_id: str) -> dict:
+    """
+    Answers a question with ReliefWeb data: rewrites it as a search query, fetches
+    the matching reports, summarizes them and asks the model to answer from the
+    summaries and impact figures.
+
+    Args:
+        app (web.Application): The application holding the model router and history manager.
+        question (str): The user's question.
+        session_id (str): The conversation id, for multi-turn questions.
+
+    Returns:
+        dict: The answer, the ReliefWeb query used and the session id.
+    """
+    router = app["router"]
+    history = app["history"].get_context(session_id)
+
+    messages = prompt_templates.render_messages(
+        "extract_query_from_question", question=question, **history
+    )
+    query = await invoke_llm(router, "extract_query_from_question", messages)
+    query = query.strip().strip('"')
+
+    reliefweb_data = await condense_reports(router, await aget_query_data(query))
+
+    messages = prompt_templates.render_messages(
+        "respones", question=question, reliefweb_data=reliefweb_data, **history
+    )
+    answer = await invoke_llm(router, "respones", messages)
+
+    app["history"].add_turn(session_id, question, answer)
+    return {"answer": answer, "query": query, "session_id": session_id}
+
+
+async def get_reports(app: web.Application, query: str) -> list:
+    """
+    Fetches situation reports for a query, as the get_data tool does.
+    """
+    result = await aget_query_data(query)
+    try:
+        return json.loads(result)
+    except json.JSONDecodeError:
+        # The unranked path returns a message string when the API request fails.
+        print(f"REPORTS {result}")
+        return []
+
+
+async def worker(app: web.Application):
+    """
+    Takes jobs off the queue and runs them under their own deadline.
+    """
+    queue = app["queue"]
+    while True:
+        deadline, future, func, args = await queue.get()
+        try:
+            if future.cancelled():
+                continue
+            if time.monotonic() >= deadline:
+                future.set_exception(asyncio.TimeoutError("Deadline exceeded while queued"))
+                continue
+            token = request_deadline.set(deadline)
+            try:
+                result = await asyncio.wait_for(
+                    func(app, *args), timeout=deadline - time.monotonic()
+                )
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                request_deadline.reset(token)
+        finally:
+            queue.task_done()
+
+
+def _deadline(request: web.Request) -> float:
+    """
+    Reads the request deadline from the X-Deadline-Seconds header.
+    """
+    try:
+        seconds = float(request.headers.get("X-Deadline-Seconds", DEFAULT_DEADLINE_SECONDS))
+    except ValueError:
+        raise web.HTTPBadRequest(text="X-Deadline-Seconds must be a number")
+    return time.monotonic() + min(max(seconds, 0), MAX_DEADLINE_SECONDS)
+
+
+async def submit(request: web.Request, func, *args) -> web.Response:
+    """
+    Admits a job to the bounded queue and waits for its result.
+
+    Returns 429 when the queue is full and 504 when the deadline passes first.
+    """
+    queue = request.app["queue"]
+    deadline = _deadline(request)
+    future = asyncio.get_running_loop().create_future()
+    try:
+        queue.put_nowait((deadline, future, func, args))
+    except asyncio.QueueFull:
+        return web.json_response(
+            {"error": "Server is overloaded, try again later"},
+            status=429,
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+    try:
+        result = await asyncio.wait_for(future, timeout=deadline - time.monotonic())
+    except asyncio.TimeoutError:
+        return web.json_response({"error": "Deadline exceeded"}, status=504)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=502)
+    return web.json_response(result)
+
+
+async def handle_ask(request: web.Request) -> web.Response:
+    """
+    POST /ask {"question": "...", "session_id": "..."}
+    """
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Body must be JSON")
+    question = payload.get("question")
+    if not question:
+        raise web.HTTPBadRequest(text="question is required")
+    session_id = payload.get("session_id") or str(uuid.uuid4())
+    return await submit(request, answer_question, question, session_id)
+
+
+async def handle_data(request: web.Request) -> web.Response:
+    """
+    GET /data?query=...
+    """
+    query = request.query.get("query", "")
+    return await submit(request, get_reports, query)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """
+    GET /health, with the queue depth, template render timings, model usage per tier,
+    ReliefWeb fetches per traffic class, the boilerplate stripped from scraped pages
+    and, with PROFILE_MEMORY set, memory use per stage.
+    """
+    return web.json_response(
+        {
+            "queued": request.app["queue"].qsize(),
+            "max_queue": MAX_QUEUE,
+            "workers": WORKERS,
+            "templates": prompt_templates.registry.render_stats(),
+            "models": request.app["router"].stats(),
+            "fetches": fetch_scheduler.get_scheduler().stats(),
+            "boilerplate": get_boilerplate_filter().stats(),
+            "profile": profiling.stats(),
+        }
+    )
+
+
+async def on_startup(app: web.Application):
+    # Warm the shared state once so the first requests don't pay for it.
+    http_client.get_async_client()
+    if "router" not in app:
+        app["router"] = ModelRouter()
+    for tier in TIERS:
+        app["router"].model(tier)
+    app["history"] = ChatHistoryManager()
+    app["queue"] = asyncio.Queue(maxsize=MAX_QUEUE)
+    app["workers"] = [asyncio.create_task(worker(app)) for _ in range(WORKERS)]
+    # Disaster lookups are served from the snapshot, kept fresh in the background.
+    get_snapshot(block=False).start()
+    # Keeps the reports of active crises cached, as bulk traffic behind user questions.
+    app["warmer"] = CacheWarmer()
+    app["warmer"].start()
+
+
+async def on_cleanup(app: web.Application):
+    for task in app["workers"]:
+        task.cancel()
+    await asyncio.gather(*app["workers"], return_exceptions=True)
+    await asyncio.to_thread(app["warmer"].stop)
+    await asyncio.to_thread(get_snapshot(block=False).stop)
+    await http_client.aclose_async_client()
+    # Keep what was learned since the last periodic save.
+    get_boilerplate_filter().save()
+    get_index().save()
+
+
+def create_app(router: ModelRouter = None) -> web.Application:
+    """
+    Builds the assistant web application.
+
+    Args:
+        router (ModelRouter, optional): The model router, e.g. one over mock models for a load test. Defaults to a ModelRouter over TIERS.
+    """
+    app = web.Application()
+    if router is not None:
+        app["router"] = router
+    app.router.add_post("/ask", handle_ask)
+    app.router.add_get("/data", handle_data)
+    app.router.add_get("/health", handle_health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=HOST, port=PORT)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import prompt_templates
+from dedup import body_text
+
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", "cache/summaries.jsonl")
+MAX_WORKERS = 8
+# Bodies are cut to this many characters before summarizing.
+MAX_BODY_CHARS = 20000
+
+CITATION_FIELDS = ["id", "title", "url", "urls", "date", "format", "source", "primary_country"]
+
+
+class SummaryCache:
+    """
+    Report summaries keyed by report id and a hash of the body they summarize.
+
+    A report whose body changes gets a new summary; an unchanged one is never
+    summarized twice. Entries are appended to a JSON-lines file and reloaded on start.
+    """
+
+    def __init__(self, path: str = SUMMARY_CACHE_PATH):
+        self.path = path
+        self.summaries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.summaries[entry["key"]] = entry["summary"]
+
+    @staticmethod
+    def make_key(report_id, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{report_id}:{digest}"
+
+    def get(self, key: str):
+        with self.lock:
+            return self.summaries.get(key)
+
+    def put(self, key: str, summary: str):
+        with self.lock:
+            self.summaries[key] = summary
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "summary": summary}) + "\n")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    """
+    Returns the process-wide summary cache, loading it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache()
+        return _cache
+
+
+def summarize_report(report: dict, llm, cache: SummaryCache = None) -> dict:
+    """
+    Summarizes one report with the summarize_basic template.
+
+    Args:
+        report (dict): The report record, with "id" and "body".
+        llm: A LangChain chat model.
+        cache (SummaryCache, optional): The cache to use. Defaults to the shared cache.
+
+    Returns:
+        dict: The report's citation fields plus its "summary".
+    """
+    if cache is None:
+        cache = get_summary_cache()
+    text = body_text(report.get("body"))[:MAX_BODY_CHARS]
+    key = cache.make_key(report.get("id"), text)
+
+    summary = cache.get(key)
+    if summary is None:
+        if text.strip():
+            messages = prompt_templates.render_messages("summarize_basic", text=text)
+            summary = llm.invoke(messages).content.strip()
+        else:
+            summary = ""
+        cache.put(key, summary)
+
+    result = {field: report[field] for field in CITATION_FIELDS if field in report}
+    result["summary"] = summary
+    return result
+
+
+def summarize_reports(reports: list, llm, max_workers: int = MAX_WORKERS) -> list:
+    """
+    Summarizes each report on its own, concurrently (the map step).
+
+    Args:
+        reports (list): Report records, as built by get_rweb_data.
+        llm: A LangChain chat model.
+        max_workers (int, optional): Summaries requested at once. Defaults to MAX_WORKERS.
+
+    Returns:
+        list: One dict per report, in order, with citation fields and "summary".
+    """
+    if not reports:
+        return []
+    cache = get_summary_cache()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(reports))) as executor:
+        return list(executor.map(lambda r: summarize_report(r, llm, cache), reports))
+
+
+def summarize_reliefweb_data(reliefweb_data: str, llm, max_workers: int = MAX_WORKERS) -> str:
+    """
+    Replaces the raw report bodies of a get_rweb_data result with per-report summaries.
+
+    This is the reduce input for the final response: compact summaries plus the
+    metadata needed to cite each report.
+
+    Args:
+        reliefweb_data (str): The JSON string returned by get_rweb_data.
+        llm: A LangChain chat model.
+        max_workers (int, optional): Summaries requested at once. Defaults to MAX_WORKERS.
+
+    Returns:
+        str: JSON string of the summaries, or reliefweb_data unchanged if it is not a list of reports.
+    """
+    try:
+        reports = json.loads(reliefweb_data)
+    except json.JSONDecodeError:
+        # get_rweb_data returns a message string when the request fails.
+        return reliefweb_data
+    if not isinstance(reports, list):
+        return reliefweb_data
+    return json.dumps(summarize_reports(reports, llm, max_workers), indent=4)
@@ -0,0 +1,57 @@
+import json
+import threading
+
+import boilerplate
+from boilerplate import BoilerplateFilter
+
+FOOTER = "Share this page on social media"
+
+
+def test_refetching_a_page_does_not_make_it_boilerplate(tmp_path):
+    boilerplate = BoilerplateFilter(str(tmp_path / "boilerplate.json"))
+    paragraphs = ["Floods killed 12 people in the north.", FOOTER]
+    for _ in range(10):
+        boilerplate.learn("https://example.org/report/1", paragraphs)
+    assert boilerplate.stats()["pages"] == {"example.org": 1}
+    assert boilerplate.strip("https://example.org/report/1", paragraphs) == paragraphs
+
+
+def test_paragraph_repeated_across_pages_is_stripped_after_reload(tmp_path):
+    path = str(tmp_path / "boilerplate.json")
+    boilerplate = BoilerplateFilter(path)
+    for i in range(5):
+        boilerplate.learn(f"https://example.org/report/{i}", [f"Report {i} text.", FOOTER])
+    boilerplate.save()
+
+    reloaded = BoilerplateFilter(path)
+    reloaded.learn("https://example.org/report/0", ["Report 0 text.", FOOTER])
+    assert reloaded.stats()["pages"] == {"example.org": 5}
+    assert reloaded.strip("https://example.org/report/9", ["New text.", FOOTER]) == ["New text."]
+
+
+def test_concurrent_learning_saves_a_complete_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(boilerplate, "SAVE_EVERY", 1)
+    path = tmp_path / "boilerplate.json"
+    learned = BoilerplateFilter(str(path))
+
+    def scrape(worker):
+        for i in range(30):
+            learned.learn(f"https://example.org/{worker}/{i}", [f"Text {i}", FOOTER])
+
+    threads = [threading.Thread(target=scrape, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    learned.save()
+    assert json.loads(path.read_text())["example.org"]["pages"] == 120
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_remembered_urls_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(boilerplate, "MAX_URLS", 10)
+    learned = BoilerplateFilter(str(tmp_path / "boilerplate.json"))
+    for i in range(25):
+        learned.learn(f"https://example.org/report/{i}", ["Text"])
+    assert len(learned.domains["example.org"]["urls"]) <= 10
+    assert learned.stats()["pages"] == {"example.org": 25}
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+# reliefweb needs the promptflow tool decorator.
+pytest.importorskip("promptflow")
+
+import cache_warmer  # noqa: E402
+import dedup  # noqa: E402
+import ranked_retrieval  # noqa: E402
+import reliefweb  # noqa: E402
+import reliefweb_async  # noqa: E402
+import response_cache  # noqa: E402
+
+
+@pytest.fixture
+def listed(tmp_path, monkeypatch):
+    calls = []
+
+    def get_rweb_records(query, endpoint, use_corpus=False):
+        calls.append(query)
+        return [
+            {
+                "id": 1,
+                "title": "Sudan floods situation report",
+                "url": "https://example.org/report/1",
+                "date": {"created": "2024-08-01T00:00:00+00:00"},
+                "body": ["Floods displaced 12000 people in Kassala."],
+            }
+        ]
+
+    by_id = []
+    monkeypatch.setattr(ranked_retrieval, "get_rweb_records", get_rweb_records)
+    monkeypatch.setattr(ranked_retrieval, "prefetch_bodies", lambda records: records)
+    monkeypatch.setattr(
+        cache_warmer, "get_rweb_reports_and_news_data", lambda **kwargs: by_id.append(kwargs)
+    )
+    monkeypatch.setattr(dedup, "_index", dedup.SignatureIndex(str(tmp_path / "index.json")))
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_TTL_SECONDS", 900)
+    response_cache.clear()
+    yield calls, by_id
+    response_cache.clear()
+
+
+def test_disaster_query_drops_the_start_date():
+    assert cache_warmer.disaster_query("Sudan: Floods - Jul 2024") == "Sudan: Floods"
+    assert cache_warmer.disaster_query("Gaza: Hostilities - Oct 2023") == "Gaza: Hostilities"
+    assert reliefweb.query_params(
+        cache_warmer.disaster_query("Sudan: Floods - Jul 2024")
+    ) == reliefweb.query_params("Sudan floods")
+
+
+def test_warmed_query_is_a_cache_hit(listed):
+    calls, by_id = listed
+    cache_warmer.warm_disaster({"id": 51234, "name": "Sudan: Floods - Jul 2024"})
+    assert [kwargs["disaster_id"] for kwargs in by_id] == [51234]
+    assert "jul" not in calls[0]["query"]["value"]
+    hits = response_cache.stats()["hits"]
+
+    # What a user asking about the disaster sends.
+    warmed = reliefweb.get_query_data("Sudan floods")
+    assert asyncio.run(reliefweb_async.aget_query_data("floods in Sudan")) == warmed
+    assert len(calls) == 1
+    assert response_cache.stats()["hits"] == hits + 2
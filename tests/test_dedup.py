@@ -0,0 +1,48 @@
+import json
+import threading
+
+import dedup
+from dedup import SignatureIndex, collapse_duplicates
+
+BODY = "Heavy rains caused flooding across the northern provinces, displacing thousands of families."
+
+
+def test_cluster_urls_survive_reload(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = SignatureIndex(path)
+    cluster = index.add("1", dedup.simhash(BODY), "https://a.example/1")
+    assert index.add("2", dedup.simhash(BODY), "https://b.example/2") == cluster
+    index.save()
+
+    reloaded = SignatureIndex(path)
+    assert reloaded.cluster_urls(cluster) == ["https://a.example/1", "https://b.example/2"]
+
+
+def test_collapse_saves_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "SAVE_EVERY", 3)
+    path = tmp_path / "index.json"
+    index = SignatureIndex(str(path))
+    records = [{"id": str(i), "url": f"https://a.example/{i}", "body": BODY} for i in range(2)]
+    assert len(collapse_duplicates(records, index)) == 1
+    assert not path.exists()
+
+    collapse_duplicates([{"id": "3", "url": "https://a.example/3", "body": BODY}], index)
+    assert len(json.loads(path.read_text())["clusters"]) == 3
+
+
+def test_concurrent_saves_leave_a_complete_file(tmp_path):
+    path = tmp_path / "index.json"
+    index = SignatureIndex(str(path))
+
+    def add_and_save(worker):
+        for i in range(20):
+            index.add(f"{worker}-{i}", dedup.simhash(f"{BODY} {worker} {i}"), None)
+            index.save()
+
+    threads = [threading.Thread(target=add_and_save, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(json.loads(path.read_text())["clusters"]) == 80
+    assert list(tmp_path.glob("*.tmp")) == []
@@ -0,0 +1,63 @@
+import os
+
+import impact_figures
+from impact_figures import ImpactStore, extract_figures
+
+
+def _pairs(text):
+    return [(figure["metric"], figure["value"]) for figure in extract_figures(text)]
+
+
+def test_figures_do_not_run_across_clauses():
+    text = "At least 1,200 people have been killed and 3.5 million people affected."
+    assert _pairs(text) == [("deaths", 1200), ("affected", 3_500_000)]
+
+
+def test_verb_before_number():
+    assert _pairs("The earthquake struck at night, killing at least 12 people.") == [
+        ("deaths", 12)
+    ]
+    assert _pairs("The death toll has risen to 85.") == [("deaths", 85)]
+
+
+def test_year_is_not_a_figure():
+    assert _pairs("In 2023 affected areas received aid.") == []
+
+
+def test_numbers_inside_identifiers_are_not_figures():
+    assert _pairs("COVID-19 deaths continue to rise.") == []
+    assert _pairs("H5N1 infections were reported in 3 districts, and 40 people died.") == [
+        ("deaths", 40)
+    ]
+
+
+def _report(report_id, body):
+    return {"id": report_id, "url": f"https://example.org/{report_id}", "body": [body]}
+
+
+def test_store_appends_files_and_keeps_latest_figures(tmp_path, monkeypatch):
+    monkeypatch.setattr(impact_figures, "FLUSH_ROWS", 1000)
+    path = str(tmp_path / "impact")
+    store = ImpactStore(path)
+    store.add([_report(1, "12 people were killed."), _report(2, "300 people displaced.")])
+    store.flush()
+    store.add([_report(1, "15 people were killed.")])
+    store.flush()
+    assert len(os.listdir(path)) == 2
+
+    reloaded = ImpactStore(path)
+    rows = sorted((r["report_id"], r["metric"], r["value"]) for r in reloaded.table.to_pylist())
+    assert rows == [("1", "deaths", 15.0), ("2", "displaced", 300.0)]
+
+    reloaded.compact()
+    assert len(os.listdir(path)) == 1
+    assert ImpactStore(path).table.num_rows == 2
+
+
+def test_store_writes_nothing_until_flush_is_due(tmp_path, monkeypatch):
+    monkeypatch.setattr(impact_figures, "FLUSH_ROWS", 1000)
+    path = tmp_path / "impact"
+    store = ImpactStore(str(path))
+    store.add([_report(1, "12 people were killed.")])
+    assert not path.exists()
+    assert store.aggregate("deaths", by=["metric"]).column("value").to_pylist() == [12.0]
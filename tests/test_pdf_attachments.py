@@ -0,0 +1,47 @@
+import contextlib
+
+import httpx
+import pytest
+
+import fetch_scheduler
+import pdf_attachments
+
+
+class FailingStream:
+    def __init__(self, chunks, error):
+        self.status_code = 200
+        self.chunks = chunks
+        self.error = error
+
+    def iter_bytes(self, size):
+        yield from self.chunks
+        raise self.error
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        httpx.ConnectError("connection refused"),
+        httpx.ReadTimeout("timed out"),
+        fetch_scheduler.FetchDeadlineExceeded("bulk fetch deadline exceeded while queued"),
+    ],
+)
+def test_failed_download_gives_no_text(monkeypatch, error):
+    @contextlib.contextmanager
+    def stream(method, url, **kwargs):
+        raise error
+        yield
+
+    monkeypatch.setattr(fetch_scheduler, "stream", stream)
+    assert pdf_attachments.get_pdf_text("https://example.org/report.pdf") == []
+
+
+def test_download_cut_short_removes_its_file(monkeypatch, tmp_path):
+    @contextlib.contextmanager
+    def stream(method, url, **kwargs):
+        yield FailingStream([b"%PDF-1.7"], httpx.ReadError("connection reset"))
+
+    monkeypatch.setattr(fetch_scheduler, "stream", stream)
+    monkeypatch.setattr(pdf_attachments.tempfile, "tempdir", str(tmp_path))
+    assert pdf_attachments.download_pdf("https://example.org/report.pdf") == (None, None)
+    assert list(tmp_path.iterdir()) == []
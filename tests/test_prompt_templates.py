@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+# The registry is built at import; keep its bytecode cache out of the working tree.
+os.environ.setdefault("TEMPLATE_BYTECODE_CACHE", tempfile.mkdtemp())
+
+import pytest
+
+from prompt_templates import render_messages
+
+VARIABLES = {
+    "summarize_basic": {"text": "Floods displaced 1,200 people."},
+    "summarize_cod": {"text": "Floods displaced 1,200 people."},
+    "groundedness_check": {"context": "Floods in Sudan.", "answer": "Sudan has floods."},
+    "extract_entities": {"text": "Floods in Sudan"},
+    "extract_query_from_question": {
+        "question": "What about Chad?",
+        "chat_history": [{"inputs": {"question": "Floods in Sudan?"}, "outputs": {"answer": "Yes."}}],
+        "history_summary": "",
+    },
+    "respones": {"question": "Floods in Sudan?", "reliefweb_data": "[]"},
+}
+
+
+# create_Reliefweb_query is system-only; pipeline.create_query appends the user turn.
+@pytest.mark.parametrize("name", sorted(VARIABLES))
+def test_prompt_ends_with_a_user_turn(name):
+    # Mistral rejects a conversation whose last message is a system message.
+    messages = render_messages(name, **VARIABLES[name])
+    assert messages[-1][0] == "user"
+    assert messages[-1][1].strip()
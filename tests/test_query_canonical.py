@@ -0,0 +1,25 @@
+from query_canonical import canonicalize_query, ranking_keyword
+
+
+def test_name_words_are_kept():
+    canonical = canonicalize_query("Papua New Guinea landslide")
+    assert canonical["keyword"] == "guinea new papua"
+    assert canonical["disaster_type"] == "Land Slide"
+
+
+def test_who_is_not_a_stop_word():
+    assert canonicalize_query("WHO cholera")["keyword"] == "cholera who"
+
+
+def test_year_and_type_only_query_has_no_keyword():
+    assert canonicalize_query("floods 2024") == {
+        "keyword": "",
+        "date_from": "2024-01-01",
+        "date_to": "2024-12-31T23:59:59+00:00",
+        "disaster_type": "Flood",
+    }
+
+
+def test_ranking_keeps_words_moved_to_filters():
+    assert ranking_keyword("latest floods in Sudan 2024") == "2024 floods sudan"
+    assert ranking_keyword("DRC cholera") == ranking_keyword("cholera Democratic Republic of the Congo")
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+# reliefweb needs the promptflow tool decorator.
+pytest.importorskip("promptflow")
+
+import http_client  # noqa: E402
+import ranked_retrieval  # noqa: E402
+import reliefweb  # noqa: E402
+import reliefweb_async  # noqa: E402
+import response_cache  # noqa: E402
+
+REPORTS = [
+    {
+        "id": i,
+        "title": f"Sudan floods situation report {i}",
+        "url": f"https://reliefweb.example/report/{i}",
+        "date": {"created": f"2024-0{i + 1}-01T00:00:00+00:00"},
+        "format": [{"name": "Situation Report"}],
+    }
+    for i in range(6)
+]
+
+
+@pytest.fixture
+def site(monkeypatch):
+    scrapes = []
+
+    def handler(request):
+        if request.url.path.endswith("/reports"):
+            assert "body" not in json.loads(request.content)["fields"]["include"]
+            data = [{"fields": dict(report)} for report in REPORTS]
+            return httpx.Response(200, json={"totalCount": len(data), "data": data})
+        scrapes.append(threading.current_thread())
+        report_id = request.url.path.rsplit("/", 1)[1]
+        return httpx.Response(200, text=f"<p>Report {report_id} {'text ' * int(report_id)}</p>")
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(http_client, "_client", httpx.Client(transport=transport))
+    async_client = httpx.AsyncClient(transport=transport)
+    monkeypatch.setattr(reliefweb_async, "get_async_client", lambda: async_client)
+    monkeypatch.setattr(reliefweb, "STRIP_BOILERPLATE", False)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_TTL_SECONDS", 0)
+    return scrapes
+
+
+def test_async_ranked_matches_sync_and_scrapes_on_the_loop(site):
+    expected = ranked_retrieval.get_rweb_ranked_data(keyword="sudan floods", top_k=3)
+    site.clear()
+
+    result = asyncio.run(reliefweb_async.aget_rweb_ranked_data(keyword="sudan floods", top_k=3))
+    assert result == expected
+    assert [report["id"] for report in json.loads(result)] == [5, 4, 3]
+    assert site == [threading.main_thread()] * 3